@@ -1,10 +1,12 @@
 # add_admin.py
 
-from application import app, db
+from application import create_app, db
 from application.flicket.models.flicket_user import FlicketUser, FlicketGroup
 from application.flicket.scripts.hash_password import hash_password
 from datetime import datetime
 
+app = create_app(blueprints=[])
+
 with app.app_context():
     admin_username = "Admin User"
     admin_name = "Admin Name"
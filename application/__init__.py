@@ -16,178 +16,144 @@
 
 """
 
+import importlib
+import os
+
 from flask import abort
 from flask import Flask
 from flask import g
 from flask import request
+from flask.signals import appcontext_pushed
 from flask_login import LoginManager
 from flask_mail import Mail
-from flask_pagedown import PageDown
 from flask_sqlalchemy import SQLAlchemy
-from flask_babel import Babel
-from flaskext.markdown import Markdown
-from flask_migrate import Migrate
+from sqlalchemy.exc import SQLAlchemyError
 
-from application.flicket_admin.views import admin_bp
-from application.flicket_api.views import bp_api
-from application.flicket_errors import bp_errors
-from application.flicket.views import flicket_bp
-from application.flicket.scripts.jinja2_functions import now_year
+from application.flicket.scripts.jinja2_functions import markdown, now_year
 
 __version__ = '0.3.4'
 
+# the application and its extensions are created here, unconfigured, so that models and views can import them. They
+# are set up by create_app. flask_migrate (alembic) and flask_babel are imported there when needed.
 app = Flask(__name__)
-app.config.from_object('config.BaseConfiguration')
-app.config.update(TEMPLATES_AUTO_RELOAD=True)
-
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-mail = Mail(app)
-pagedown = PageDown(app)
-
-
-Markdown(app)
+db = SQLAlchemy()
+mail = Mail()
+lm = LoginManager()
 
-# import jinja function
-app.jinja_env.globals.update(now_year=now_year)
+# blueprint name -> (module defining the blueprint, blueprint attribute, modules holding its views). The view modules
+# are only imported for the blueprints create_app is asked to register.
+blueprint_modules = {
+    'admin': ('application.flicket_admin.views', 'admin_bp', [
+        'application.flicket_admin.views.view_admin',
+        'application.flicket_admin.views.view_config',
+        'application.flicket_admin.views.view_email_test',
+        'application.flicket_admin.views.view_query_stats',
+        'application.flicket_admin.views.view_metrics',
+        'application.flicket_admin.views.admin_departments',
+    ]),
+    'flicket': ('application.flicket.views', 'flicket_bp', [
+        'application.flicket.views.assign',
+        'application.flicket.views.categories',
+        'application.flicket.views.edit_status',
+        'application.flicket.views.claim',
+        'application.flicket.views.create',
+        'application.flicket.views.delete',
+        'application.flicket.views.departments',
+        'application.flicket.views.edit',
+        'application.flicket.views.history',
+        'application.flicket.views.index',
+        'application.flicket.views.login',
+        'application.flicket.views.help',
+        'application.flicket.views.tickets',
+        'application.flicket.views.release',
+        'application.flicket.views.render_uploads',
+        'application.flicket.views.subscribe',
+        'application.flicket.views.user_edit',
+        'application.flicket.views.users',
+        'application.flicket.views.view_ticket',
+        'application.flicket.views.department_category',
+    ]),
+    'signup': ('application.flicket.views.signup', 'signup_bp', []),
+    'api': ('application.flicket_api.views', 'bp_api', [
+        'application.flicket_api.views.actions',
+        'application.flicket_api.views.categories',
+        'application.flicket_api.views.departments',
+        'application.flicket_api.views.histories',
+        'application.flicket_api.views.posts',
+        'application.flicket_api.views.priorities',
+        'application.flicket_api.views.status',
+        'application.flicket_api.views.subscriptions',
+        'application.flicket_api.views.tickets',
+        'application.flicket_api.views.tokens',
+        'application.flicket_api.views.uploads',
+        'application.flicket_api.views.users',
+        'application.flicket_api.views.department_categories',
+    ]),
+    'errors': ('application.flicket_errors', 'bp_errors', [
+        'application.flicket_errors.handlers',
+    ]),
+}
+
+# blueprints rendering html pages, they need the markdown filters.
+html_blueprints = ('admin', 'flicket', 'signup')
+
+# names of the blueprints registered by create_app, and the configuration it was given. None until it is called.
+registered_blueprints = None
+registered_config = None
 
-# import models so alembic can see them
-# noinspection PyPep8
-from application.flicket.models import flicket_user, flicket_models
-# noinspection PyPep8
-from application.flicket_admin.models import flicket_config
 
-# Load database configuration into app config
 def load_db_config():
-    """Load configuration from database into app config"""
+    """
+    Loads the settings stored in the database into app.config. Called when the first app context is pushed (the
+    first request or cli command) rather than on import. Until the settings have been found it is tried again on
+    every app context, for example while "flask db upgrade" creates the tables.
+    :return: True if the settings were loaded.
+    """
+    from application.flicket_admin.models.flicket_config import FlicketConfig
+
     try:
-        from application.flicket_admin.models.flicket_config import FlicketConfig
         config = FlicketConfig.query.first()
-        if config:
-            app.config.update(
-                MAIL_SERVER=config.mail_server,
-                MAIL_PORT=config.mail_port,
-                MAIL_USE_TLS=config.mail_use_tls,
-                MAIL_USE_SSL=config.mail_use_ssl,
-                MAIL_DEBUG=config.mail_debug,
-                MAIL_USERNAME=config.mail_username,
-                MAIL_PASSWORD=config.mail_password,
-                MAIL_DEFAULT_SENDER=config.mail_default_sender,
-                MAIL_MAX_EMAILS=config.mail_max_emails,
-                MAIL_SUPPRESS_SEND=config.mail_suppress_send,
-                MAIL_ASCII_ATTACHMENTS=config.mail_ascii_attachments,
-                base_url=config.base_url,
-                application_title=config.application_title,
-                posts_per_page=config.posts_per_page,
-                allowed_extensions=config.allowed_extensions.split(', ') if config.allowed_extensions else [],
-                ticket_upload_folder=config.ticket_upload_folder,
-                avatar_upload_folder=config.avatar_upload_folder,
-                use_auth_domain=config.use_auth_domain,
-                auth_domain=config.auth_domain,
-                csv_dump_limit=config.csv_dump_limit,
-                change_category=config.change_category,
-                change_category_only_admin_or_super_user=config.change_category_only_admin_or_super_user,
-            )
-            # Reinitialize mail with database config
-            mail.init_app(app)
-    except Exception as e:
-        # If database isn't set up yet, use default config
-        pass
-
-lm = LoginManager()
-lm.init_app(app)
-lm.login_view = 'flicket_bp.login'
-
-# noinspection PyPep8
-from .flicket_admin.views import view_admin
-# noinspection PyPep8
-from .flicket_admin.views import view_config
-# noinspection PyPep8
-from .flicket_admin.views import view_email_test
-# noinspection PyPep8
-from .flicket_admin.views import admin_departments
-
-# noinspection PyPep8
-from .flicket.views import assign
-# noinspection PyPep8
-from .flicket.views import categories
-# noinspection PyPep8
-from .flicket.views import edit_status
-# noinspection PyPep8
-from .flicket.views import claim
-# noinspection PyPep8
-from .flicket.views import create
-# noinspection PyPep8
-from .flicket.views import delete
-# noinspection PyPep8
-from .flicket.views import departments
-# noinspection PyPep8
-from .flicket.views import edit
-# noinspection PyPep8
-from .flicket.views import history
-# noinspection PyPep8
-from .flicket.views import index
-# noinspection PyPep8
-from .flicket.views import login
-# noinspection PyPep8
-from .flicket.views import help
-# noinspection PyPep8
-from .flicket.views import tickets
-# noinspection PyPep8
-from .flicket.views import release
-# noinspection PyPep8
-from .flicket.views import render_uploads
-# noinspection PyPep8
-from .flicket.views import subscribe
-# noinspection PyPep8
-from .flicket.views import user_edit
-# noinspection PyPep8
-from .flicket.views import users
-# noinspection PyPep8
-from .flicket.views import view_ticket
-# noinspection PyPep8
-from .flicket.views import department_category
-
-# noinspection PyPep8
-from .flicket_api.views import actions
-# noinspection PyPep8
-from .flicket_api.views import categories
-# noinspection PyPep8
-from .flicket_api.views import departments
-# noinspection PyPep8
-from .flicket_api.views import histories
-# noinspection PyPep8
-from .flicket_api.views import posts
-# noinspection PyPep8
-from .flicket_api.views import priorities
-# noinspection PyPep8
-from .flicket_api.views import status
-# noinspection PyPep8
-from .flicket_api.views import subscriptions
-# noinspection PyPep8
-from .flicket_api.views import tickets
-# noinspection PyPep8
-from .flicket_api.views import tokens
-# noinspection PyPep8
-from .flicket_api.views import uploads
-# noinspection PyPep8
-from .flicket_api.views import users
-from .flicket_api.views import department_categories
-
-# noinspection PyPep8
-from .flicket_errors import handlers
-
-app.register_blueprint(admin_bp)
-app.register_blueprint(flicket_bp)
-from application.flicket.views.signup import signup_bp
-app.register_blueprint(signup_bp)
-app.register_blueprint(bp_api)
-app.register_blueprint(bp_errors)
-
-
-# prints url routes for debugging
-# for rule in app.url_map.iter_rules():
-#    print(rule)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        app.logger.debug('Settings not loaded from the database: %s', e)
+        return False
+
+    if config is None:
+        return False
+
+    app.config.update(
+        MAIL_SERVER=config.mail_server,
+        MAIL_PORT=config.mail_port,
+        MAIL_USE_TLS=config.mail_use_tls,
+        MAIL_USE_SSL=config.mail_use_ssl,
+        MAIL_DEBUG=config.mail_debug,
+        MAIL_USERNAME=config.mail_username,
+        MAIL_PASSWORD=config.mail_password,
+        MAIL_DEFAULT_SENDER=config.mail_default_sender,
+        MAIL_MAX_EMAILS=config.mail_max_emails,
+        MAIL_SUPPRESS_SEND=config.mail_suppress_send,
+        MAIL_ASCII_ATTACHMENTS=config.mail_ascii_attachments,
+        base_url=config.base_url,
+        application_title=config.application_title,
+        posts_per_page=config.posts_per_page,
+        allowed_extensions=config.allowed_extensions.split(', ') if config.allowed_extensions else [],
+        ticket_upload_folder=config.ticket_upload_folder,
+        avatar_upload_folder=config.avatar_upload_folder,
+        use_auth_domain=config.use_auth_domain,
+        auth_domain=config.auth_domain,
+        csv_dump_limit=config.csv_dump_limit,
+        change_category=config.change_category,
+        change_category_only_admin_or_super_user=config.change_category_only_admin_or_super_user,
+    )
+    # Reinitialize mail with database config
+    mail.init_app(app)
+
+    return True
+
+
+def _load_db_config_once(sender, **kwargs):
+    if load_db_config():
+        appcontext_pushed.disconnect(_load_db_config_once, app)
 
 
 def get_locale():
@@ -201,10 +167,6 @@ def get_locale():
     return request.accept_languages.best_match(app.config['SUPPORTED_LANGUAGES'].keys())
 
 
-babel = Babel(app)
-babel.init_app(app, locale_selector=get_locale)
-
-@app.url_defaults
 def set_language_code(endpoint, values):
     if 'lang_code' in values or not g.get('lang_code', None):
         return
@@ -212,23 +174,119 @@ def set_language_code(endpoint, values):
         values['lang_code'] = g.lang_code
 
 
-@app.url_value_preprocessor
 def get_lang_code(endpoint, values):
     if values is not None:
         g.lang_code = values.pop('lang_code', None)
 
 
-@app.before_request
 def ensure_lang_support():
     lang_code = g.get('lang_code', None)
     if lang_code and lang_code not in app.config['SUPPORTED_LANGUAGES'].keys():
         return abort(404)
 
 
-from application.commands import register_clicks
-
-register_clicks(app)
-
-# Load database configuration after all models are imported
-with app.app_context():
-    load_db_config()
+def refresh_flicket_config():
+    from application.flicket.scripts.flicket_config import set_flicket_config
+    set_flicket_config()
+
+
+def create_app(config='config.BaseConfiguration', blueprints=None):
+    """
+    Sets up and returns the application.
+
+    Only the view modules of the requested blueprints are imported, so a worker serving the api alone, or a cli
+    command, does not load the web pages. The settings stored in the database are read when the first app context is
+    pushed, not here.
+
+        flask --app "application:create_app(blueprints=['api', 'errors'])" run
+        flask --app "application:create_app(blueprints=[])" export-users-to-json
+
+    This is not a full factory: models and views are bound to the module level app, so there is one application per
+    process and it can only be set up once. A later call with the same config and blueprints returns it; a call
+    with another config or other blueprints raises RuntimeError rather than returning an application set up
+    differently. Run differently configured applications in separate processes.
+
+    :param config: configuration object, or its import path.
+    :param blueprints: names from blueprint_modules, None for all of them. The web pages need admin, flicket and
+        signup.
+    :return: Flask application.
+    """
+    global registered_blueprints, registered_config
+
+    if blueprints is None:
+        blueprints = list(blueprint_modules)
+    unknown = set(blueprints) - set(blueprint_modules)
+    if unknown:
+        raise ValueError('Unknown blueprints: {}'.format(', '.join(sorted(unknown))))
+
+    if registered_blueprints is not None:
+        if config != registered_config or sorted(blueprints) != sorted(registered_blueprints):
+            raise RuntimeError('The application has already been set up with config {!r} and blueprints {}; it can '
+                               'not be set up again with config {!r} and blueprints {}.'.format(
+                                   registered_config, sorted(registered_blueprints), config, sorted(blueprints)))
+        return app
+
+    app.config.from_object(config)
+    app.config.update(TEMPLATES_AUTO_RELOAD=True)
+
+    db.app = app
+    db.init_app(app)
+    # the "flask db" commands need flask_migrate, which imports alembic. The flask cli sets FLASK_RUN_FROM_CLI before
+    # loading the application; workers and scripts do not load it.
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # time the sql statements of each request, see application/flicket/scripts/query_stats.py
+    from application.flicket.scripts.query_stats import init_query_stats
+    init_query_stats(app)
+    # noinspection PyUnresolvedReferences
+    from application.flicket.scripts import slow_query_log
+    # request, database, email, upload and cache metrics for /metrics, see application/flicket/scripts/metrics.py
+    from application.flicket.scripts.metrics import init_metrics
+    init_metrics(app)
+
+    mail.init_app(app)
+
+    if set(blueprints) & set(html_blueprints):
+        from flask_pagedown import PageDown
+        PageDown(app)
+
+    # import jinja function
+    app.jinja_env.globals.update(now_year=now_year)
+    app.jinja_env.filters['markdown'] = markdown
+
+    # import models so alembic can see them
+    # noinspection PyUnresolvedReferences
+    from application.flicket.models import flicket_user, flicket_models
+    # noinspection PyUnresolvedReferences
+    from application.flicket_admin.models import flicket_config
+
+    lm.init_app(app)
+    lm.login_view = 'flicket_bp.login'
+
+    # settings from the database: all of them once, then the cached copy before each request.
+    appcontext_pushed.connect(_load_db_config_once, app)
+    app.before_request(refresh_flicket_config)
+
+    for name in blueprint_modules:
+        if name not in blueprints:
+            continue
+        module_name, blueprint, view_modules = blueprint_modules[name]
+        for view_module in view_modules:
+            importlib.import_module(view_module)
+        app.register_blueprint(getattr(importlib.import_module(module_name), blueprint))
+
+    from flask_babel import Babel
+    Babel(app, locale_selector=get_locale)
+    app.url_defaults(set_language_code)
+    app.url_value_preprocessor(get_lang_code)
+    app.before_request(ensure_lang_support)
+
+    from application.commands import register_clicks
+    register_clicks(app)
+
+    registered_blueprints = list(blueprints)
+    registered_config = config
+
+    return app
@@ -7,20 +7,30 @@ from getpass import getpass
 import os
 import time
 
-from sqlalchemy import or_
+import click
+from sqlalchemy import bindparam, or_
 
 from application import db, app
 from application.flicket_admin.models.flicket_config import FlicketConfig
 from application.flicket.models.flicket_models import FlicketCategory
 from application.flicket.models.flicket_models import FlicketDepartment
+from application.flicket.models.flicket_models import FlicketEmailOutbox
+from application.flicket.models.flicket_models import FlicketPost
 from application.flicket.models.flicket_models import FlicketPriority
 from application.flicket.models.flicket_models import FlicketStatus
 from application.flicket.models.flicket_models import FlicketTicket
 from application.flicket.models.flicket_user import FlicketGroup
 from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.email import FlicketMail
+from application.flicket.scripts.email_outbox import email_worker, queue_depth
 from application.flicket.scripts.flicket_user_details import FlicketUserDetails
 from application.flicket.scripts.hash_password import hash_password
+from application.flicket.scripts.index_advisor import index_report
+from application.flicket.scripts.markdown_render import render_markdown
+from application.flicket.scripts.slow_query_log import read_slow_queries, summarize_slow_queries
+from application.flicket.scripts.ticket_search import rebuild_search_index
+from application.flicket.scripts.ticket_stats import check_ticket_stats, rebuild_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 admin = 'admin'
 
@@ -255,6 +265,7 @@ def set_email_config(silent=False):
     if query.mail_server is None:
         query.mail_debug = True
         query.mail_suppress_send = True
+        query.bump_version()
         db.session.commit()
         if not silent:
             print(
@@ -262,6 +273,39 @@ def set_email_config(silent=False):
                 'Flicket.')
 
 
+def update_ticket_post_totals(check_only=False, silent=False):
+    """
+    Compares each ticket's stored reply_count and posts_hours with the totals counted from flicket_post and
+    corrects any that differ.
+
+    :param check_only: report the differences without updating.
+    :param silent:
+    :return: the number of tickets whose totals differed.
+    """
+
+    totals = {ticket_id: (replies, hours) for ticket_id, replies, hours in FlicketTicket.post_totals()}
+
+    # only the columns needed are read, tickets are not loaded as objects.
+    stored = db.session.query(FlicketTicket.id, FlicketTicket.reply_count, FlicketTicket.posts_hours).all()
+
+    differences = 0
+    for ticket_id, reply_count, posts_hours in stored:
+        replies, hours = totals.get(ticket_id, (0, 0))
+        if (reply_count or 0) != replies or (posts_hours or 0) != hours:
+            differences += 1
+            if not silent:
+                print('Ticket {} has stored totals of {} replies / {} hours and counted totals of {} replies / {} '
+                      'hours.'.format(ticket_id, reply_count, posts_hours, replies, hours))
+            if not check_only:
+                FlicketTicket.query.filter_by(id=ticket_id).update({'reply_count': replies, 'posts_hours': hours},
+                                                                   synchronize_session=False)
+
+    if not check_only:
+        db.session.commit()
+
+    return differences
+
+
 def register_clicks(app):
     """
 
@@ -399,20 +443,146 @@ def register_clicks(app):
         else:
             print('Updates were made.')
 
+    @app.cli.command('update-ticket-post-totals',
+                     help='Recount the stored reply count and post hours of every ticket. Use when upgrading.')
+    @click.option('--check', is_flag=True, help='Only report tickets whose stored totals are wrong.')
+    def update_ticket_post_totals_command(check):
+        differences = update_ticket_post_totals(check_only=check)
+        if differences == 0:
+            print('No updates were required.')
+        elif check:
+            print('{} tickets have incorrect totals.'.format(differences))
+            exit(1)
+        else:
+            print('Updates were made to {} tickets.'.format(differences))
+
+    @app.cli.command('index-advisor', help='Run EXPLAIN on the hot ticket queries and report full table scans.')
+    @click.option('--verbose', is_flag=True, help='Print the full query plans.')
+    def index_advisor(verbose):
+        scanned = False
+        for name, plan, tables in index_report():
+            if tables:
+                scanned = True
+                print('{}: full scan of {}'.format(name, ', '.join(tables)))
+            else:
+                print('{}: ok'.format(name))
+            if verbose:
+                for row in plan:
+                    print('    {}'.format(' | '.join(str(v) for v in row.values())))
+        if scanned:
+            print('Full table scans found. Check the indexes are created ("flask db upgrade").')
+            exit(1)
+
+    @app.cli.command('rebuild-search-index', help='Create and fill the full text search index of tickets.')
+    def rebuild_search_index_command():
+        count = rebuild_search_index()
+        if count is None:
+            print('Full text search is not supported by the {} database. Searches will use LIKE.'.format(
+                db.engine.dialect.name))
+        else:
+            print('{} tickets indexed.'.format(count))
+
+    @app.cli.command('render-content-html', help='Store the rendered markdown of tickets and posts written before it '
+                                                 'was stored.')
+    @click.option('--all', 'render_all', is_flag=True, help='Render every ticket and post again.')
+    def render_content_html_command(render_all):
+        for model in (FlicketTicket, FlicketPost):
+            table = model.__table__
+            query = db.session.query(table.c.id, table.c.content)
+            if not render_all:
+                query = query.filter(table.c.content_html.is_(None), table.c.content.isnot(None))
+            rows = [{'row_id': row_id, 'html': str(render_markdown(content, cache=False))}
+                    for row_id, content in query]
+            if rows:
+                db.session.execute(table.update().where(table.c.id == bindparam('row_id')).
+                                   values(content_html=bindparam('html')), rows)
+            db.session.commit()
+            print('{} rows of {} rendered.'.format(len(rows), table.name))
+
+    @app.cli.command('rebuild-stats', help='Recount the dashboard ticket statistics from the tickets.')
+    @click.option('--check', is_flag=True, help='Only report statistics that differ from the tickets.')
+    def rebuild_stats_command(check):
+        differences = check_ticket_stats()
+        for key, stored, counted in differences:
+            print('department {}, category {}, status {}, priority {}: stored {} tickets / {} hours, counted {} '
+                  'tickets / {} hours.'.format(*key, *stored, *counted))
+        if check:
+            if differences:
+                print('{} statistics are incorrect.'.format(len(differences)))
+                exit(1)
+            print('No updates were required.')
+        else:
+            print('{} statistics rows written.'.format(rebuild_ticket_stats()))
+
+    @app.cli.command('slow-queries', help='Summarise the slow query log by statement shape.')
+    @click.option('--limit', default=20, help='Number of statement shapes shown.')
+    @click.option('--plans', is_flag=True, help='Print the last query plan of each shape.')
+    @click.option('--log', 'path', default=None, help='Log file, defaults to SLOW_QUERY_LOG.')
+    def slow_queries(limit, plans, path):
+        path = path or app.config.get('SLOW_QUERY_LOG')
+        summary = summarize_slow_queries(read_slow_queries(path))
+        if not summary:
+            print('No slow queries logged in {}.'.format(path))
+            return
+        for data in summary[:limit]:
+            print('{count} x, total {total:.3f}s, mean {mean:.3f}s, max {max:.3f}s, last {last}'.format(**data))
+            print('    endpoints: {}'.format(', '.join(sorted(data['endpoints'])) or '-'))
+            print('    {}'.format(data['shape']))
+            if plans and data['plan']:
+                for row in data['plan']:
+                    print('        {}'.format(' | '.join(str(v) for v in row.values())))
+
     @app.cli.command('email-outstanding-tickets',
                      help='Update all users total post count. Use when upgrading from 1.4.')
     def email_outstanding_tickets():
-        # find all users
-        users = FlicketUser.query.all()
-        for user in users:
-            # that have created a ticket or have a ticket assigned to them.
-            tickets = FlicketTicket.query.filter(or_(
-                FlicketTicket.user == user,
-                FlicketTicket.assigned == user,
-            )).filter(
-                FlicketTicket.status_id != 2)
-
-            if tickets.count() > 0:
-                mail = FlicketMail()
-                mail.tickets_not_closed(user, tickets)
-                time.sleep(10)
+        with unit_of_work():
+            # find all users
+            users = FlicketUser.query.all()
+            for user in users:
+                # that have created a ticket or have a ticket assigned to them.
+                tickets = FlicketTicket.query.filter(or_(
+                    FlicketTicket.user == user,
+                    FlicketTicket.assigned == user,
+                )).filter(
+                    FlicketTicket.status_id != 2)
+
+                if tickets.count() > 0:
+                    mail = FlicketMail()
+                    mail.tickets_not_closed(user, tickets)
+
+        print('Emails queued, they are sent by the web processes or "flask email-worker".')
+
+    @app.cli.command('email-worker', help='Send the emails queued in the outbox.')
+    @click.option('--threads', type=int, default=None,
+                  help='Number of sending threads, defaults to EMAIL_WORKER_THREADS (at least 1).')
+    @click.option('--once', is_flag=True, help='Send the emails that are due and exit.')
+    @click.option('--retry-failed', is_flag=True, help='Queue the emails marked failed again first.')
+    def email_worker_command(threads, once, retry_failed):
+        if retry_failed:
+            count = FlicketEmailOutbox.query.filter_by(status='failed'). \
+                update({'status': 'pending', 'attempts': 0, 'next_attempt': datetime.datetime.now()},
+                       synchronize_session=False)
+            db.session.commit()
+            print('{} failed emails queued again.'.format(count))
+
+        if once:
+            handled = 0
+            while True:
+                claimed = email_worker.send_due()
+                if not claimed:
+                    break
+                handled += claimed
+            depth = queue_depth()
+            print('{} emails sent or rescheduled, {} pending, {} failed.'.format(handled, depth.get('pending', 0),
+                                                                                 depth.get('failed', 0)))
+            return
+
+        threads = threads or app.config.get('EMAIL_WORKER_THREADS') or 1
+        email_worker.start(threads)
+        print('Sending the outbox with {} threads, press Ctrl+C to stop.'.format(threads))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print('Stopping after the current batch.')
+            email_worker.stop()
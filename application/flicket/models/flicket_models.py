@@ -3,15 +3,20 @@
 #
 # Flicket - copyright Paul Bourne: evereux@gmail.com
 
+from collections import defaultdict
 import datetime
-from html import escape
 
 from flask import url_for, g
-from sqlalchemy import select, join, func
+from markupsafe import Markup
+from sqlalchemy import event, select, join, func, inspect
+from sqlalchemy.orm import object_session
+from sqlalchemy.sql import ClauseElement
 
 from application import app, db
 from application.flicket.models import Base
-from application.flicket.models.flicket_user import FlicketUser
+from application.flicket.models.flicket_user import FlicketUser, user_field_size
+from application.flicket.scripts.markdown_render import render_markdown
+from application.flicket.scripts.ticket_pagination import cursor_sorts
 from application.flicket_api.scripts.paginated_api import PaginatedAPIMixin
 
 # define field sizes. max are used for forms and database. min just for forms.
@@ -159,12 +164,47 @@ class FlicketPriority(PaginatedAPIMixin, Base):
         return "<FlicketPriority: id={}, priority={}>".format(self.id, self.priority)
 
 
-class FlicketTicket(PaginatedAPIMixin, Base):
+class RenderedContentMixin:
+    """
+    For models whose markdown content is stored rendered in content_html.
+    """
+
+    @property
+    def html(self):
+        """
+        The rendered content: the stored html, or for rows written before content_html existed the content rendered
+        through the markdown cache.
+        :return: Markup
+        """
+        if self.content_html is not None:
+            return Markup(self.content_html)
+
+        return render_markdown(self.content)
+
+
+class FlicketTicket(RenderedContentMixin, PaginatedAPIMixin, Base):
     __tablename__ = 'flicket_topic'
+    __table_args__ = (
+        # open tickets by priority (index page) and the status / priority filters of the ticket lists.
+        db.Index('ix_flicket_topic_status_priority', 'status_id', 'ticket_priority_id', 'id'),
+        # "my tickets" and the started / assigned filters.
+        db.Index('ix_flicket_topic_started_status', 'started_id', 'status_id'),
+        db.Index('ix_flicket_topic_assigned_status', 'assigned_id', 'status_id'),
+        db.Index('ix_flicket_topic_category', 'category_id'),
+        # list sorts, ending on id so page and cursor pagination can walk the index.
+        db.Index('ix_flicket_topic_priority', 'ticket_priority_id', 'id'),
+        db.Index('ix_flicket_topic_date_added', 'date_added', 'id'),
+        db.Index('ix_flicket_topic_last_updated', 'last_updated', 'id'),
+    )
+
+    # sorts that can also be paged with a cursor, see to_cursor_collection_dict.
+    cursor_sorts = cursor_sorts
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(field_size['title_max_length']), index=True)
     content = db.Column(db.String(field_size['content_max_length']))
+    # content rendered from markdown, written whenever content is set.
+    content_html = db.Column(db.Text)
 
     started_id = db.Column(db.Integer, db.ForeignKey(FlicketUser.id))
     user = db.relationship(FlicketUser, foreign_keys='FlicketTicket.started_id')
@@ -191,7 +231,15 @@ class FlicketTicket(PaginatedAPIMixin, Base):
 
     hours = db.Column(db.Numeric(10, 2), server_default='0')
 
+    # totals of the ticket's posts, kept up to date by update_post_totals so that ticket lists and sorts do not
+    # have to count or sum flicket_post. Rebuilt by the "update-ticket-post-totals" command.
+    reply_count = db.Column(db.Integer, server_default='0')
+    posts_hours = db.Column(db.Numeric(10, 2), server_default='0')
+
     last_updated = db.Column(db.DateTime(), server_default=datetime.datetime.now().strftime('%Y-%m-%d'))
+    # incremented every time the row is updated, see bump_ticket_version. Unlike last_updated it tells apart changes
+    # made in the same second.
+    version = db.Column(db.Integer, server_default='0')
 
     # find all the images associated with the topic
     uploads = db.relationship('FlicketUploads',
@@ -212,8 +260,7 @@ class FlicketTicket(PaginatedAPIMixin, Base):
 
     @property
     def num_replies(self):
-        n_replies = FlicketPost.query.filter_by(ticket_id=self.id).count()
-        return n_replies
+        return self.reply_count or 0
 
     @property
     def id_zfill(self):
@@ -298,9 +345,38 @@ class FlicketTicket(PaginatedAPIMixin, Base):
         :return:
         """
 
-        hours = db.session.query(func.sum(FlicketPost.hours)).filter_by(ticket_id=self.id).scalar() or 0
+        return (self.hours or 0) + (self.posts_hours or 0)
 
-        return hours + self.hours
+    def update_post_totals(self, replies=0, hours=0):
+        """
+        Adjusts reply_count and posts_hours when a post is added, edited or deleted. The change is made in sql
+        (reply_count = reply_count + 1) so replies committed at the same time are not lost. Calls made before the
+        ticket is flushed add up.
+        :param int replies: change in the number of posts.
+        :param hours: change in the post hours.
+        :return:
+        """
+        if replies:
+            self._add_to_total('reply_count', replies)
+        if hours:
+            self._add_to_total('posts_hours', hours)
+
+    def _add_to_total(self, name, change):
+        # a change not flushed yet is still an sql expression on the ticket, add onto it rather than replace it.
+        pending = inspect(self).dict.get(name)
+        total = pending if isinstance(pending, ClauseElement) else func.coalesce(getattr(FlicketTicket, name), 0)
+        setattr(self, name, total + change)
+
+    @staticmethod
+    def post_totals():
+        """
+        Returns a query of (ticket_id, reply count, post hours) counted from flicket_post, one row per ticket with
+        posts. Used to rebuild and check the stored totals.
+        :return: query
+        """
+        return db.session.query(FlicketPost.ticket_id,
+                                func.count(FlicketPost.id),
+                                func.coalesce(func.sum(FlicketPost.hours), 0)).group_by(FlicketPost.ticket_id)
 
     def get_subscriber_emails(self):
         """
@@ -339,58 +415,38 @@ class FlicketTicket(PaginatedAPIMixin, Base):
         """
         Returns a filtered query and modified form based on form submission
         :param form:
-        :param kwargs:
+        :param kwargs: filters, see application.flicket.scripts.ticket_query.ticket_filters
         :return:
         """
+        from application.flicket.scripts.ticket_query import ticket_filters
 
-        ticket_query = FlicketTicket.query
+        ticket_query = FlicketTicket.query.filter(*ticket_filters(**kwargs))
 
-        if 'assigned_id' in kwargs:
-            if kwargs['assigned_id']:
-                ticket_query = ticket_query.filter_by(assigned_id=kwargs['assigned_id'])
+        if form:
+            for key, value in kwargs.items():
 
-        if 'created_id' in kwargs:
-            if kwargs['created_id']:
-                ticket_query = ticket_query.filter_by(started_id=kwargs['created_id'])
-
-        for key, value in kwargs.items():
-
-            if key == 'status' and value:
-                ticket_query = ticket_query.filter(FlicketTicket.current_status.has(FlicketStatus.status == value))
-                if form:
+                if key == 'status' and value:
                     status_obj = FlicketStatus.query.filter_by(status=value).first()
                     if status_obj:
                         form.status.data = status_obj.id
 
-            if key == 'category' and value:
-                ticket_query = ticket_query.filter(FlicketTicket.category.has(FlicketCategory.category == value))
-                if form:
-                    form.category.data = FlicketCategory.query.filter_by(category=value).first().id
-
-            if key == 'department' and value:
-                department_filter = FlicketDepartment.query.filter_by(department=value).first()
-                ticket_query = ticket_query.filter(
-                    FlicketTicket.category.has(FlicketCategory.department == department_filter))
-                if form:
-                    form.department.data = department_filter.id
-
-            if key == 'user_id' and value:
-                # ticket_query = ticket_query.filter_by(assigned_id=int(value))
-                ticket_query = ticket_query.filter(
-                    (FlicketTicket.assigned_id == int(value)) | (FlicketTicket.started_id == int(value)))
-                user = FlicketUser.query.filter_by(id=value).first()
-                if form:
-                    form.username.data = user.username
-
-            if key == 'content' and value:
-                # search the titles
-                if form:
-                    form.content.data = key
-
-                f1 = FlicketTicket.title.ilike('%' + value + '%')
-                f2 = FlicketTicket.content.ilike('%' + value + '%')
-                f3 = FlicketTicket.posts.any(FlicketPost.content.ilike('%' + value + '%'))
-                ticket_query = ticket_query.filter(f1 | f2 | f3)
+                if key == 'category' and value:
+                    category_obj = FlicketCategory.query.filter_by(category=value).first()
+                    if category_obj:
+                        form.category.data = category_obj.id
+
+                if key == 'department' and value:
+                    department_obj = FlicketDepartment.query.filter_by(department=value).first()
+                    if department_obj:
+                        form.department.data = department_obj.id
+
+                if key == 'user_id' and value:
+                    user = FlicketUser.query.filter_by(id=value).first()
+                    if user:
+                        form.username.data = user.username
+
+                if key == 'content' and value:
+                    form.content.data = value
 
         return ticket_query, form
 
@@ -399,81 +455,12 @@ class FlicketTicket(PaginatedAPIMixin, Base):
         """
         Function to return sorted tickets.
         :param ticket_query:
-        :param sort:
+        :param sort: see application.flicket.scripts.ticket_query.ticket_sorts
         :return:
         """
-        if sort == 'priority':
-            ticket_query = ticket_query.order_by(FlicketTicket.ticket_priority_id, FlicketTicket.id)
-        elif sort == 'priority_desc':
-            ticket_query = ticket_query.order_by(FlicketTicket.ticket_priority_id.desc(), FlicketTicket.id)
-
-        elif sort == 'title':
-            ticket_query = ticket_query.order_by(FlicketTicket.title, FlicketTicket.id)
-        elif sort == 'title_desc':
-            ticket_query = ticket_query.order_by(FlicketTicket.title.desc(), FlicketTicket.id)
-
-        elif sort == 'ticketid':
-            ticket_query = ticket_query.order_by(FlicketTicket.id)
-        elif sort == 'ticketid_desc':
-            ticket_query = ticket_query.order_by(FlicketTicket.id.desc())
-
-        elif sort == 'addedby':
-            ticket_query = ticket_query.join(FlicketUser, FlicketTicket.user) \
-                .order_by(FlicketUser.name, FlicketTicket.id)
-        elif sort == 'addedby_desc':
-            ticket_query = ticket_query.join(FlicketUser, FlicketTicket.user) \
-                .order_by(FlicketUser.name.desc(), FlicketTicket.id)
-
-        elif sort == 'addedon':
-            ticket_query = ticket_query.order_by(FlicketTicket.date_added, FlicketTicket.id)
-        elif sort == 'addedon_desc':
-            ticket_query = ticket_query.order_by(FlicketTicket.date_added.desc(), FlicketTicket.id)
-
-        elif sort == 'last_updated':
-            ticket_query = ticket_query.order_by(FlicketTicket.last_updated, FlicketTicket.id)
-        elif sort == 'last_updated_desc':
-            ticket_query = ticket_query.order_by(FlicketTicket.last_updated.desc(), FlicketTicket.id)
-
-        elif sort == 'replies':
-            replies_count = func.count(FlicketPost.id).label('replies_count')
-            ticket_query = ticket_query.outerjoin(FlicketTicket.posts).group_by(FlicketTicket.id) \
-                .order_by(replies_count, FlicketTicket.id)
-        elif sort == 'replies_desc':
-            replies_count = func.count(FlicketPost.id).label('replies_count')
-            ticket_query = ticket_query.outerjoin(FlicketTicket.posts).group_by(FlicketTicket.id) \
-                .order_by(replies_count.desc(), FlicketTicket.id)
-
-        elif sort == 'department_category':
-            ticket_query = ticket_query.join(FlicketCategory, FlicketTicket.category) \
-                .join(FlicketDepartment, FlicketCategory.department) \
-                .order_by(FlicketDepartment.department, FlicketCategory.category, FlicketTicket.id)
-        elif sort == 'department_category_desc':
-            ticket_query = ticket_query.join(FlicketCategory, FlicketTicket.category) \
-                .join(FlicketDepartment, FlicketCategory.department) \
-                .order_by(FlicketDepartment.department.desc(), FlicketCategory.category.desc(), FlicketTicket.id)
-
-        elif sort == 'status':
-            ticket_query = ticket_query.order_by(FlicketTicket.status_id, FlicketTicket.id)
-        elif sort == 'status_desc':
-            ticket_query = ticket_query.order_by(FlicketTicket.status_id.desc(), FlicketTicket.id)
-
-        elif sort == 'assigned':
-            ticket_query = ticket_query.outerjoin(FlicketUser, FlicketTicket.assigned) \
-                .order_by(FlicketUser.name, FlicketTicket.id)
-        elif sort == 'assigned_desc':
-            ticket_query = ticket_query.outerjoin(FlicketUser, FlicketTicket.assigned) \
-                .order_by(FlicketUser.name.desc(), FlicketTicket.id)
-
-        elif sort == 'time':
-            total_hours = (FlicketTicket.hours + func.sum(FlicketPost.hours)).label('total_hours')
-            ticket_query = ticket_query.outerjoin(FlicketTicket.posts).group_by(FlicketTicket.id) \
-                .order_by(total_hours, FlicketTicket.id)
-        elif sort == 'time_desc':
-            total_hours = (FlicketTicket.hours + func.sum(FlicketPost.hours)).label('total_hours')
-            ticket_query = ticket_query.outerjoin(FlicketTicket.posts).group_by(FlicketTicket.id) \
-                .order_by(total_hours.desc(), FlicketTicket.id)
+        from application.flicket.scripts.ticket_query import ticket_order
 
-        return ticket_query
+        return ticket_query.order_by(*ticket_order(sort))
 
     def from_dict(self, data):
         """
@@ -512,6 +499,8 @@ class FlicketTicket(PaginatedAPIMixin, Base):
             'status_id': self.status_id,
             'title': self.title,
             'ticket_priority_id': self.ticket_priority_id,
+            'num_replies': self.num_replies,
+            'total_hours': self.total_hours,
             'links': {
                 'self': app.config['base_url'] + url_for('bp_api.get_ticket', id=self.id),
                 'assigned': assigned,
@@ -539,8 +528,12 @@ class FlicketTicket(PaginatedAPIMixin, Base):
                 f'assigned={self.assigned}>')
 
 
-class FlicketPost(PaginatedAPIMixin, Base):
+class FlicketPost(RenderedContentMixin, PaginatedAPIMixin, Base):
     __tablename__ = 'flicket_post'
+    __table_args__ = (
+        db.Index('ix_flicket_post_ticket_date', 'ticket_id', 'date_added'),
+        db.Index('ix_flicket_post_user', 'user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -548,6 +541,8 @@ class FlicketPost(PaginatedAPIMixin, Base):
     ticket = db.relationship(FlicketTicket, back_populates='posts')
 
     content = db.Column(db.String(field_size['content_max_length']))
+    # content rendered from markdown, written whenever content is set.
+    content_html = db.Column(db.Text)
 
     user_id = db.Column(db.Integer, db.ForeignKey(FlicketUser.id))
     user = db.relationship(FlicketUser, foreign_keys='FlicketPost.user_id')
@@ -595,8 +590,27 @@ class FlicketPost(PaginatedAPIMixin, Base):
         return "<FlicketPost: id={}, ticket_id={}, content={}>".format(self.id, self.ticket_id, self.content)
 
 
+# render the markdown when a ticket or post is created or edited, not each time it is viewed.
+@event.listens_for(FlicketTicket.content, 'set')
+@event.listens_for(FlicketPost.content, 'set')
+def render_content_html(target, value, oldvalue, initiator):
+    target.content_html = str(render_markdown(value, cache=False)) if value else None
+
+
+# every change shown on a ticket's pages updates its row: last_updated, date_modified or the post totals. The version
+# is incremented in sql so that changes committed at the same time are all counted.
+@event.listens_for(FlicketTicket, 'before_update')
+def bump_ticket_version(mapper, connection, target):
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = func.coalesce(FlicketTicket.version, 0) + 1
+
+
 class FlicketUploads(PaginatedAPIMixin, Base):
     __tablename__ = 'flicket_uploads'
+    __table_args__ = (
+        db.Index('ix_flicket_uploads_topic', 'topic_id'),
+        db.Index('ix_flicket_uploads_post', 'posts_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -655,6 +669,10 @@ class FlicketHistory(PaginatedAPIMixin, Base):
         A database to track the editing of tickets and posts.
     """
     __tablename__ = 'flicket_history'
+    __table_args__ = (
+        db.Index('ix_flicket_history_topic', 'topic_id'),
+        db.Index('ix_flicket_history_post', 'post_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -710,6 +728,10 @@ class FlicketHistory(PaginatedAPIMixin, Base):
 
 class FlicketSubscription(PaginatedAPIMixin, Base):
     __tablename__ = 'flicket_ticket_subscription'
+    __table_args__ = (
+        db.Index('ix_flicket_ticket_subscription_user_ticket', 'user_id', 'ticket_id'),
+        db.Index('ix_flicket_ticket_subscription_ticket', 'ticket_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -747,6 +769,49 @@ class FlicketSubscription(PaginatedAPIMixin, Base):
         return '<Class FlicketSubscription: ticket_id={}, user_id={}>'.format(self.ticket_id, self.user_id)
 
 
+# how each kind of action reads in the ticket timeline. {user} and {recipient} become mailto links, the other fields
+# come from the action's data.
+action_formats = {
+    'open': 'Ticket opened by {user}',
+    'assign': 'Ticket assigned to {recipient} by {user}',
+    'claim': 'Ticket claimed by {user}',
+    'status': 'Ticket status has been changed to "{status}" by {user}',
+    'priority': 'Ticket priority has been changed to "{priority}" by {user}',
+    'release': 'Ticket released by {user}',
+    'close': 'Ticket closed by {user}',
+    'department_category': 'Ticket category has been changed to "{department_category}" by {user}',
+    'subscribe': '{recipient} has been subscribed to ticket by {user}.',
+    'unsubscribe': '{recipient} has been un-subscribed from ticket by {user}.',
+}
+
+
+def _mailto(name, email):
+    if not name and not email:
+        return ''
+    return Markup('<a href="mailto:{}">{}</a>').format(email or '', name or email)
+
+
+def render_action(action):
+    """
+    Renders a line of the ticket timeline.
+    :param action: FlicketAction, or a row with its action, data, date, user_name, user_email, recipient_name and
+        recipient_email columns.
+    :return: Markup, empty for an unknown action.
+    """
+    action_format = action_formats.get(action.action)
+    if action_format is None:
+        return Markup('')
+
+    # a field missing from the data is left blank.
+    fields = defaultdict(str, action.data or {})
+    fields['user'] = _mailto(action.user_name, action.user_email)
+    fields['recipient'] = _mailto(action.recipient_name, action.recipient_email)
+    text = Markup(action_format).format_map(fields)
+    date = action.date.strftime('%d-%m-%Y %H:%M') if action.date else ''
+
+    return Markup('{} | {}').format(text, date)
+
+
 class FlicketAction(PaginatedAPIMixin, Base):
     """
     SQL table that stores the action history of a ticket.
@@ -754,6 +819,10 @@ class FlicketAction(PaginatedAPIMixin, Base):
     The action is associated with ticket_id and latest post_id (if exists).
     """
     __tablename__ = 'flicket_ticket_action'
+    __table_args__ = (
+        db.Index('ix_flicket_ticket_action_ticket_date', 'ticket_id', 'date'),
+        db.Index('ix_flicket_ticket_action_post', 'post_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -772,61 +841,20 @@ class FlicketAction(PaginatedAPIMixin, Base):
     recipient_id = db.Column(db.Integer, db.ForeignKey(FlicketUser.id))
     recipient = db.relationship(FlicketUser, foreign_keys=[recipient_id])
 
+    # names as they were when the action was taken, so the timeline is read without joining users.
+    user_name = db.Column(db.String(user_field_size['name_max']))
+    user_email = db.Column(db.String(user_field_size['email_max']))
+    recipient_name = db.Column(db.String(user_field_size['name_max']))
+    recipient_email = db.Column(db.String(user_field_size['email_max']))
+
     date = db.Column(db.DateTime)
 
     def output_action(self):
         """
         Method used in ticket view to show what action has taken place in ticket.
-        :return:
+        :return: Markup
         """
-
-        _date = self.date.strftime('%d-%m-%Y %H:%M')
-
-        recipient_name = escape(self.recipient.name) or None
-        recipient_email = escape(self.recipient.email) or None
-        user_name = escape(self.user.name) or None
-        user_email = escape(self.user.email) or None
-
-        if self.action == 'open':
-            return (f'Ticket opened'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'assign':
-            return (f'Ticket assigned to <a href="mailto:{recipient_name}">{recipient_name}</a>'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'claim':
-            return (f'Ticked claimed'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'status':
-            return (f'Ticket status has been changed to "{self.data["status"]}"'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'priority':
-            return (f'Ticket priority has been changed to "{self.data["priority"]}"'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'release':
-            return (f'Ticket released'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'close':
-            return (f'Ticked closed'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'department_category':
-            return (f'Ticket category has been changed to "{self.data["department_category"]}"'
-                    f' by <a href="mailto:{user_email}">{user_name}</a> | {_date}')
-
-        if self.action == 'subscribe':
-            return (f'<a href="mailto:{recipient_email}">{recipient_name}</a> has been subscribed to ticket'
-                    f' by <a href="mailto:{user_email}">{user_name}</a>. | {_date}')
-
-        if self.action == 'unsubscribe':
-            return (f'<a href="mailto:{recipient_email}">{recipient_name}</a> '
-                    f'has been un-subscribed from ticket'
-                    f' by <a href="mailto:{user_email}">{user_name}</a>. | {_date}')
+        return render_action(self)
 
     def to_dict(self):
         """
@@ -856,6 +884,74 @@ class FlicketAction(PaginatedAPIMixin, Base):
                 f'data={self.data}, user_id={self.user_id}, recipient_id={self.recipient_id}, date={self.date}>')
 
 
+class FlicketTicketStats(Base):
+    """
+    SQL table holding the number of tickets and their hours (ticket plus post hours) for each department, category,
+    status and priority, so that the dashboard does not have to count flicket_topic. Kept up to date by
+    application/flicket/scripts/ticket_stats.py and rebuilt by the "rebuild-stats" command. A missing key part (a
+    ticket without a priority, say) is stored as 0 so that the unique key index also covers it.
+    """
+    __tablename__ = 'flicket_ticket_stats'
+    __table_args__ = (
+        db.Index('ix_flicket_ticket_stats_key', 'department_id', 'category_id', 'status_id', 'priority_id',
+                 unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    department_id = db.Column(db.Integer, nullable=False, server_default='0')
+    category_id = db.Column(db.Integer, nullable=False, server_default='0')
+    status_id = db.Column(db.Integer, nullable=False, server_default='0')
+    priority_id = db.Column(db.Integer, nullable=False, server_default='0')
+
+    tickets = db.Column(db.Integer, server_default='0')
+    hours = db.Column(db.Numeric(10, 2), server_default='0')
+
+    def __repr__(self):
+        return (f'<Class FlicketTicketStats: department_id={self.department_id}, category_id={self.category_id}, '
+                f'status_id={self.status_id}, priority_id={self.priority_id}, tickets={self.tickets}, '
+                f'hours={self.hours}>')
+
+
+class FlicketEmailOutbox(Base):
+    """
+    SQL table of the emails waiting to be sent, one row per recipient. Requests add rows in their own transaction and
+    the email worker (application/flicket/scripts/email_outbox.py) sends them, deleting the rows that were sent and
+    retrying the others until they are marked failed.
+    """
+    __tablename__ = 'flicket_email_outbox'
+    __table_args__ = (
+        db.Index('ix_flicket_email_outbox_due', 'status', 'next_attempt'),
+        db.Index('ix_flicket_email_outbox_dedup', 'dedup_key'),
+        db.Index('ix_flicket_email_outbox_claim', 'claim'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    recipient = db.Column(db.String(255))
+    sender = db.Column(db.String(255))
+    subject = db.Column(db.Text)
+    html_body = db.Column(db.Text)
+    # hash of recipient, subject and body, an email already waiting for the recipient is not queued twice.
+    dedup_key = db.Column(db.String(40))
+
+    # 'pending' or 'failed'.
+    status = db.Column(db.String(10), server_default='pending')
+    attempts = db.Column(db.Integer, server_default='0')
+    # when the email may next be sent. A worker sending it moves this on by EMAIL_CLAIM_SECONDS, so an email
+    # claimed by a worker that died is picked up again.
+    next_attempt = db.Column(db.DateTime)
+    # set by the worker that claimed the email.
+    claim = db.Column(db.String(32))
+    last_error = db.Column(db.Text)
+
+    date_added = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return (f'<Class FlicketEmailOutbox: id={self.id}, recipient={self.recipient!r}, status={self.status!r}, '
+                f'attempts={self.attempts}, next_attempt={self.next_attempt}>')
+
+
 # Virtual Model Flicket DepartmentCategory
 # xdml: as not sure how to best implement it, I created "Virtual Model" or how to call it
 # that is similar to SQL VIEW, it is simple SELECT FROM flicket_category JOIN flicket_department
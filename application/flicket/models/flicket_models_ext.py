@@ -10,7 +10,11 @@ from application import app, db
 from application.flicket.scripts.flicket_upload import UploadAttachment
 from application.flicket.models.flicket_models import FlicketTicket, FlicketStatus, FlicketPriority, FlicketCategory, \
     FlicketSubscription, FlicketHistory, FlicketUploads
+from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.email import FlicketMail
+from application.flicket.scripts.ticket_search import index_ticket
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 
 class FlicketTicketExt:
@@ -56,24 +60,23 @@ class FlicketTicketExt:
                                    last_updated=date_added,
                                    )
 
-        db.session.add(new_ticket)
-        # add attachments to the database
-        upload_attachments.populate_db(new_ticket)
-        # subscribe user to ticket.
-        subscribe = FlicketSubscription(user=user, ticket=new_ticket)
-        db.session.add(subscribe)
+        with unit_of_work():
+            db.session.add(new_ticket)
+            # add attachments to the database
+            upload_attachments.populate_db(new_ticket)
+            # subscribe user to ticket.
+            subscribe = FlicketSubscription(user=user, ticket=new_ticket)
+            db.session.add(subscribe)
 
-        # add count of 1 to users total posts.
-        user.total_posts += 1
+            # add count of 1 to users total posts.
+            FlicketUser.update_totals(user.id, posts=1)
 
-        db.session.commit()
+            index_ticket(new_ticket)
+            add_ticket_stats(new_ticket)
 
-        # notify creator and developers/admins
-        try:
+            # notify creator and developers/admins, queued with the ticket. An email that fails is logged and the
+            # ticket is created all the same.
             FlicketMail().create_ticket(new_ticket)
-        except Exception:
-            # fail silently to avoid blocking ticket creation if email fails
-            pass
 
         return new_ticket
 
@@ -127,6 +130,8 @@ class FlicketTicketExt:
 
         date_modified = datetime.datetime.now()
 
+        remove_ticket_stats(ticket)
+
         ticket.content = content
         ticket.title = title
         ticket.modified = user
@@ -144,6 +149,9 @@ class FlicketTicketExt:
         # add files to database.
         upload_attachments.populate_db(ticket)
 
+        index_ticket(ticket)
+        add_ticket_stats(ticket)
+
         db.session.commit()
 
         return ticket.id
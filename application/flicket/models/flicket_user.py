@@ -10,11 +10,15 @@ import random
 import string
 
 import bcrypt
-from flask import url_for
+from flask import g, url_for
 from flask_login import UserMixin
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 
 from application import db, app
 from application.flicket.models import Base
+from application.flicket.scripts.lru_cache import LRUCache
 from application.flicket_api.scripts.paginated_api import PaginatedAPIMixin
 
 user_field_size = {
@@ -32,6 +36,18 @@ user_field_size = {
     'avatar': 64
 }
 
+# token -> (user_id, token_expiration, disabled) for the tokens seen by this worker. Revoking or regenerating a
+# token, or disabling a user, removes the entries here; other workers notice within the ttl.
+token_cache = LRUCache(maxsize=1024, ttl=60, name='token')
+
+# user id -> (user fields, roles) for the users loaded by this worker, see FlicketUser.load_cached.
+user_cache = LRUCache(maxsize=1024, ttl=30, name='user')
+
+# fields kept in user_cache: those read on every request, the token is checked in before_request. The counters and
+# password are left out and read from the database when used.
+user_cache_fields = ('id', 'username', 'name', 'email', 'date_added', 'job_title', 'avatar', 'locale', 'disabled',
+                     'token', 'token_expiration')
+
 flicket_groups = db.Table('flicket_groups',
                           db.Column('user_id', db.Integer, db.ForeignKey('flicket_users.id')),
                           db.Column('group_id', db.Integer, db.ForeignKey('flicket_group.id'))
@@ -76,6 +92,93 @@ class FlicketUser(PaginatedAPIMixin, UserMixin, Base):
         self.locale = locale
         self.disabled = disabled
 
+    @property
+    def roles(self):
+        """
+
+        Returns the names of the groups the user is a member of. See get_roles.
+
+        :return frozenset:
+        """
+        return FlicketUser.get_roles(self.id)
+
+    @staticmethod
+    def get_roles(user_id):
+        """
+
+        Returns the names of the groups user_id is a member of. They are read with one query the first time they are
+        needed and kept for the rest of the request, so templates can check is_admin on every row for free.
+
+        :param int user_id:
+        :return frozenset:
+        """
+        roles = g.setdefault('flicket_roles', {})
+        if user_id not in roles:
+            query = select(FlicketGroup.group_name). \
+                join(flicket_groups, flicket_groups.c.group_id == FlicketGroup.id). \
+                where(flicket_groups.c.user_id == user_id)
+            roles[user_id] = frozenset(db.session.execute(query).scalars())
+
+        return roles[user_id]
+
+    @staticmethod
+    def load_cached(user_id):
+        """
+
+        Returns the user, with its roles, for the login manager and the identity. The user's fields and roles are
+        read once and kept in user_cache; the user is then added to the session without a query. Fields that are
+        not cached are read from the database the first time they are used.
+
+        :param int user_id:
+        :return FlicketUser: or None if there is no such user.
+        """
+        entry = user_cache.get(user_id)
+        if entry is None:
+            row = db.session.execute(select(*[getattr(FlicketUser, field) for field in user_cache_fields]).
+                                     where(FlicketUser.id == user_id)).first()
+            if row is None:
+                return None
+            entry = (dict(row._mapping), FlicketUser.get_roles(user_id))
+            user_cache.set(user_id, entry)
+
+        fields, roles = entry
+        g.setdefault('flicket_roles', {})[user_id] = roles
+
+        user = FlicketUser.__mapper__.class_manager.new_instance()
+        for field, value in fields.items():
+            setattr(user, field, value)
+        make_transient_to_detached(user)
+
+        return db.session.merge(user, load=False)
+
+    @staticmethod
+    def clear_user_cache(user_id=None):
+        """
+
+        Removes user_id, or every user, from user_cache and this request's roles. Call after editing a user or
+        their groups.
+
+        :param int user_id:
+        :return:
+        """
+        if user_id is None:
+            user_cache.clear()
+            g.pop('flicket_roles', None)
+        else:
+            user_cache.pop(user_id)
+            FlicketUser.clear_roles(user_id)
+
+    @staticmethod
+    def clear_roles(user_id):
+        """
+
+        Forgets the groups read for user_id in this request. Call after changing the user's groups.
+
+        :param int user_id:
+        :return:
+        """
+        g.get('flicket_roles', {}).pop(user_id, None)
+
     @property
     def is_admin(self):
         """
@@ -84,12 +187,7 @@ class FlicketUser(PaginatedAPIMixin, UserMixin, Base):
 
         :return bool:
         """
-        user = FlicketUser.query.filter_by(id=self.id).first()
-        for g in user.flicket_groups:
-            if g.group_name == app.config['ADMIN_GROUP_NAME']:
-                return True
-        else:
-            return False
+        return app.config['ADMIN_GROUP_NAME'] in self.roles
 
     @property
     def is_super_user(self):
@@ -99,12 +197,7 @@ class FlicketUser(PaginatedAPIMixin, UserMixin, Base):
 
         :return bool:
         """
-        user = FlicketUser.query.filter_by(id=self.id).first()
-        for g in user.flicket_groups:
-            if g.group_name == app.config['SUPER_USER_GROUP_NAME']:
-                return True
-        else:
-            return False
+        return app.config['SUPER_USER_GROUP_NAME'] in self.roles
 
     def check_password(self, password):
         """
@@ -128,19 +221,53 @@ class FlicketUser(PaginatedAPIMixin, UserMixin, Base):
     def check_token(token):
         """
 
-        Returns True if token hasn't expired and user account isn't disabled. Otherwise False.
+        Returns the user if token hasn't expired and user account isn't disabled. Otherwise None.
 
         :param token:
-        :return bool:
+        :return FlicketUser:
         """
-        user = FlicketUser.query.filter_by(token=token).first()
-        if not user.token_expiration:
+        user_id = FlicketUser.check_token_id(token)
+        if user_id is None:
             return None
-        if user is None or user.token_expiration < datetime.utcnow():
+        return FlicketUser.query.get(user_id)
+
+    @staticmethod
+    def check_token_id(token):
+        """
+
+        Returns the id of the token's user if token hasn't expired and user account isn't disabled. Otherwise None.
+        Tokens are looked up in token_cache first so steady state requests do not query the database.
+
+        :param token:
+        :return int:
+        """
+        if not token:
             return None
-        if user.disabled:
+
+        entry = token_cache.get(token)
+        if entry is None:
+            row = db.session.execute(select(FlicketUser.id, FlicketUser.token_expiration, FlicketUser.disabled).
+                                     where(FlicketUser.token == token)).first()
+            if row is None:
+                return None
+            entry = tuple(row)
+            token_cache.set(token, entry)
+
+        user_id, token_expiration, disabled = entry
+        if not token_expiration or token_expiration < datetime.utcnow() or disabled:
             return None
-        return user
+        return user_id
+
+    @staticmethod
+    def clear_token_cache(user_id):
+        """
+
+        Removes the cached tokens of user_id. Call when the user is disabled or enabled.
+
+        :param int user_id:
+        :return:
+        """
+        token_cache.discard_if(lambda token, entry: entry[0] == user_id)
 
     @staticmethod
     def generate_password():
@@ -164,6 +291,8 @@ class FlicketUser(PaginatedAPIMixin, UserMixin, Base):
         now = datetime.utcnow()
         if self.token and self.token_expiration > now + timedelta(seconds=60):
             return self.token
+        token_cache.pop(self.token)
+        user_cache.pop(self.id)
         self.token = base64.b64encode(os.urandom(24)).decode('utf-8')
         self.token_expiration = now + timedelta(seconds=expires_in)
         db.session.add(self)
@@ -175,6 +304,35 @@ class FlicketUser(PaginatedAPIMixin, UserMixin, Base):
         :return:
         """
         self.token_expiration = datetime.utcnow() - timedelta(seconds=1)
+        token_cache.pop(self.token)
+        user_cache.pop(self.id)
+
+    @staticmethod
+    def update_totals(user_id, posts=0, assigned=0):
+        """
+        Adjusts total_posts and total_assigned of user_id. The change is made in sql
+        (total_posts = total_posts + 1), in the current transaction, without loading the user, so counts changed by
+        other requests at the same time are not lost.
+        :param int user_id:
+        :param int posts: change in the number of posts.
+        :param int assigned: change in the number of assigned tickets.
+        :return:
+        """
+        values = {}
+        if posts:
+            values['total_posts'] = func.coalesce(FlicketUser.total_posts, 0) + posts
+        if assigned:
+            values['total_assigned'] = func.coalesce(FlicketUser.total_assigned, 0) + assigned
+        if not user_id or not values:
+            return
+
+        db.session.execute(update(FlicketUser).where(FlicketUser.id == user_id).values(**values).
+                           execution_options(synchronize_session=False))
+
+        # a copy of the user already in the session reads the new counts when next used.
+        user = db.session.identity_map.get(identity_key(FlicketUser, user_id))
+        if user is not None:
+            db.session.expire(user, list(values))
 
     def to_dict(self):
         """
@@ -0,0 +1,64 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+The action timeline of a ticket.
+
+An action stores the names and emails of its user and recipient when it is taken (see add_action), so the timeline
+is read in one query without loading the users; actions written before those columns existed fall back to the
+users' current names through an outer join. Each line is rendered by render_action from the action_formats table.
+
+The rendered timeline is cached by ticket and version. add_action moves the ticket's last_updated with every action,
+which updates the ticket's row and so increments its version (see bump_ticket_version), and every worker reads the
+new timeline after a change without having to be told; the timeline of an older version is no longer asked for and
+drops out of the cache. last_updated itself is not used as MySQL stores it to the second.
+"""
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from application import db
+from application.flicket.models.flicket_models import FlicketAction, render_action
+from application.flicket.models.flicket_user import FlicketUser
+from application.flicket.scripts.lru_cache import LRUCache
+
+# (ticket id, version) -> list of rendered lines.
+timeline_cache = LRUCache(maxsize=1024, ttl=60, name='timeline')
+
+
+def timeline_query(ticket_id):
+    """
+    :param int ticket_id:
+    :return: select of the ticket's actions, oldest first, with the columns render_action reads.
+    """
+    user = aliased(FlicketUser)
+    recipient = aliased(FlicketUser)
+
+    return select(
+        FlicketAction.action,
+        FlicketAction.data,
+        FlicketAction.date,
+        func.coalesce(FlicketAction.user_name, user.name).label('user_name'),
+        func.coalesce(FlicketAction.user_email, user.email).label('user_email'),
+        func.coalesce(FlicketAction.recipient_name, recipient.name).label('recipient_name'),
+        func.coalesce(FlicketAction.recipient_email, recipient.email).label('recipient_email'),
+    ).outerjoin(user, user.id == FlicketAction.user_id). \
+        outerjoin(recipient, recipient.id == FlicketAction.recipient_id). \
+        where(FlicketAction.ticket_id == ticket_id). \
+        order_by(FlicketAction.date, FlicketAction.id)
+
+
+def ticket_timeline(ticket):
+    """
+    :param ticket: FlicketTicket
+    :return: list of Markup, one line per action.
+    """
+    key = (ticket.id, ticket.version)
+    lines = timeline_cache.get(key)
+    if lines is None:
+        lines = [line for line in map(render_action, db.session.execute(timeline_query(ticket.id))) if line]
+        timeline_cache.set(key, lines)
+
+    return lines
@@ -0,0 +1,100 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+HTTP conditional GET.
+
+A view decorated with conditional_get sends an ETag, and answers a GET whose If-None-Match matches with an empty
+304 Not Modified before the view runs, so nothing is loaded or rendered for a client, browser or api poller, that
+already has the current copy.
+
+The version of a ticket, its page and its api resources, is the ticket's version column, read from its row by
+primary key. Every change shown on those pages updates the row, replies, post edits and deletions, every action (see
+add_action) and ticket edits, and the version is incremented with each update (see bump_ticket_version). A counter
+is used rather than last_updated as MySQL stores dates to the second: two changes made in the same second would get
+the same ETag. The ETag also covers the requesting user and their groups, the locale and the url, as pages differ
+between users.
+
+No Last-Modified header is sent and If-Modified-Since is not answered, for the same reason: a change made in the
+second the client fetched the page would be missed, and a date can not tell users or locales apart.
+"""
+
+from functools import wraps
+import hashlib
+import time
+
+from flask import g, make_response, request, session
+from flask_babel import get_locale
+from flask_login import current_user
+from sqlalchemy import func
+
+from application import app, db
+from application.flicket.models.flicket_models import FlicketTicket
+
+
+def ticket_version(ticket_id):
+    """
+    :param ticket_id:
+    :return: int version of the ticket, or None if there is no such ticket.
+    """
+    row = db.session.query(func.coalesce(FlicketTicket.version, 0)).filter(FlicketTicket.id == ticket_id).first()
+
+    return None if row is None else row[0]
+
+
+def _etag(version):
+    user = g.get('current_user') or current_user
+    parts = [request.endpoint, request.full_path, str(version), str(get_locale())]
+    if getattr(user, 'is_authenticated', False):
+        parts += [str(user.id)] + sorted(user.roles)
+    # a cached page must not hold a csrf token that has expired.
+    time_limit = app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if app.config.get('WTF_CSRF_ENABLED', True) and time_limit:
+        parts.append(str(int(time.time() // time_limit)))
+
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _set_validators(response, etag):
+    response.set_etag(etag)
+    # the client may keep its copy but must check it is current before using it.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional_get(resource_version, arg='ticket_id'):
+    """
+    Decorator adding conditional GET to a view.
+    :param resource_version: function returning the version of the resource, a value that changes with every
+        change, or None to run the view as usual. Called with the view argument named arg.
+    :param str arg: name of the view argument identifying the resource.
+    :return:
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # messages waiting to be flashed are part of the next page.
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            version = resource_version(kwargs.get(arg))
+            if version is None:
+                return f(*args, **kwargs)
+
+            etag = _etag(version)
+            if request.if_none_match.contains_weak(etag):
+                return _set_validators(app.response_class(status=304), etag)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                _set_validators(response, etag)
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -3,14 +3,74 @@
 #
 # Flicket - copyright Paul Bourne: evereux@gmail.com
 
+from functools import wraps
+
 from flask import render_template, url_for
-from flask_mail import Mail, Message
+from flask_mail import Mail
 
-from application import app
-from application.flicket.scripts.decorators import send_async_email
+from application import app, db
+from application.flicket.scripts.email_outbox import queue_email
 from application.flicket_admin.models.flicket_config import FlicketConfig
 from application.flicket.models.flicket_user import FlicketGroup
 
+# (database, settings version) -> flask_mail settings, see mail_settings.
+_mail_settings = {}
+
+
+def mail_settings(config):
+    """
+    Returns the flask_mail settings (server, port, credentials, suppress...) for the stored settings. They are built
+    once per version of the settings and app.config is left alone, so the email worker threads do not rewrite it on
+    every batch. Open a connection with flask_mail.Connection(settings).
+    :param config: FlicketConfig.cached()
+    :return: flask_mail settings object.
+    """
+    key = (str(db.engine.url), config.version)
+    settings = _mail_settings.get(key)
+    if settings is None:
+        settings = Mail().init_mail({
+            'MAIL_SERVER': config.mail_server,
+            'MAIL_PORT': config.mail_port,
+            'MAIL_USE_TLS': config.mail_use_tls,
+            'MAIL_USE_SSL': config.mail_use_ssl,
+            'MAIL_DEBUG': config.mail_debug,
+            'MAIL_USERNAME': config.mail_username,
+            'MAIL_PASSWORD': config.mail_password,
+            'MAIL_DEFAULT_SENDER': config.mail_default_sender,
+            'MAIL_MAX_EMAILS': config.mail_max_emails,
+            'MAIL_SUPPRESS_SEND': config.mail_suppress_send,
+            'MAIL_ASCII_ATTACHMENTS': config.mail_ascii_attachments,
+        }, app.debug, app.testing)
+        # only the current version is kept.
+        _mail_settings.clear()
+        _mail_settings[key] = settings
+
+    return settings
+
+
+def queued_safely(f):
+    """
+    Decorator for the FlicketMail notifications, which are queued in the transaction of the change they report. The
+    email is rendered and queued in a savepoint: if that fails, the error is logged and only the savepoint is rolled
+    back, so a mail problem does not undo the change.
+    :return: True if the email was queued, or there was nobody to send it to. False if it failed.
+    """
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        # the caller's changes are flushed outside the savepoint, their errors are not the email's.
+        db.session.flush()
+        try:
+            with db.session.begin_nested():
+                f(*args, **kwargs)
+        except Exception:
+            app.logger.exception('Email %s could not be queued.', f.__name__)
+            return False
+
+        return True
+
+    return wrapper
+
 
 class FlicketMail:
     """
@@ -19,31 +79,15 @@ class FlicketMail:
 
     def __init__(self):
         """
-        Upon initialisation the mail configuration settings are retrieved from the database and
-        self.mail is intialised.
+        Upon initialisation the mail settings are read from the cached configuration, see mail_settings.
         """
 
-        config = FlicketConfig.query.first()
-
-        app.config.update(
-            MAIL_SERVER=config.mail_server,
-            MAIL_PORT=config.mail_port,
-            MAIL_USE_TLS=config.mail_use_tls,
-            MAIL_USE_SSL=config.mail_use_ssl,
-            MAIL_DEBUG=config.mail_debug,
-            MAIL_USERNAME=config.mail_username,
-            MAIL_PASSWORD=config.mail_password,
-            MAIL_MAX_EMAILS=config.mail_max_emails,
-            MAIL_SUPPRESS_SEND=config.mail_suppress_send,
-            MAIL_ASCII_ATTACHMENTS=config.mail_ascii_attachments,
-            base_url=config.base_url,
-        )
-
-        self.mail = Mail(app)
-        self.mail.init_app(app)
+        config = FlicketConfig.cached()
 
+        self.settings = mail_settings(config)
         self.sender = config.mail_default_sender
 
+    @queued_safely
     def create_ticket(self, ticket):
         """Send an email to the ticket creator and developer/admin groups when a ticket is created."""
 
@@ -75,6 +119,7 @@ class FlicketMail:
 
         self.send_email(title, self.sender, recipients, html_body)
 
+    @queued_safely
     def reply_ticket(self, ticket=None, reply=None, user=None):
         """
         :param ticket: ticket object
@@ -93,6 +138,7 @@ class FlicketMail:
 
             self.send_email(title, self.sender, recipients, html_body)
 
+    @queued_safely
     def assign_ticket(self, ticket):
         """
         :param ticket: ticket object
@@ -107,6 +153,7 @@ class FlicketMail:
 
         self.send_email(title, self.sender, recipients, html_body)
 
+    @queued_safely
     def department_category_ticket(self, ticket):
         """
         Change ticket department or category email notification
@@ -123,6 +170,7 @@ class FlicketMail:
 
         self.send_email(title, self.sender, recipients, html_body)
 
+    @queued_safely
     def release_ticket(self, ticket):
         """
         :param ticket: ticket object
@@ -137,6 +185,7 @@ class FlicketMail:
 
         self.send_email(title, self.sender, recipients, html_body)
 
+    @queued_safely
     def close_ticket(self, ticket):
         """
         :param ticket: ticket object
@@ -150,6 +199,7 @@ class FlicketMail:
 
         self.send_email(title, self.sender, recipients, html_body)
 
+    @queued_safely
     def tickets_not_closed(self, user, tickets):
         """
         Sends email to user notifying them that tickets they have created or have been assigned
@@ -164,6 +214,7 @@ class FlicketMail:
 
         self.send_email(title, self.sender, recipient, html_body)
 
+    @queued_safely
     def password_reset(self, user, new_password):
         """
         Sends email to user notifying of password reset.
@@ -187,10 +238,11 @@ class FlicketMail:
 
         self.send_email('Flicket Test Email', self.sender, recipients, html_body)
 
-    @send_async_email
     def send_email(self, subject, sender, recipients, html_body):
         """
-        Sends email via async thread.
+        Queues the email in the outbox, the email worker sends it (see email_outbox.py). The rows are only added to
+        the session: they are saved when the caller commits, with the change the email reports, usually at the end
+        of a unit of work.
 
         :param subject: string
         :param sender: string
@@ -199,7 +251,7 @@ class FlicketMail:
         :return: nowt
         """
 
-        if not app.config['MAIL_SUPPRESS_SEND']:
-            with app.app_context():
-                message = Message(subject, sender=sender, recipients=recipients, html=html_body)
-                self.mail.send(message)
+        if self.settings.suppress:
+            return
+
+        queue_email(subject, sender, recipients, html_body)
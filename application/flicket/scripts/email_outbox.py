@@ -0,0 +1,273 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Email outbox.
+
+FlicketMail does not send email from the request: queue_email adds one flicket_email_outbox row per recipient to the
+session, and the caller's commit (the end of its unit of work) saves them with the change they report. An email is
+only queued if that change is saved, and is not lost if the process stops before it is sent. An email that is
+already waiting for the same recipient is not queued again.
+
+The rows are sent by a small pool of threads, EmailWorker:
+
+* in each web process, EMAIL_WORKER_THREADS threads started when one of its requests first queues an email, or
+* in a process of its own, "flask email-worker" (set EMAIL_WORKER_THREADS to 0 for the web processes then).
+
+A thread claims up to EMAIL_BATCH_SIZE due emails, marking them with its claim so that other threads and processes
+leave them alone for EMAIL_CLAIM_SECONDS, and sends them over one SMTP connection. Sent emails are deleted. An email
+that could not be sent is tried again after EMAIL_RETRY_DELAY seconds, doubled on every attempt, and is marked
+failed after EMAIL_MAX_ATTEMPTS attempts; failed emails are kept for inspection.
+"""
+
+from contextlib import ExitStack
+import datetime
+import hashlib
+import os
+from threading import Event, Lock, Thread
+import time
+import uuid
+
+from flask import has_request_context
+from flask_mail import Connection, Message
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+
+from application import app, db
+from application.flicket.models.flicket_models import FlicketEmailOutbox
+from application.flicket.scripts.metrics import metrics
+
+# longest wait between retries, in seconds.
+max_retry_delay = 6 * 60 * 60
+
+
+def dedup_key(recipient, subject, html_body):
+    return hashlib.sha1('\n'.join([recipient, subject, html_body]).encode('utf-8')).hexdigest()
+
+
+def queue_email(subject, sender, recipients, html_body):
+    """
+    Adds an email to the outbox, one row per recipient, to the session. Nothing is committed here: the rows are
+    saved by the caller's commit, which then wakes the worker.
+    :param str subject:
+    :param str sender:
+    :param list recipients:
+    :param str html_body:
+    :return: number of rows added.
+    """
+    keys = {recipient: dedup_key(recipient, subject, html_body) for recipient in set(recipients) if recipient}
+    if not keys:
+        return 0
+
+    waiting = {key for key, in db.session.query(FlicketEmailOutbox.dedup_key).
+               filter(FlicketEmailOutbox.status == 'pending', FlicketEmailOutbox.dedup_key.in_(keys.values()))}
+
+    now = datetime.datetime.now()
+    queued = 0
+    for recipient, key in sorted(keys.items()):
+        if key in waiting:
+            continue
+        db.session.add(FlicketEmailOutbox(recipient=recipient, sender=sender, subject=subject, html_body=html_body,
+                                          dedup_key=key, status='pending', attempts=0, next_attempt=now,
+                                          date_added=now))
+        queued += 1
+
+    if queued:
+        db.session.info['email_queued'] = True
+
+    return queued
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_after_commit(session):
+    # the worker would not find the rows before they are committed.
+    if session.info.pop('email_queued', False):
+        email_worker.wake()
+
+
+def queue_depth():
+    """
+    :return: dict of status -> number of emails in the outbox.
+    """
+    return dict(db.session.query(FlicketEmailOutbox.status, func.count(FlicketEmailOutbox.id)).
+                group_by(FlicketEmailOutbox.status))
+
+
+def retry_delay(attempts):
+    """
+    :param int attempts: attempts made so far.
+    :return: seconds to wait before the next attempt.
+    """
+    return min(app.config.get('EMAIL_RETRY_DELAY', 60) * 2 ** (attempts - 1), max_retry_delay)
+
+
+def claim_due(batch_size):
+    """
+    Claims up to batch_size emails that are due, in a transaction of its own.
+    :param int batch_size:
+    :return: list of FlicketEmailOutbox
+    """
+    now = datetime.datetime.now()
+    due = [email_id for email_id, in db.session.query(FlicketEmailOutbox.id).
+           filter(FlicketEmailOutbox.status == 'pending', FlicketEmailOutbox.next_attempt <= now).
+           order_by(FlicketEmailOutbox.next_attempt, FlicketEmailOutbox.id).limit(batch_size)]
+    if not due:
+        db.session.rollback()
+        return []
+
+    # only the rows still due are claimed, another worker may have taken some since they were read.
+    claim = uuid.uuid4().hex
+    db.session.execute(update(FlicketEmailOutbox).
+                       where(FlicketEmailOutbox.id.in_(due), FlicketEmailOutbox.status == 'pending',
+                             FlicketEmailOutbox.next_attempt <= now).
+                       values(claim=claim,
+                              next_attempt=now + datetime.timedelta(
+                                  seconds=app.config.get('EMAIL_CLAIM_SECONDS', 300))).
+                       execution_options(synchronize_session=False))
+    db.session.commit()
+
+    return FlicketEmailOutbox.query.filter_by(claim=claim).order_by(FlicketEmailOutbox.id).all()
+
+
+def send_emails(emails):
+    """
+    Sends claimed emails over one connection, then deletes the ones sent and reschedules the others.
+    :param list emails: FlicketEmailOutbox
+    :return:
+    """
+    # imported here, email.py imports this module.
+    from application.flicket.scripts.email import FlicketMail
+
+    settings = FlicketMail().settings
+    max_attempts = app.config.get('EMAIL_MAX_ATTEMPTS', 6)
+    connection = ExitStack()
+    smtp = None
+    try:
+        for email in emails:
+            message = Message(email.subject, sender=email.sender, recipients=[email.recipient], html=email.html_body)
+            start = time.perf_counter()
+            try:
+                if smtp is None:
+                    smtp = connection.enter_context(Connection(settings))
+                smtp.send(message)
+            except Exception as e:
+                # the connection may be broken, the next email opens a new one.
+                _close(connection)
+                smtp = None
+                email.attempts = (email.attempts or 0) + 1
+                email.last_error = '{}: {}'.format(type(e).__name__, e)
+                email.claim = None
+                if email.attempts >= max_attempts:
+                    email.status = 'failed'
+                    result = 'failed'
+                else:
+                    email.next_attempt = datetime.datetime.now() + \
+                        datetime.timedelta(seconds=retry_delay(email.attempts))
+                    result = 'retry'
+            else:
+                db.session.delete(email)
+                result = 'sent'
+            metrics.observe('flicket_email_send_duration_seconds', time.perf_counter() - start,
+                            {'result': 'sent' if result == 'sent' else 'error'})
+            metrics.inc('flicket_emails_total', {'result': result})
+    finally:
+        _close(connection)
+        db.session.commit()
+
+
+def _close(connection):
+    # closing a connection the server has dropped raises, the emails have been sent or rescheduled already.
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class EmailWorker:
+    """
+    A bounded pool of threads sending the outbox.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the threads. Called in a newly forked process, which does not have its parent's threads.
+        :return:
+        """
+        self._lock = Lock()
+        self._wake = Event()
+        self._stop = Event()
+        self.threads = []
+
+    def send_due(self, batch_size=None):
+        """
+        Claims and sends one batch of due emails. Needs an app context.
+        :param batch_size:
+        :return: number of emails claimed.
+        """
+        emails = claim_due(batch_size or app.config.get('EMAIL_BATCH_SIZE', 20))
+        if emails:
+            send_emails(emails)
+
+        return len(emails)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    sent = self.send_due()
+            except Exception:
+                app.logger.exception('Email worker failed to send the outbox.')
+                sent = 0
+            if not sent:
+                # woken early when an email is queued, the poll picks up retries.
+                self._wake.wait(app.config.get('EMAIL_POLL_INTERVAL', 10))
+                self._wake.clear()
+
+    def start(self, threads):
+        """
+        Starts the threads, if they are not running.
+        :param int threads:
+        :return:
+        """
+        with self._lock:
+            if self.threads or threads < 1:
+                return
+            self._stop.clear()
+            for i in range(threads):
+                thread = Thread(target=self._run, name='flicket-email-{}'.format(i), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Asks the threads to stop after their current batch and waits for them.
+        :param timeout: seconds to wait for each thread.
+        :return:
+        """
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            threads, self.threads = self.threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def wake(self):
+        """
+        Tells the threads that emails have been queued. In a request, EMAIL_WORKER_THREADS threads are started in
+        this process if none are running; a cli command only queues, it may exit before the emails are sent.
+        :return:
+        """
+        if not self.threads and has_request_context():
+            self.start(app.config.get('EMAIL_WORKER_THREADS', 2))
+        self._wake.set()
+
+
+email_worker = EmailWorker()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=email_worker.reset)
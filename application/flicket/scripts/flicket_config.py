@@ -9,10 +9,11 @@ from application.flicket_admin.models.flicket_config import FlicketConfig
 
 def set_flicket_config():
     """
-    Updates the flicket application settings based on the values stored in the database.
+    Updates the flicket application settings based on the values stored in the database. The settings are read
+    from the cached copy, see FlicketConfig.cached.
     :return:
     """
-    config = FlicketConfig.query.first()
+    config = FlicketConfig.cached()
 
     app.config.update(
         posts_per_page=20,  # or whatever number you want
@@ -6,22 +6,24 @@
 import datetime
 
 from flask import flash, g
+from sqlalchemy import func
 
 from application import db
-from application.flicket.models.flicket_models import FlicketAction
+from application.flicket.models.flicket_models import FlicketAction, FlicketPost
 
 
 def add_action(ticket, action, data=None, recipient=None):
     """
+    Stages an action record in the session. It is saved with the rest of the change to the ticket, see
+    unit_of_work.
     :param ticket: ticket object 
     :param action: string
     :param data: dictionary
     :param recipient: user object
     :return:
     """
-    post_id = None
-    if ticket.posts:
-        post_id = ticket.posts[-1].id
+    # the latest post, without loading every post of the ticket.
+    post_id = db.session.query(func.max(FlicketPost.id)).filter(FlicketPost.ticket_id == ticket.id).scalar()
 
     new_action = FlicketAction(
         ticket=ticket,
@@ -29,11 +31,16 @@ def add_action(ticket, action, data=None, recipient=None):
         action=action,
         data=data,
         user=g.user,
+        user_name=g.user.name,
+        user_email=g.user.email,
         recipient=recipient,
+        recipient_name=recipient.name if recipient else None,
+        recipient_email=recipient.email if recipient else None,
         date=datetime.datetime.now()
     )
     db.session.add(new_action)
-    db.session.commit()
+    # an action changes the ticket page and its timeline, see conditional_get and action_timeline.
+    ticket.last_updated = new_action.date
 
 
 def is_ticket_closed(status):
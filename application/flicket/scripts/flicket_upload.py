@@ -13,10 +13,13 @@ from werkzeug.utils import secure_filename
 from application import app, db
 from application.flicket.models.flicket_models import FlicketUploads
 from application.flicket.models.flicket_user import FlicketUser
+from application.flicket.scripts.metrics import metrics
 from application.flicket_admin.models.flicket_config import FlicketConfig
 
 
 class UploadFile:
+    # label of the flicket_upload_bytes_total metric.
+    kind = 'attachment'
 
     def __init__(self, file):
         """
@@ -71,6 +74,7 @@ class UploadFile:
 
         if FlicketConfig.extension_allowed(self.file_name):
             self.file.save(self.target_file)
+            metrics.inc('flicket_upload_bytes_total', {'kind': self.kind}, os.path.getsize(self.target_file))
             return self.file
         else:
             # print('There was a problem with the files extension.')
@@ -78,6 +82,7 @@ class UploadFile:
 
 
 class UploadAvatar(UploadFile):
+    kind = 'avatar'
 
     def __init__(self, file, user):
         super().__init__(file)
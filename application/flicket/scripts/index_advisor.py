@@ -0,0 +1,116 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Runs EXPLAIN on the queries behind the index page, the ticket lists, subscriptions and the ticket timeline and
+finds the tables the database reads in full. Used by the "index-advisor" command.
+
+SQLite, MySQL / MariaDB and PostgreSQL plans are understood. Note that on a near empty database a planner may
+choose to scan a small table even when an index exists.
+"""
+
+import re
+
+from sqlalchemy import select, text
+
+from application import db
+from application.flicket.scripts.action_timeline import timeline_query
+from application.flicket.models.flicket_models import FlicketAction, FlicketHistory, FlicketPost, \
+    FlicketSubscription, FlicketTicket, FlicketUploads
+from application.flicket.scripts.ticket_query import TicketQuery
+
+# small tables of names looked up by the filters. Reading these in full is cheaper than using an index.
+lookup_tables = {'flicket_status', 'flicket_priorities', 'flicket_department', 'flicket_category'}
+
+
+def hot_queries(user_id=1, ticket_id=1, post_id=1, per_page=50):
+    """
+    Returns a list of (name, statement) for the queries run on every page view.
+    :param user_id: user id used for the user filters.
+    :param ticket_id: ticket id used for the ticket look ups.
+    :param post_id: post id used for the post look ups.
+    :param per_page:
+    :return: list
+    """
+    return [
+        ('index: open tickets by priority',
+         TicketQuery(status_id=1, priority_id=4).filter(FlicketTicket.date_added.isnot(None)).
+         select('ticketid_desc').limit(100)),
+        ('index: open ticket count', TicketQuery(status_id=1).count()),
+        ('tickets: first page', TicketQuery().select('priority_desc').limit(per_page)),
+        ('tickets: count by status', TicketQuery(status='Open').count()),
+        ('tickets: started by user', TicketQuery(started_id=user_id).select('priority_desc').limit(per_page)),
+        ('tickets: assigned to user', TicketQuery(assigned_id=user_id).select('priority_desc').limit(per_page)),
+        ('tickets: by date', TicketQuery().select('date_desc').limit(per_page)),
+        ('tickets: subscribed', TicketQuery(subscriber_id=user_id).select('priority_desc').limit(per_page)),
+        ('subscription: is subscribed',
+         select(FlicketSubscription.id).where(FlicketSubscription.user_id == user_id,
+                                              FlicketSubscription.ticket_id == ticket_id)),
+        ('subscription: subscribers', select(FlicketSubscription).where(FlicketSubscription.ticket_id == ticket_id)),
+        ('ticket: replies',
+         select(FlicketPost).where(FlicketPost.ticket_id == ticket_id).order_by(FlicketPost.date_added)),
+        ('ticket: timeline', timeline_query(ticket_id)),
+        ('ticket: post actions', select(FlicketAction).where(FlicketAction.post_id == post_id)),
+        ('ticket: uploads', select(FlicketUploads).where(FlicketUploads.topic_id == ticket_id)),
+        ('ticket: post uploads', select(FlicketUploads).where(FlicketUploads.posts_id == post_id)),
+        ('ticket: history', select(FlicketHistory).where(FlicketHistory.topic_id == ticket_id)),
+        ('post: history', select(FlicketHistory).where(FlicketHistory.post_id == post_id)),
+        ('user: post count', select(FlicketPost.id).where(FlicketPost.user_id == user_id)),
+    ]
+
+
+def explain(statement):
+    """
+    Returns the query plan of statement as a list of row dictionaries.
+    :param statement: sqlalchemy select.
+    :return: list
+    """
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    result = db.session.execute(text(prefix + sql))
+
+    return [dict(row._mapping) for row in result]
+
+
+def full_scans(plan, dialect_name):
+    """
+    Returns the names of the tables read in full according to plan, ignoring the lookup tables.
+    :param list plan: rows returned by explain.
+    :param str dialect_name:
+    :return: list
+    """
+    tables = []
+    for row in plan:
+        if dialect_name == 'sqlite':
+            # "SCAN flicket_topic" is a table scan, "SCAN flicket_topic USING INDEX ..." walks an index.
+            match = re.match(r'SCAN (?:TABLE )?(\w+)(.*)', row.get('detail', ''))
+            if match and 'USING' not in match.group(2):
+                tables.append(match.group(1))
+        elif dialect_name == 'mysql':
+            if row.get('type') == 'ALL':
+                tables.append(row.get('table'))
+        else:
+            for line in row.values():
+                match = re.search(r'Seq Scan on (\w+)', str(line))
+                if match:
+                    tables.append(match.group(1))
+
+    return [table for table in tables if table not in lookup_tables]
+
+
+def index_report(**kwargs):
+    """
+    Explains each hot query.
+    :param kwargs: see hot_queries.
+    :return: list of (name, plan, full scans)
+    """
+    dialect_name = db.engine.dialect.name
+    report = []
+    for name, statement in hot_queries(**kwargs):
+        plan = explain(statement)
+        report.append((name, plan, full_scans(plan, dialect_name)))
+
+    return report
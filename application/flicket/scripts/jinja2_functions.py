@@ -5,6 +5,17 @@ import datetime
 
 from flask import render_template
 
+from application.flicket.scripts.markdown_render import render_markdown
+
 
 def now_year():
     return datetime.datetime.now().strftime('%Y')
+
+
+def markdown(text):
+    """
+    The "markdown" template filter, see markdown_render.py.
+    :param str text: markdown source.
+    :return: Markup
+    """
+    return render_markdown(text)
@@ -0,0 +1,93 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+from collections import OrderedDict
+from threading import Lock
+import time
+
+from application.flicket.scripts.metrics import metrics
+
+
+class LRUCache:
+    """
+    A small thread safe in-process cache. When full the least recently used entry is dropped. Entries older than
+    ttl seconds are treated as missing, which bounds how long another worker's change can go unnoticed.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, name=None):
+        """
+        :param int maxsize: maximum number of entries.
+        :param ttl: seconds an entry is kept, None to keep it until evicted.
+        :param name: if given, hits and misses are counted in the flicket_cache_requests_total metric.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for key, or default if it is missing or has expired.
+        :param key:
+        :param default:
+        :return:
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if self.name:
+            metrics.inc('flicket_cache_requests_total',
+                        {'cache': self.name, 'result': 'miss' if entry is None else 'hit'})
+
+        return default if entry is None else entry[0]
+
+    def set(self, key, value):
+        """
+        Stores value for key, evicting the least recently used entry if the cache is full.
+        :param key:
+        :param value:
+        :return:
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Removes key from the cache.
+        :param key:
+        :return:
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_if(self, predicate):
+        """
+        Removes every entry for which predicate(key, value) is true.
+        :param predicate:
+        :return:
+        """
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(key, value)]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Empties the cache.
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,58 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Markdown rendering.
+
+Tickets and posts store their rendered html in content_html, written whenever their content is set (see the
+content listeners in flicket_models.py), so the ticket page does not parse markdown. Text without stored html, for
+example rows written before the column existed or edit history, is rendered through a cache keyed by the hash of the
+text, so a popular thread is only parsed once per worker. "flask render-content-html" fills in the stored html of
+older rows.
+"""
+
+import hashlib
+import threading
+
+from markupsafe import Markup
+
+from application.flicket.scripts.lru_cache import LRUCache
+
+# content hash -> rendered html.
+markdown_cache = LRUCache(maxsize=2048, name='markdown')
+
+# one converter per thread, converters are not thread safe.
+_converters = threading.local()
+
+
+def _convert(text):
+    converter = getattr(_converters, 'converter', None)
+    if converter is None:
+        # imported on first use, it is not needed to start the application.
+        import markdown
+        converter = _converters.converter = markdown.Markdown()
+
+    return converter.reset().convert(text)
+
+
+def render_markdown(text, cache=True):
+    """
+    Renders markdown text to html.
+    :param str text: markdown source.
+    :param bool cache: look the text up in, and add it to, markdown_cache.
+    :return: Markup
+    """
+    if not text:
+        return Markup('')
+    if not cache:
+        return Markup(_convert(text))
+
+    key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    html = markdown_cache.get(key)
+    if html is None:
+        html = _convert(text)
+        markdown_cache.set(key, html)
+
+    return Markup(html)
@@ -0,0 +1,389 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Prometheus metrics.
+
+Each worker process counts into the in-memory registry below: request latency per endpoint, statements and database
+time per endpoint, email sends and their latency, upload bytes and cache hits. Recording a value only takes a
+short lock, nothing is written on the request path.
+
+With METRICS_DIR set, a worker writes its values to METRICS_DIR/<pid>-<start time>.json at most every
+METRICS_FLUSH_INTERVAL seconds (after a request) and the /metrics view adds up the files of every worker, so that a
+scrape answered by any worker sees the whole server. The start time keeps a new worker that is given the pid of a
+stopped one from overwriting its file. When a worker first writes its file it folds the files of the workers that
+are no longer running into dead.json, so the directory does not grow with every restart and the counters never go
+backwards; empty the directory when the server is restarted. Without METRICS_DIR only the worker answering the scrape
+is reported. The email queue depth is read from the outbox table when scraped, see
+application/flicket/scripts/email_outbox.py.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+from threading import Lock
+import time
+
+from flask import g, request
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# request latency buckets, in seconds.
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# file holding the values of the workers that have stopped, see compact.
+dead_file_name = 'dead.json'
+
+# name -> (type, help, histogram buckets).
+metric_types = {
+    'flicket_http_requests_total': ('counter', 'Requests handled, by endpoint, method and status.', None),
+    'flicket_http_request_duration_seconds': ('histogram', 'Request latency by endpoint.', latency_buckets),
+    'flicket_db_queries_total': ('counter', 'SQL statements made by requests, by endpoint.', None),
+    'flicket_db_query_duration_seconds_total': ('counter', 'Time spent in SQL statements by requests, by endpoint.',
+                                                None),
+    'flicket_email_queue_depth': ('gauge', 'Emails in the outbox, by status (pending or failed).', None),
+    'flicket_email_send_duration_seconds': ('histogram', 'Time taken to send an email, by result.', latency_buckets),
+    'flicket_emails_total': ('counter', 'Outbox send attempts, by result (sent, retry or failed).', None),
+    'flicket_upload_bytes_total': ('counter', 'Bytes of uploaded files saved, by kind.', None),
+    'flicket_cache_requests_total': ('counter', 'Cache lookups, by cache and result (hit or miss).', None),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+class Metrics:
+    """
+    The values recorded by this process.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Empties the registry. Only called on start up and in a newly forked process, where another thread may have
+        held the locks.
+        :return:
+        """
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._last_flush = 0
+        # unique to this process, a later process given the same pid writes another file.
+        self.file_name = '{}-{}.json'.format(os.getpid(), int(time.time() * 1000))
+        self.counters = {}
+        self.gauges = {}
+        # key -> [bucket counts..., +Inf bucket count, sum, count]
+        self.histograms = {}
+
+    def inc(self, name, labels=None, value=1):
+        """
+        Adds value to a counter.
+        :param str name:
+        :param dict labels:
+        :param value:
+        :return:
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge_add(self, name, value, labels=None):
+        """
+        Adds value, which may be negative, to a gauge.
+        :param str name:
+        :param value:
+        :param dict labels:
+        :return:
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """
+        Records value in a histogram.
+        :param str name:
+        :param value:
+        :param dict labels:
+        :return:
+        """
+        buckets = metric_types[name][2]
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(buckets) + 3)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(buckets)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        """
+        :return: dict of the recorded values that can be written as json.
+        """
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, dict(labels), value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, dict(labels), list(values)]
+                               for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self, directory, interval=0):
+        """
+        Writes snapshot to directory/file_name if the last write is older than interval seconds. The first write
+        also folds the files of stopped processes into dead.json, see compact.
+        :param str directory:
+        :param interval: seconds.
+        :return:
+        """
+        # another thread of this process is writing the file already.
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if interval and now - self._last_flush < interval:
+                return
+            if not self._last_flush:
+                compact(directory)
+            self._last_flush = now
+
+            _write(os.path.join(directory, self.file_name), self.snapshot())
+        finally:
+            self._flush_lock.release()
+
+
+metrics = Metrics()
+
+# a forked worker starts with an empty registry rather than a copy of its parent's.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics.reset)
+
+
+def _write(path, snapshot):
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    # readers see either the previous file or this one, never a partly written one.
+    os.replace(temp_path, path)
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _process_file_names(directory):
+    return [file_name for file_name in os.listdir(directory)
+            if file_name.endswith('.json') and file_name != dead_file_name]
+
+
+def _is_running(file_name):
+    try:
+        pid = int(file_name.split('-')[0])
+    except ValueError:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+@contextmanager
+def _directory_lock(directory, shared=False):
+    # processes only, see compact.
+    if fcntl is None:
+        yield
+        return
+
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def compact(directory):
+    """
+    Folds the files of the processes that are no longer running into dead.json and removes them. dead.json lists
+    the files it holds, so they are not counted twice if the process stops before removing them. Only done where
+    processes can be checked and files locked (not on Windows).
+    :param str directory:
+    :return: number of files folded.
+    """
+    if fcntl is None:
+        return 0
+
+    with _directory_lock(directory):
+        dead = _read(os.path.join(directory, dead_file_name)) or {}
+        merged = set(dead.get('merged', []))
+        file_names = _process_file_names(directory)
+        # left by a process that stopped after writing dead.json, they are counted there already.
+        leftover = [file_name for file_name in file_names if file_name in merged]
+        stopped = [file_name for file_name in file_names
+                   if file_name not in merged and not _is_running(file_name)]
+
+        if stopped:
+            snapshots = [dead] if dead else []
+            snapshots += [snapshot for snapshot in (_read(os.path.join(directory, file_name))
+                                                    for file_name in stopped) if snapshot is not None]
+            totals = _add_up(snapshots)
+            snapshot = {kind: [[name, dict(labels), value] for (name, labels), value in totals[kind].items()]
+                        for kind in totals}
+            # files already removed are forgotten.
+            snapshot['merged'] = sorted(set(leftover) | set(stopped))
+            _write(os.path.join(directory, dead_file_name), snapshot)
+
+        for file_name in leftover + stopped:
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+
+    return len(stopped)
+
+
+def _add_up(snapshots):
+    totals = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    for snapshot in snapshots:
+        for kind in ('counters', 'gauges'):
+            for name, labels, value in snapshot.get(kind, []):
+                key = _key(name, labels)
+                totals[kind][key] = totals[kind].get(key, 0) + value
+        for name, labels, values in snapshot.get('histograms', []):
+            key = _key(name, labels)
+            total = totals['histograms'].setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+
+    return totals
+
+
+def collect(directory=None):
+    """
+    Adds up the values written by every process to directory, or returns this process's values if directory is None.
+    :param directory:
+    :return: dict of key -> value for counters and gauges, key -> list for histograms.
+    """
+    if not directory:
+        return _add_up([metrics.snapshot()])
+
+    metrics.flush(directory)
+    snapshots = []
+    # not while a file is being folded into dead.json, it would be missed and the counters would go down.
+    with _directory_lock(directory, shared=True):
+        dead = _read(os.path.join(directory, dead_file_name))
+        merged = set()
+        if dead is not None:
+            snapshots.append(dead)
+            merged = set(dead.get('merged', []))
+        for file_name in _process_file_names(directory):
+            if file_name in merged:
+                continue
+            snapshot = _read(os.path.join(directory, file_name))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+
+    return _add_up(snapshots)
+
+
+def _format_labels(labels, extra=None):
+    labels = list(labels) + list(extra or [])
+    if not labels:
+        return ''
+    escaped = ('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+               for name, value in labels)
+
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(totals):
+    """
+    :param totals: see collect.
+    :return: str in the Prometheus text exposition format.
+    """
+    samples = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for (name, labels), value in totals[kind].items():
+            samples.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(samples):
+        metric_type, description, buckets = metric_types.get(name, ('untyped', '', None))
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for labels, value in sorted(samples[name]):
+            if metric_type != 'histogram':
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, [('le', bound)]), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), _format_value(value[-2])))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), _format_value(value[-1])))
+
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """
+    Registers the request hooks. Call after init_query_stats: after_request hooks run in reverse order, so the
+    request's statements are still in g.sql_queries when they are counted here.
+    :param app:
+    :return:
+    """
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_metrics(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+
+        endpoint = request.endpoint or 'none'
+        metrics.observe('flicket_http_request_duration_seconds', time.perf_counter() - start, {'endpoint': endpoint})
+        metrics.inc('flicket_http_requests_total',
+                    {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)})
+
+        queries = g.get('sql_queries')
+        if queries is not None:
+            metrics.inc('flicket_db_queries_total', {'endpoint': endpoint}, queries.count)
+            metrics.inc('flicket_db_query_duration_seconds_total', {'endpoint': endpoint}, queries.total_time)
+
+        if directory:
+            metrics.flush(directory, app.config.get('METRICS_FLUSH_INTERVAL', 1))
+
+        return response
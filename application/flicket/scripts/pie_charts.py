@@ -5,44 +5,38 @@
 
 import json
 
-import plotly
-
-from application.flicket.models.flicket_models import FlicketCategory
 from application.flicket.models.flicket_models import FlicketDepartment
 from application.flicket.models.flicket_models import FlicketStatus
-from application.flicket.models.flicket_models import FlicketTicket
-
+from application.flicket.scripts.ticket_stats import count_tickets_by
 
-def count_department_tickets(department, status):
-    query = FlicketTicket.query. \
-        join(FlicketCategory). \
-        join(FlicketStatus). \
-        join(FlicketDepartment). \
-        filter(FlicketDepartment.department == department). \
-        filter(FlicketStatus.status == status)
 
-    return query.count()
+def count_department_status_tickets():
+    """
+    Counts the tickets of every department and status from the flicket_ticket_stats rollup.
+    :return: dict of (department_id, status_id) -> number of tickets.
+    """
+    return count_tickets_by('department_id', 'status_id')
 
 
 def create_pie_chart_dict():
     """
-
+    Builds one pie chart of tickets by status for each department. Three queries are made whatever the number of
+    departments and statuses.
     :return:
     """
 
-    statii = FlicketStatus.query
-    departments = FlicketDepartment.query
+    statii = FlicketStatus.query.all()
+    departments = FlicketDepartment.query.all()
+    counts = count_department_status_tickets()
 
     graphs = []
 
     for department in departments:
 
         graph_title = department.department
-        graph_labels = []
-        graph_values = []
-        for status in statii:
-            graph_labels.append(status.status)
-            graph_values.append(count_department_tickets(graph_title, status.status))
+        graph_labels = [status.status for status in statii]
+        # int: MySQL returns SUM() as a Decimal, which json can not write.
+        graph_values = [int(counts.get((department.id, status.id), 0)) for status in statii]
 
         # append graphs if have values.
         if any(graph_values):
@@ -75,6 +69,7 @@ def create_pie_chart_dict():
             )
 
     ids = [f'Graph {i}' for i, _ in enumerate(graphs)]
-    graph_json = json.dumps(graphs, cls=plotly.utils.PlotlyJSONEncoder)
+    # the charts are plain dicts, lists, strings and numbers so the standard encoder writes what plotly.js reads.
+    graph_json = json.dumps(graphs)
 
     return ids, graph_json
@@ -0,0 +1,204 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Per request SQL instrumentation.
+
+SQLAlchemy engine events time every statement run while a request is handled. For each request the number of
+statements, the total database time, the slowest statements and the statement shapes run several times (the
+signature of an N+1 query) are recorded:
+
+* in debug mode, or with QUERY_STATS_HEADERS, as X-Query-Count, X-Query-Time and X-Query-Repeated response headers.
+* in a rolling list of recent requests shown on the admin "Query Stats" page.
+* with QUERY_BUDGET_STRICT set, a request making more statements than its endpoint's budget raises
+  QueryBudgetExceeded. scripts/check_query_budgets.py runs the hot pages in this mode.
+
+Other modules can be told about every statement through statement_listeners, see slow_query_log.py.
+"""
+
+from collections import Counter, deque
+import datetime
+import re
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# endpoint -> maximum number of statements per request. Measured on a development database with 200 tickets:
+# index 10, ticket lists 7, ticket_view 10 whatever the number of replies (including the conditional get version and
+# an uncached timeline). A page whose count grows with the number of rows it shows will go over these.
+query_budgets = {
+    'flicket_bp.index': 15,
+    'flicket_bp.tickets': 12,
+    'flicket_bp.my_tickets': 12,
+    'flicket_bp.subscribed': 12,
+    'flicket_bp.ticket_view': 12,
+    'admin_bp.tickets': 15,
+    'bp_api.get_tickets': 10,
+}
+
+# summaries of the most recent requests, newest last.
+recent_requests = deque(maxlen=200)
+
+# functions called with (connection, statement, parameters, duration, executemany) after every statement, for
+# example the slow query log.
+statement_listeners = []
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised in strict mode when a request makes more statements than its budget.
+    """
+
+
+def statement_shape(statement):
+    """
+    Returns statement with literals and IN lists replaced by ? so that statements differing only in their values
+    compare equal.
+    :param str statement:
+    :return: str
+    """
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'\b\d+(?:\.\d+)?\b', '?', shape)
+    shape = re.sub(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)', '(?)', shape)
+
+    return re.sub(r'\s+', ' ', shape).strip()
+
+
+class RequestQueries:
+    """
+    The statements run during one request.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.statements = []
+
+    def add(self, statement, duration):
+        self.statements.append((statement, duration))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.statements)
+
+    def slowest(self, n=5):
+        """
+        :param int n:
+        :return: list of (statement, seconds), slowest first.
+        """
+        return sorted(self.statements, key=lambda statement: statement[1], reverse=True)[:n]
+
+    def repeated(self, threshold):
+        """
+        :param int threshold: number of runs from which a shape counts as repeated.
+        :return: list of (statement shape, number of runs), most runs first.
+        """
+        shapes = Counter(statement_shape(statement) for statement, _ in self.statements)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def summary(self, threshold, status_code=None):
+        """
+        :param int threshold: see repeated.
+        :param status_code: response status.
+        :return: dict
+        """
+        return {
+            'date': datetime.datetime.now(),
+            'endpoint': self.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status_code': status_code,
+            'count': self.count,
+            'time': self.total_time,
+            'slowest': self.slowest(),
+            'repeated': self.repeated(threshold),
+        }
+
+
+def endpoint_summaries():
+    """
+    Aggregates recent_requests by endpoint.
+    :return: list of dict, the endpoint with the most statements per request first.
+    """
+    endpoints = {}
+    for summary in list(recent_requests):
+        data = endpoints.setdefault(summary['endpoint'], {'endpoint': summary['endpoint'], 'requests': 0,
+                                                           'count': 0, 'max_count': 0, 'time': 0, 'repeated': 0,
+                                                           'budget': query_budgets.get(summary['endpoint'])})
+        data['requests'] += 1
+        data['count'] += summary['count']
+        data['max_count'] = max(data['max_count'], summary['count'])
+        data['time'] += summary['time']
+        data['repeated'] += 1 if summary['repeated'] else 0
+
+    for data in endpoints.values():
+        data['mean_count'] = data['count'] / data['requests']
+        data['mean_time'] = data['time'] / data['requests']
+
+    return sorted(endpoints.values(), key=lambda data: data['mean_count'], reverse=True)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_stats_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_stats_start'].pop()
+    for listener in statement_listeners:
+        listener(conn, statement, parameters, duration, executemany)
+    if has_request_context():
+        queries = g.get('sql_queries')
+        if queries is not None:
+            queries.add(statement, duration)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # after_cursor_execute is not called for a failed statement.
+    if context.connection is not None and context.connection.info.get('query_stats_start'):
+        context.connection.info['query_stats_start'].pop()
+
+
+def init_query_stats(app):
+    """
+    Registers the request hooks. Call before the views are imported so that their before_request queries are
+    counted.
+    :param app:
+    :return:
+    """
+
+    @app.before_request
+    def start_query_stats():
+        g.sql_queries = RequestQueries(request.endpoint)
+
+    @app.after_request
+    def record_query_stats(response):
+        queries = g.pop('sql_queries', None)
+        if queries is None:
+            return response
+
+        threshold = app.config.get('QUERY_REPEAT_THRESHOLD', 5)
+        summary = queries.summary(threshold, response.status_code)
+        recent_requests.append(summary)
+
+        if app.debug or app.config.get('QUERY_STATS_HEADERS'):
+            response.headers['X-Query-Count'] = str(summary['count'])
+            response.headers['X-Query-Time'] = '{:.1f}ms'.format(summary['time'] * 1000)
+            response.headers['X-Query-Repeated'] = str(len(summary['repeated']))
+
+        budget = query_budgets.get(queries.endpoint)
+        if app.config.get('QUERY_BUDGET_STRICT') and budget is not None and queries.count > budget:
+            raise QueryBudgetExceeded('{} made {} statements, its budget is {}. Repeated: {}'.format(
+                queries.endpoint, queries.count, budget,
+                '; '.join('{} x {}'.format(count, shape) for shape, count in summary['repeated']) or 'none'))
+
+        return response
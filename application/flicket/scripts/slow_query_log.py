@@ -0,0 +1,151 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Slow query log.
+
+Statements taking longer than SLOW_QUERY_THRESHOLD seconds are written, one JSON object per line, to
+SLOW_QUERY_LOG. The log is rotated at SLOW_QUERY_LOG_MAX_BYTES, keeping SLOW_QUERY_LOG_BACKUPS old files. Each
+entry holds the statement, its shape (see query_stats.statement_shape), the bind parameters, the duration, the
+endpoint and, for SELECT statements, the database's plan (SQLite EXPLAIN QUERY PLAN, PostgreSQL / MySQL EXPLAIN).
+
+The "slow-queries" command summarises the log by statement shape.
+"""
+
+import datetime
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+
+from flask import current_app, has_app_context, has_request_context, request
+
+from application.flicket.scripts.query_stats import statement_listeners, statement_shape
+
+# log file path -> logger.
+_loggers = {}
+
+
+def _logger(path, max_bytes, backups):
+    if path not in _loggers:
+        logger = logging.getLogger('flicket.slow_queries.{}'.format(path))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        _loggers[path] = logger
+
+    return _loggers[path]
+
+
+def explain(conn, statement, parameters):
+    """
+    Returns the plan of a SELECT statement as a list of rows. The plan is read on a DBAPI cursor of the same
+    connection so that it is not itself timed or logged.
+    :param conn: sqlalchemy connection the statement ran on.
+    :param str statement: compiled statement.
+    :param parameters: its bind parameters.
+    :return: list of dict, or None if the statement can not be explained.
+    """
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except Exception as e:
+        return [{'error': str(e)}]
+    finally:
+        cursor.close()
+
+
+def log_slow_query(conn, statement, parameters, duration, executemany):
+    """
+    Writes statement to the slow query log if it took longer than SLOW_QUERY_THRESHOLD. Called by the query_stats
+    engine event for every statement.
+    :param conn: sqlalchemy connection.
+    :param str statement:
+    :param parameters:
+    :param float duration: seconds.
+    :param bool executemany:
+    :return:
+    """
+    if not has_app_context():
+        return
+    config = current_app.config
+    threshold = config.get('SLOW_QUERY_THRESHOLD')
+    path = config.get('SLOW_QUERY_LOG')
+    if threshold is None or not path or duration < threshold:
+        return
+
+    entry = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'duration': round(duration, 6),
+        'endpoint': request.endpoint if has_request_context() else None,
+        'shape': statement_shape(statement),
+        'statement': statement,
+        'parameters': parameters,
+        'plan': None if executemany else explain(conn, statement, parameters),
+    }
+
+    logger = _logger(path, config.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024),
+                     config.get('SLOW_QUERY_LOG_BACKUPS', 5))
+    logger.info(json.dumps(entry, default=str))
+
+
+statement_listeners.append(log_slow_query)
+
+
+def read_slow_queries(path):
+    """
+    Yields the entries of the slow query log, oldest rotated file first.
+    :param str path:
+    :return: generator of dict.
+    """
+    backups = []
+    i = 1
+    while os.path.exists('{}.{}'.format(path, i)):
+        backups.append('{}.{}'.format(path, i))
+        i += 1
+
+    for file_name in list(reversed(backups)) + [path]:
+        if not os.path.exists(file_name):
+            continue
+        with open(file_name, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+
+def summarize_slow_queries(entries):
+    """
+    Groups slow query log entries by statement shape.
+    :param entries: see read_slow_queries.
+    :return: list of dict, the shape with the most total time first.
+    """
+    shapes = {}
+    for entry in entries:
+        data = shapes.setdefault(entry['shape'], {'shape': entry['shape'], 'count': 0, 'total': 0, 'max': 0,
+                                                  'endpoints': set(), 'last': None, 'plan': None})
+        data['count'] += 1
+        data['total'] += entry['duration']
+        data['max'] = max(data['max'], entry['duration'])
+        if entry.get('endpoint'):
+            data['endpoints'].add(entry['endpoint'])
+        data['last'] = entry['date']
+        data['plan'] = entry.get('plan') or data['plan']
+
+    for data in shapes.values():
+        data['mean'] = data['total'] / data['count']
+
+    return sorted(shapes.values(), key=lambda data: data['total'], reverse=True)
@@ -7,16 +7,17 @@
 from application import db
 from application.flicket.models.flicket_models import FlicketSubscription
 from application.flicket.scripts.flicket_functions import add_action
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 
 def subscribe_user(ticket, user):
     if not ticket.is_subscribed(user):
         # subscribe user to ticket
         # noinspection PyArgumentList
-        subscribe = FlicketSubscription(user=user, ticket=ticket)
-        add_action(ticket, 'subscribe', recipient=user)
-        db.session.add(subscribe)
-        db.session.commit()
+        with unit_of_work():
+            subscribe = FlicketSubscription(user=user, ticket=ticket)
+            add_action(ticket, 'subscribe', recipient=user)
+            db.session.add(subscribe)
         return True
 
     return False
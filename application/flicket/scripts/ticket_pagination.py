@@ -0,0 +1,261 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+import base64
+import binascii
+import datetime
+import json
+
+from sqlalchemy import String, and_, or_, tuple_, type_coerce
+
+from application import db
+
+# sorts that support cursor (keyset) pagination: sort name -> (flicket_topic column, descending).
+# names are those used by FlicketTicket.sorted_tickets plus the aliases used by the html ticket views.
+cursor_sorts = {
+    'priority': ('ticket_priority_id', False),
+    'priority_asc': ('ticket_priority_id', False),
+    'priority_desc': ('ticket_priority_id', True),
+    'last_updated': ('last_updated', False),
+    'last_updated_desc': ('last_updated', True),
+    'addedon': ('date_added', False),
+    'date_asc': ('date_added', False),
+    'addedon_desc': ('date_added', True),
+    'date_desc': ('date_added', True),
+    'title': ('title', False),
+    'title_asc': ('title', False),
+    'title_desc': ('title', True),
+    'ticketid': ('id', False),
+    'ticketid_desc': ('id', True),
+}
+
+default_cursor_sort = 'ticketid_desc'
+
+
+class TicketPagination:
+    """
+    Pagination object for the ticket list views.
+
+    Mirrors the attributes of flask_sqlalchemy's Pagination used by flicket_tickets_pag.html but is built from
+    a single page of rows and a separately counted total, so only per_page rows are ever fetched.
+    """
+
+    is_keyset = False
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = (total + per_page - 1) // per_page
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=5, right_edge=2):
+        last = 0
+        for num in range(1, self.pages + 1):
+            if num <= left_edge or (self.page - left_current - 1 < num < self.page + right_current) or \
+                    num > self.pages - right_edge:
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+
+def paginate_ticket_query(query, count_query, page, per_page, row_class=dict):
+    """
+    Runs a ticket list query one page at a time.
+
+    The total comes from count_query, then the page itself is fetched with LIMIT / OFFSET so the database never
+    returns rows that will not be displayed.
+
+    :param query: ordered select. Should end in a unique column so pages are stable.
+    :param count_query: select returning the number of rows in query.
+    :param int page: 1 based page number.
+    :param int per_page: rows per page.
+    :param row_class: callable used to build each item from the row dictionary.
+    :return: TicketPagination
+    """
+    page = max(page, 1)
+
+    total = db.session.execute(count_query).scalar() or 0
+
+    result = db.session.execute(query.limit(per_page).offset((page - 1) * per_page))
+    items = [row_class(dict(row._mapping)) for row in result]
+
+    return TicketPagination(items, page, per_page, total)
+
+
+class TicketKeysetPagination:
+    """
+    Pagination object for cursor (keyset) mode.
+
+    There are no page numbers, only cursors pointing either side of the current rows.
+    """
+
+    is_keyset = True
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(sort, key, ticket_id, backwards=False):
+    """
+    Returns an url safe cursor holding the sort, the sort key and id of a row.
+
+    :param str sort: sort name, see cursor_sorts.
+    :param key: value of the sort column for the row.
+    :param int ticket_id: ticket id of the row.
+    :param bool backwards: True if the cursor points to the rows before this one.
+    :return str:
+    """
+    if isinstance(key, datetime.datetime):
+        key = {'dt': key.isoformat(' ')}
+    payload = json.dumps([sort, key, ticket_id, int(backwards)], separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Reverses encode_cursor. Raises ValueError if the cursor can not be read.
+
+    :param str cursor:
+    :return: tuple(sort, key, ticket_id, backwards)
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort, key, ticket_id, backwards = json.loads(payload.decode('utf-8'))
+        if isinstance(key, dict):
+            key = datetime.datetime.fromisoformat(key['dt'])
+        ticket_id = int(ticket_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, ValueError):
+        raise ValueError(f'Invalid cursor "{cursor}".')
+
+    if sort not in cursor_sorts:
+        raise ValueError(f'Invalid cursor "{cursor}".')
+
+    return sort, key, ticket_id, bool(backwards)
+
+
+def nulls_sort_first():
+    """
+    :return: True if the database puts NULL before every value in ascending order, as SQLite and MySQL do.
+    """
+    return db.engine.dialect.name not in ('postgresql', 'oracle')
+
+
+def keyset_clause(key_column, id_column, key, last_id, scan_up):
+    """
+    Returns the where clause selecting the rows after (key, last_id) in the order (key_column, id_column).
+
+    A row value comparison never matches a NULL key, so the rows with a NULL sort key, which the database sorts
+    either before or after all others, are added or selected explicitly. The ORDER BY stays on the bare columns
+    so the (column, id) indexes can still be range scanned.
+
+    :param key_column: the sort column.
+    :param id_column: the id column.
+    :param key: sort key of the cursor row, may be None.
+    :param int last_id: id of the cursor row.
+    :param bool scan_up: True for the rows with larger keys, False for the rows with smaller keys.
+    :return:
+    """
+    # the NULL keys lie beyond every other key in the direction of the scan.
+    nulls_ahead = scan_up != nulls_sort_first()
+
+    if key is None:
+        clause = and_(key_column.is_(None), id_column > last_id if scan_up else id_column < last_id)
+        return clause if nulls_ahead else or_(clause, key_column.isnot(None))
+
+    keys = tuple_(key_column, id_column)
+    clause = keys > (key, last_id) if scan_up else keys < (key, last_id)
+    return or_(clause, key_column.is_(None)) if nulls_ahead else clause
+
+
+def keyset_ticket_query(query, sort, key_column, id_column, per_page, cursor=None, row_class=dict):
+    """
+    Runs a ticket list query in cursor (keyset) mode.
+
+    Rows after (or before) the cursor are found with a row value comparison on (sort column, id) so the database
+    can range scan an index instead of skipping every earlier row as OFFSET does, see keyset_clause. No COUNT(*)
+    is made.
+
+    An invalid cursor, or one made for another sort, returns the first page.
+
+    :param query: unordered select.
+    :param str sort: sort name, one of cursor_sorts.
+    :param key_column: the sort column.
+    :param id_column: the ticket id column.
+    :param int per_page: rows per page.
+    :param str cursor: cursor from a previous page.
+    :param row_class: callable used to build each item from the row dictionary.
+    :return: TicketKeysetPagination
+    """
+    column_name, descending = cursor_sorts[sort]
+    same_column = column_name == 'id'
+    # compare and return the key as stored, so it round trips through the cursor without datetime parsing.
+    key_column = type_coerce(key_column, String)
+
+    backwards = False
+    if cursor:
+        try:
+            cursor_sort, key, last_id, backwards = decode_cursor(cursor)
+        except ValueError:
+            cursor_sort = None
+        if cursor_sort == sort:
+            scan_up = descending == backwards
+            if same_column:
+                query = query.where(id_column > last_id if scan_up else id_column < last_id)
+            else:
+                query = query.where(keyset_clause(key_column, id_column, key, last_id, scan_up))
+        else:
+            cursor, backwards = None, False
+
+    if descending != backwards:
+        order = [id_column.desc()] if same_column else [key_column.desc(), id_column.desc()]
+    else:
+        order = [id_column] if same_column else [key_column, id_column]
+
+    # fetch one extra row to find out if there is anything beyond this page.
+    query = query.add_columns(key_column.label('cursor_key')).order_by(*order).limit(per_page + 1)
+    rows = [dict(row._mapping) for row in db.session.execute(query)]
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor, prev_cursor = None, None
+    if rows:
+        if more or backwards:
+            next_cursor = encode_cursor(sort, rows[-1]['cursor_key'], rows[-1]['id'])
+        if (more and backwards) or (cursor and not backwards):
+            prev_cursor = encode_cursor(sort, rows[0]['cursor_key'], rows[0]['id'], backwards=True)
+
+    return TicketKeysetPagination([row_class(row) for row in rows], per_page, next_cursor, prev_cursor)
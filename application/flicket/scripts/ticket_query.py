@@ -0,0 +1,272 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Ticket query builder shared by the html ticket views, the index page, FlicketTicket.query_tickets and the csv
+export.
+
+Filter values are always bound parameters, so a given combination of filters compiles to one statement shape
+which SQLAlchemy caches and the database driver can re-use.
+"""
+
+from sqlalchemy import String, func, or_, select, type_coerce
+from sqlalchemy.orm import aliased
+
+from application import db
+from application.flicket.models.flicket_models import FlicketCategory, FlicketDepartment, FlicketPost, \
+    FlicketPriority, FlicketStatus, FlicketSubscription, FlicketTicket
+from application.flicket.models.flicket_user import FlicketUser
+from application.flicket.scripts.ticket_pagination import cursor_sorts, keyset_ticket_query, paginate_ticket_query
+from application.flicket.scripts.ticket_search import search_match
+
+# reply_count and posts_hours are stored on the ticket, see FlicketTicket.update_post_totals.
+num_replies = func.coalesce(FlicketTicket.reply_count, 0)
+total_hours = func.coalesce(FlicketTicket.hours, 0) + func.coalesce(FlicketTicket.posts_hours, 0)
+
+started_name = select(FlicketUser.name).where(FlicketUser.id == FlicketTicket.started_id).scalar_subquery()
+assigned_name = select(FlicketUser.name).where(FlicketUser.id == FlicketTicket.assigned_id).scalar_subquery()
+department_name = select(FlicketDepartment.department). \
+    join(FlicketCategory, FlicketCategory.department_id == FlicketDepartment.id). \
+    where(FlicketCategory.id == FlicketTicket.category_id).scalar_subquery()
+category_name = select(FlicketCategory.category).where(FlicketCategory.id == FlicketTicket.category_id). \
+    scalar_subquery()
+
+# sort name -> ORDER BY clauses. Every sort ends on the ticket id so pages are stable.
+# priority_asc, date_asc, date_desc and title_asc are the names previously used by the html ticket views.
+ticket_sorts = {
+    'priority': (FlicketTicket.ticket_priority_id, FlicketTicket.id),
+    'priority_asc': (FlicketTicket.ticket_priority_id, FlicketTicket.id),
+    'priority_desc': (FlicketTicket.ticket_priority_id.desc(), FlicketTicket.id.desc()),
+    'title': (FlicketTicket.title, FlicketTicket.id),
+    'title_asc': (FlicketTicket.title, FlicketTicket.id),
+    'title_desc': (FlicketTicket.title.desc(), FlicketTicket.id.desc()),
+    'ticketid': (FlicketTicket.id,),
+    'ticketid_desc': (FlicketTicket.id.desc(),),
+    'addedby': (started_name, FlicketTicket.id),
+    'addedby_desc': (started_name.desc(), FlicketTicket.id),
+    'addedon': (FlicketTicket.date_added, FlicketTicket.id),
+    'date_asc': (FlicketTicket.date_added, FlicketTicket.id),
+    'addedon_desc': (FlicketTicket.date_added.desc(), FlicketTicket.id.desc()),
+    'date_desc': (FlicketTicket.date_added.desc(), FlicketTicket.id.desc()),
+    'last_updated': (FlicketTicket.last_updated, FlicketTicket.id),
+    'last_updated_desc': (FlicketTicket.last_updated.desc(), FlicketTicket.id.desc()),
+    'replies': (num_replies, FlicketTicket.id),
+    'replies_desc': (num_replies.desc(), FlicketTicket.id),
+    'department_category': (department_name, category_name, FlicketTicket.id),
+    'department_category_desc': (department_name.desc(), category_name.desc(), FlicketTicket.id),
+    'status': (FlicketTicket.status_id, FlicketTicket.id),
+    'status_desc': (FlicketTicket.status_id.desc(), FlicketTicket.id),
+    'assigned': (assigned_name, FlicketTicket.id),
+    'assigned_desc': (assigned_name.desc(), FlicketTicket.id),
+    'time': (total_hours, FlicketTicket.id),
+    'time_desc': (total_hours.desc(), FlicketTicket.id),
+}
+
+default_sort = 'ticketid_desc'
+
+# orders a content search by how well each ticket matches, see TicketQuery.select.
+relevance_sort = 'relevance'
+
+
+def ticket_order(sort):
+    """
+    Returns the ORDER BY clauses for sort. Unknown sorts are ordered by descending ticket id.
+    :param str sort:
+    :return: tuple
+    """
+    return ticket_sorts.get(sort, ticket_sorts[default_sort])
+
+
+def ticket_filters(status=None, department=None, category=None, user_id=None, assigned_id=None, created_id=None,
+                   content=None, started_id=None, subscriber_id=None, status_id=None, priority_id=None):
+    """
+    Returns the WHERE clauses for the given filters. Filters that are None or empty are ignored.
+
+    Look ups by name are IN sub-queries on the ticket's own foreign keys so the clauses can be applied to any
+    query against flicket_topic, with or without joins.
+
+    :param str status: status name.
+    :param str department: department name.
+    :param str category: category name.
+    :param user_id: tickets started by or assigned to this user.
+    :param assigned_id: tickets assigned to this user.
+    :param created_id: tickets started by this user.
+    :param str content: text searched for in the title, content and replies. Uses the full text index when there
+        is one, see ticket_search.
+    :param started_id: tickets started by this user. Used to restrict users to their own tickets.
+    :param subscriber_id: tickets this user is subscribed to.
+    :param status_id:
+    :param priority_id:
+    :return: list
+    """
+    clauses = []
+
+    if status:
+        clauses.append(FlicketTicket.status_id.in_(
+            select(FlicketStatus.id).where(FlicketStatus.status == status).correlate(None)))
+    if status_id:
+        clauses.append(FlicketTicket.status_id == int(status_id))
+    if priority_id:
+        clauses.append(FlicketTicket.ticket_priority_id == int(priority_id))
+    if department:
+        clauses.append(FlicketTicket.category_id.in_(
+            select(FlicketCategory.id).
+            join(FlicketDepartment, FlicketCategory.department_id == FlicketDepartment.id).
+            where(FlicketDepartment.department == department).correlate(None)))
+    if category:
+        clauses.append(FlicketTicket.category_id.in_(
+            select(FlicketCategory.id).where(FlicketCategory.category == category).correlate(None)))
+    if user_id:
+        clauses.append(or_(FlicketTicket.assigned_id == int(user_id), FlicketTicket.started_id == int(user_id)))
+    if assigned_id:
+        clauses.append(FlicketTicket.assigned_id == int(assigned_id))
+    if created_id:
+        clauses.append(FlicketTicket.started_id == int(created_id))
+    if started_id:
+        clauses.append(FlicketTicket.started_id == int(started_id))
+    if subscriber_id:
+        clauses.append(FlicketTicket.id.in_(
+            select(FlicketSubscription.ticket_id).where(FlicketSubscription.user_id == int(subscriber_id)).
+            correlate(None)))
+    if content:
+        match = search_match(content)
+        if match is not None:
+            clauses.append(FlicketTicket.id.in_(match.with_only_columns(match.selected_columns.ticket_id)))
+        else:
+            pattern = f'%{content}%'
+            clauses.append(or_(FlicketTicket.title.ilike(pattern),
+                               FlicketTicket.content.ilike(pattern),
+                               FlicketTicket.posts.any(FlicketPost.content.ilike(pattern))))
+
+    return clauses
+
+
+def ticket_list_select():
+    """
+    Returns the SELECT used by the ticket lists. One row per ticket with the names of the related rows joined in.
+    Column names match those expected by MockTicket.
+    """
+    user = aliased(FlicketUser, name='u')
+    assigned = aliased(FlicketUser, name='au')
+    category = aliased(FlicketCategory, name='c')
+    department = aliased(FlicketDepartment, name='d')
+    priority = aliased(FlicketPriority, name='p')
+    status = aliased(FlicketStatus, name='s')
+
+    # date_added is returned as stored, without SQLAlchemy's datetime parsing. MockTicket formats it.
+    return select(FlicketTicket.id,
+                  FlicketTicket.title,
+                  FlicketTicket.content,
+                  type_coerce(FlicketTicket.date_added, String).label('date_added'),
+                  user.name.label('user_name'),
+                  department.department.label('dept_name'),
+                  category.category.label('cat_name'),
+                  priority.priority.label('priority_name'),
+                  status.status.label('status_name'),
+                  assigned.name.label('assigned_name'),
+                  num_replies.label('num_replies'),
+                  FlicketTicket.hours,
+                  FlicketTicket.posts_hours). \
+        select_from(FlicketTicket). \
+        outerjoin(user, FlicketTicket.started_id == user.id). \
+        outerjoin(category, FlicketTicket.category_id == category.id). \
+        outerjoin(department, category.department_id == department.id). \
+        outerjoin(priority, FlicketTicket.ticket_priority_id == priority.id). \
+        outerjoin(status, FlicketTicket.status_id == status.id). \
+        outerjoin(assigned, FlicketTicket.assigned_id == assigned.id)
+
+
+class TicketQuery:
+    """
+    A filtered set of tickets that can be listed, paged, counted or returned as an ORM query.
+
+    :param filters: see ticket_filters.
+    """
+
+    def __init__(self, **filters):
+        self.clauses = ticket_filters(**filters)
+        self.content = filters.get('content')
+
+    def filter(self, *clauses):
+        """ Adds extra WHERE clauses. Returns self. """
+        self.clauses.extend(clauses)
+        return self
+
+    def select(self, sort=None):
+        query = ticket_list_select().where(*self.clauses)
+
+        # best match first when searching with the full text index. Otherwise relevance is the default order.
+        match = search_match(self.content) if sort == relevance_sort else None
+        if match is not None:
+            match = match.subquery('search')
+            return query.join(match, match.c.ticket_id == FlicketTicket.id). \
+                order_by(match.c.rank.desc(), FlicketTicket.id.desc())
+
+        return query.order_by(*ticket_order(sort))
+
+    def count(self):
+        return select(func.count(FlicketTicket.id)).where(*self.clauses)
+
+    def rows(self, sort=None, limit=None, row_class=dict):
+        """
+        Returns a list of ticket rows, optionally limited.
+        """
+        query = self.select(sort)
+        if limit:
+            query = query.limit(limit)
+        return [row_class(dict(row._mapping)) for row in db.session.execute(query)]
+
+    def top_rows(self, partition_by, limit, sort=None, row_class=dict):
+        """
+        Returns the first limit rows for each value of partition_by together with the number of tickets matched,
+        in one query. Rows are numbered with ROW_NUMBER() OVER (PARTITION BY ...) and counted with COUNT(*) OVER ().
+
+        :param partition_by: FlicketTicket column, for example ticket_priority_id.
+        :param int limit: rows per partition.
+        :param str sort: order within each partition.
+        :param row_class:
+        :return: tuple(dict of partition value -> list of rows, total number of tickets matched)
+        """
+        ranked = ticket_list_select(). \
+            add_columns(partition_by.label('partition_key'),
+                        func.row_number().over(partition_by=partition_by,
+                                               order_by=ticket_order(sort)).label('partition_rank'),
+                        func.count().over().label('total_rows')). \
+            where(*self.clauses).subquery('ranked')
+        query = select(ranked).where(ranked.c.partition_rank <= limit). \
+            order_by(ranked.c.partition_key, ranked.c.partition_rank)
+
+        partitions = {}
+        total = 0
+        for row in db.session.execute(query):
+            data = dict(row._mapping)
+            total = data['total_rows']
+            partitions.setdefault(data['partition_key'], []).append(row_class(data))
+
+        return partitions, total
+
+    def paginate(self, page, per_page, sort=None, row_class=dict):
+        """
+        Returns one page of ticket rows as a TicketPagination.
+        """
+        return paginate_ticket_query(self.select(sort), self.count(), page, per_page, row_class=row_class)
+
+    def keyset(self, sort, per_page, cursor=None, row_class=dict):
+        """
+        Returns one page of ticket rows after (or before) cursor as a TicketKeysetPagination. Sorts without
+        cursor support fall back to descending ticket id.
+        """
+        if sort not in cursor_sorts:
+            sort = default_sort
+        column_name, _ = cursor_sorts[sort]
+        return keyset_ticket_query(ticket_list_select().where(*self.clauses), sort,
+                                   getattr(FlicketTicket, column_name), FlicketTicket.id,
+                                   per_page, cursor=cursor, row_class=row_class)
+
+    def orm_query(self):
+        """
+        Returns the filtered FlicketTicket query.
+        """
+        return FlicketTicket.query.filter(*self.clauses)
@@ -0,0 +1,210 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Full text search of tickets and their replies.
+
+Every ticket has one row in flicket_search holding its title, content and the content of its replies:
+
+* SQLite: an FTS5 virtual table keyed on rowid.
+* PostgreSQL: a tsvector column with a GIN index. The title is weighted above the rest.
+* MySQL / MariaDB: a text column with a FULLTEXT index.
+
+The row is rewritten by index_ticket whenever the ticket or one of its posts is created, edited or deleted. The
+whole table can be rebuilt with the "rebuild-search-index" command. On other databases, or while flicket_search
+does not exist, searches fall back to LIKE.
+"""
+
+import re
+
+from sqlalchemy import Float, Integer, column, func, inspect, select, table, text
+
+from application import db
+from application.flicket.models.flicket_models import FlicketPost, FlicketTicket
+
+search_table = table('flicket_search',
+                     column('rowid', Integer),
+                     column('ticket_id', Integer),
+                     column('document'),
+                     column('rank', Float))
+
+# text search configuration used by PostgreSQL for stemming and stop words.
+pg_config = 'english'
+
+search_ddl = {
+    'sqlite': ["CREATE VIRTUAL TABLE IF NOT EXISTS flicket_search USING fts5(document)"],
+    'postgresql': ["CREATE TABLE IF NOT EXISTS flicket_search (ticket_id INTEGER PRIMARY KEY, document TSVECTOR)",
+                   "CREATE INDEX IF NOT EXISTS ix_flicket_search_document ON flicket_search USING GIN (document)"],
+    'mysql': ["CREATE TABLE IF NOT EXISTS flicket_search (ticket_id INTEGER PRIMARY KEY, document MEDIUMTEXT, "
+              "FULLTEXT INDEX ix_flicket_search_document (document)) ENGINE=InnoDB"],
+}
+
+# database url -> True if flicket_search exists.
+_search_table_exists = {}
+
+
+def search_backend():
+    """
+    Returns the database dialect name if full text search can be used, otherwise None.
+    :return: str
+    """
+    dialect_name = db.engine.dialect.name
+    if dialect_name not in search_ddl:
+        return None
+
+    key = str(db.engine.url)
+    if key not in _search_table_exists:
+        _search_table_exists[key] = inspect(db.engine).has_table('flicket_search')
+
+    return dialect_name if _search_table_exists[key] else None
+
+
+def create_search_table():
+    """
+    Creates flicket_search if the database supports it.
+    :return: bool, True if the table exists.
+    """
+    dialect_name = db.engine.dialect.name
+    if dialect_name not in search_ddl:
+        return False
+
+    for statement in search_ddl[dialect_name]:
+        db.session.execute(text(statement))
+    db.session.commit()
+    _search_table_exists.pop(str(db.engine.url), None)
+
+    return search_backend() is not None
+
+
+def _id_column(backend):
+    # the FTS5 table is keyed on its rowid.
+    return search_table.c.rowid if backend == 'sqlite' else search_table.c.ticket_id
+
+
+def search_terms(content):
+    """
+    Splits the searched text into words. Punctuation is dropped so user input can not break the match syntax.
+    :param str content:
+    :return: list
+    """
+    return re.findall(r'\w+', content or '')
+
+
+def search_match(content):
+    """
+    Returns a select of (ticket_id, rank) for the tickets matching every word of content, a higher rank being a
+    better match. Words also match as prefixes. Returns None if full text search can not be used.
+    :param str content:
+    :return: select or None
+    """
+    backend = search_backend()
+    terms = search_terms(content)
+    if backend is None or not terms:
+        return None
+
+    ticket_id = _id_column(backend).label('ticket_id')
+
+    if backend == 'sqlite':
+        query = ' '.join('"{}"*'.format(term) for term in terms)
+        # FTS5's rank is bm25, where lower is better.
+        return select(ticket_id, (-search_table.c.rank).label('rank')). \
+            where(search_table.c.document.match(query))
+
+    if backend == 'postgresql':
+        query = func.to_tsquery(pg_config, ' & '.join('{}:*'.format(term) for term in terms))
+        return select(ticket_id, func.ts_rank(search_table.c.document, query).label('rank')). \
+            where(search_table.c.document.op('@@')(query))
+
+    query = ' '.join('+{}*'.format(term) for term in terms)
+    relevance = search_table.c.document.match(query)
+    return select(ticket_id, relevance.label('rank')).where(relevance)
+
+
+def _document(backend, title, body):
+    if backend == 'postgresql':
+        return func.setweight(func.to_tsvector(pg_config, title or ''), 'A').op('||')(
+            func.setweight(func.to_tsvector(pg_config, body), 'B'))
+    return '{}\n{}'.format(title or '', body)
+
+
+def _insert(backend, ticket_id, title, content, replies):
+    body = '\n'.join(part for part in [content] + replies if part)
+    values = {'document': _document(backend, title, body)}
+    values['rowid' if backend == 'sqlite' else 'ticket_id'] = ticket_id
+    db.session.execute(search_table.insert().values(**values))
+
+
+def remove_ticket(ticket_id):
+    """
+    Removes a ticket from the search index.
+    :param int ticket_id:
+    :return:
+    """
+    backend = search_backend()
+    if backend is None:
+        return
+
+    db.session.execute(search_table.delete().where(_id_column(backend) == ticket_id))
+
+
+def index_ticket(ticket):
+    """
+    Rewrites the search row of ticket from the database. Pending changes are flushed first so the new ticket and
+    post content is read. Call before committing.
+    :param FlicketTicket ticket:
+    :return:
+    """
+    backend = search_backend()
+    if backend is None:
+        return
+
+    db.session.flush()
+    remove_ticket(ticket.id)
+    row = db.session.execute(select(FlicketTicket.title, FlicketTicket.content).
+                             where(FlicketTicket.id == ticket.id)).first()
+    if row is None:
+        return
+    replies = db.session.execute(select(FlicketPost.content).where(FlicketPost.ticket_id == ticket.id).
+                                 order_by(FlicketPost.id)).scalars().all()
+    _insert(backend, ticket.id, row.title, row.content, replies)
+
+
+def rebuild_search_index(batch_size=500):
+    """
+    Creates flicket_search if needed and re-indexes every ticket.
+    :param int batch_size: number of tickets read at a time.
+    :return: number of tickets indexed, or None if the database has no full text search.
+    """
+    if not create_search_table():
+        return None
+    backend = search_backend()
+
+    db.session.execute(search_table.delete())
+
+    count = 0
+    last_id = 0
+    while True:
+        tickets = db.session.execute(select(FlicketTicket.id, FlicketTicket.title, FlicketTicket.content).
+                                     where(FlicketTicket.id > last_id).order_by(FlicketTicket.id).
+                                     limit(batch_size)).all()
+        if not tickets:
+            break
+        last_id = tickets[-1].id
+
+        replies = {}
+        posts = db.session.execute(select(FlicketPost.ticket_id, FlicketPost.content).
+                                   where(FlicketPost.ticket_id.between(tickets[0].id, last_id)).
+                                   order_by(FlicketPost.id))
+        for ticket_id, content in posts:
+            replies.setdefault(ticket_id, []).append(content)
+
+        for ticket in tickets:
+            _insert(backend, ticket.id, ticket.title, ticket.content, replies.get(ticket.id, []))
+        db.session.commit()
+        count += len(tickets)
+
+    db.session.commit()
+
+    return count
@@ -0,0 +1,163 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Ticket statistics for the dashboard.
+
+flicket_ticket_stats holds one row per (department, category, status, priority) with the number of tickets and their
+hours, a missing key part being stored as 0. Every view that creates, changes or deletes a ticket calls
+remove_ticket_stats before the change and add_ticket_stats after it, in the same transaction, so the row the ticket
+was counted in is decremented and the row it now belongs to is incremented, or inserted, in one upsert statement. The
+table can be checked and rebuilt from flicket_topic with the "rebuild-stats" command.
+"""
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from application import db
+from application.flicket.models.flicket_models import FlicketCategory, FlicketTicket, FlicketTicketStats
+from application.flicket.scripts.ticket_query import total_hours
+
+key_columns = ('department_id', 'category_id', 'status_id', 'priority_id')
+
+# dialect name -> insert construct supporting an upsert on the key index.
+upsert_inserts = {'mysql': mysql.insert, 'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def counted_ticket_stats():
+    """
+    Returns a select of (department_id, category_id, status_id, priority_id, tickets, hours) counted from
+    flicket_topic.
+    :return: select
+    """
+    key = [func.coalesce(column, 0).label(name) for column, name in zip(
+        (FlicketCategory.department_id, FlicketTicket.category_id, FlicketTicket.status_id,
+         FlicketTicket.ticket_priority_id), key_columns)]
+
+    return select(*key, func.count(FlicketTicket.id).label('tickets'),
+                  func.coalesce(func.sum(total_hours), 0).label('hours')). \
+        outerjoin(FlicketCategory, FlicketTicket.category_id == FlicketCategory.id). \
+        group_by(*key)
+
+
+def _count_ticket(ticket, sign):
+    db.session.flush()
+    row = db.session.execute(counted_ticket_stats().where(FlicketTicket.id == ticket.id)).first()
+    if row is None:
+        return
+
+    values = dict(zip(key_columns, tuple(row)[:len(key_columns)]), tickets=sign, hours=sign * row.hours)
+    upsert_insert = upsert_inserts.get(db.engine.dialect.name)
+    if upsert_insert is not None:
+        db.session.execute(_upsert(upsert_insert(FlicketTicketStats), values))
+        return
+
+    # other databases: the first ticket for this key is inserted in a savepoint. If another transaction adds the row
+    # at the same time the unique key index refuses the insert, and the ticket is counted in that row instead.
+    if _update_stats(values):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(FlicketTicketStats).values(**values))
+    except IntegrityError:
+        _update_stats(values)
+
+
+def _upsert(statement, values):
+    statement = statement.values(**values)
+    if db.engine.dialect.name == 'mysql':
+        return statement.on_duplicate_key_update(tickets=FlicketTicketStats.tickets + statement.inserted.tickets,
+                                                 hours=FlicketTicketStats.hours + statement.inserted.hours)
+
+    return statement.on_conflict_do_update(index_elements=list(key_columns),
+                                           set_=dict(tickets=FlicketTicketStats.tickets + statement.excluded.tickets,
+                                                     hours=FlicketTicketStats.hours + statement.excluded.hours))
+
+
+def _update_stats(values):
+    result = db.session.execute(
+        update(FlicketTicketStats).where(*[getattr(FlicketTicketStats, name) == values[name] for name in key_columns]).
+        values(tickets=FlicketTicketStats.tickets + values['tickets'],
+               hours=FlicketTicketStats.hours + values['hours']).
+        execution_options(synchronize_session=False))
+
+    return result.rowcount
+
+
+def add_ticket_stats(ticket):
+    """
+    Counts ticket in the statistics as it is now. Pending changes are flushed first. Call after creating or changing
+    a ticket, before committing.
+    :param ticket: FlicketTicket, or any object with the ticket id.
+    :return:
+    """
+    _count_ticket(ticket, 1)
+
+
+def remove_ticket_stats(ticket):
+    """
+    Removes ticket from the statistics as it is now. Call before changing or deleting a ticket.
+    :param ticket: FlicketTicket, or any object with the ticket id.
+    :return:
+    """
+    _count_ticket(ticket, -1)
+
+
+def count_tickets(**filters):
+    """
+    Returns the number of tickets matching filters, for example count_tickets(status_id=1).
+    :param filters: key column -> value.
+    :return: int
+    """
+    query = select(func.coalesce(func.sum(FlicketTicketStats.tickets), 0)).filter_by(**filters)
+
+    return db.session.execute(query).scalar()
+
+
+def count_tickets_by(*columns):
+    """
+    Returns the number of tickets grouped by columns, for example count_tickets_by('department_id', 'status_id').
+    :param columns: key column names.
+    :return: dict of column values -> number of tickets. Empty groups are left out.
+    """
+    group_by = [getattr(FlicketTicketStats, name) for name in columns]
+    query = select(*group_by, func.sum(FlicketTicketStats.tickets)).group_by(*group_by). \
+        having(func.sum(FlicketTicketStats.tickets) != 0)
+
+    return {tuple(row[:-1]): row[-1] for row in db.session.execute(query)}
+
+
+def check_ticket_stats():
+    """
+    Compares the stored statistics with those counted from flicket_topic.
+    :return: list of (key, stored (tickets, hours), counted (tickets, hours)) that differ.
+    """
+    stored = {tuple(row[:-2]): (row.tickets, row.hours) for row in db.session.execute(
+        select(*[getattr(FlicketTicketStats, name) for name in key_columns],
+               FlicketTicketStats.tickets, FlicketTicketStats.hours))}
+    counted = {tuple(row[:-2]): (row.tickets, row.hours) for row in db.session.execute(counted_ticket_stats())}
+
+    differences = []
+    for key in sorted(set(stored) | set(counted)):
+        stored_totals = stored.get(key, (0, 0))
+        counted_totals = counted.get(key, (0, 0))
+        if (stored_totals[0] or 0) != counted_totals[0] or (stored_totals[1] or 0) != counted_totals[1]:
+            differences.append((key, stored_totals, counted_totals))
+
+    return differences
+
+
+def rebuild_ticket_stats():
+    """
+    Replaces the statistics with those counted from flicket_topic.
+    :return: number of rows written.
+    """
+    db.session.execute(FlicketTicketStats.__table__.delete())
+    db.session.execute(FlicketTicketStats.__table__.insert().from_select(
+        list(key_columns) + ['tickets', 'hours'], counted_ticket_stats()))
+    db.session.commit()
+
+    return db.session.execute(select(func.count(FlicketTicketStats.id))).scalar()
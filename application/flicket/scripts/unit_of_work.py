@@ -0,0 +1,80 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+"""
+Unit of work for ticket changes.
+
+A view changing a ticket stages everything, the ticket, its actions (add_action), subscriptions, counters and
+stats, in the session and commits once:
+
+    with unit_of_work():
+        ticket.assigned = user
+        add_action(ticket, 'assign', recipient=user)
+        FlicketMail().assign_ticket(ticket)
+
+The block is committed when it ends, or rolled back if it raises; emails are queued in the outbox in the same
+transaction (see email_outbox), and an email that can not be queued is logged without rolling back the change (see
+queued_safely). Side effects outside the database that must not happen for a change that was not
+saved are registered with on_commit and run in order once the commit has succeeded; they are dropped on rollback. A
+unit of work opened inside another joins it.
+"""
+
+from contextlib import contextmanager
+from functools import partial
+
+from application import db
+
+
+def in_unit_of_work():
+    """
+    :return: True if a unit of work is open in this session.
+    """
+    return db.session.info.get('unit_of_work_depth', 0) > 0
+
+
+def on_commit(callback, *args, **kwargs):
+    """
+    Runs callback(*args, **kwargs) after the open unit of work has been committed. Outside a unit of work, where
+    the caller commits itself, it runs straight away.
+    :param callback:
+    :return:
+    """
+    if not in_unit_of_work():
+        callback(*args, **kwargs)
+        return
+
+    db.session.info.setdefault('on_commit', []).append(partial(callback, *args, **kwargs))
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Commits the changes made in the block in one transaction, then runs the on_commit callbacks.
+    :return:
+    """
+    session = db.session
+    info = session.info
+    if in_unit_of_work():
+        info['unit_of_work_depth'] += 1
+        try:
+            yield session
+        finally:
+            info['unit_of_work_depth'] -= 1
+        return
+
+    info['unit_of_work_depth'] = 1
+    info['on_commit'] = []
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        info['unit_of_work_depth'] = 0
+        callbacks = info.pop('on_commit', [])
+
+    for callback in callbacks:
+        callback()
@@ -15,6 +15,8 @@ from application.flicket.models.flicket_models import FlicketTicket, FlicketStat
 from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.flicket_functions import add_action
 from application.flicket.scripts.email import FlicketMail
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 from . import flicket_bp
 
 
@@ -51,32 +53,30 @@ def ticket_assign(ticket_id=False):
             # Fallback to 'Open' status if 'In Work' doesn't exist
             status = FlicketStatus.query.filter_by(status='Open').first()
         
-        # assign ticket
-        ticket.assigned = user
-        ticket.current_status = status
-        ticket.last_updated = datetime.datetime.now()
-
-        if not user.total_assigned:
-            user.total_assigned = 1
-        else:
-            user.total_assigned += 1
-
-        # add action record
-        add_action(ticket, 'assign', recipient=user)
-
-        # subscribe to the ticket
-        if not ticket.is_subscribed(user):
-            subscribe = FlicketSubscription(
-                ticket=ticket,
-                user=user
-            )
-            db.session.add(subscribe)
-
-        db.session.commit()
-
-        # send email to state ticket has been assigned.
-        f_mail = FlicketMail()
-        f_mail.assign_ticket(ticket)
+        with unit_of_work():
+            # assign ticket
+            remove_ticket_stats(ticket)
+            ticket.assigned = user
+            ticket.current_status = status
+            ticket.last_updated = datetime.datetime.now()
+
+            FlicketUser.update_totals(user.id, assigned=1)
+
+            # add action record
+            add_action(ticket, 'assign', recipient=user)
+
+            # subscribe to the ticket
+            if not ticket.is_subscribed(user):
+                subscribe = FlicketSubscription(
+                    ticket=ticket,
+                    user=user
+                )
+                db.session.add(subscribe)
+
+            add_ticket_stats(ticket)
+
+            # send email to state ticket has been assigned.
+            FlicketMail().assign_ticket(ticket)
 
         flash(gettext('You reassigned ticket: {} to {}'.format(ticket.id, user.name)), category='success')
         return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket.id))
@@ -10,10 +10,13 @@ from flask_babel import gettext
 from flask_login import login_required
 
 from . import flicket_bp
-from application import app, db
+from application import app
 from application.flicket.models.flicket_models import FlicketTicket, FlicketStatus
+from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.flicket_functions import add_action
 from application.flicket.scripts.email import FlicketMail
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 
 # view for self claim a ticket
@@ -28,20 +31,21 @@ def ticket_claim(ticket_id=False):
             flash(gettext('You have already been assigned this ticket.'), category='success')
             return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket.id))
 
-        # set status to in work
-        status = FlicketStatus.query.filter_by(status='In Work').first()
-        ticket.assigned = g.user
-        g.user.total_assigned += 1
-        ticket.current_status = status
-        ticket.last_updated = datetime.datetime.now()
-        db.session.commit()
-
-        # add action record
-        add_action(ticket, 'claim')
-
-        # send email notifications
-        f_mail = FlicketMail()
-        f_mail.assign_ticket(ticket=ticket)
+        with unit_of_work():
+            # set status to in work
+            status = FlicketStatus.query.filter_by(status='In Work').first()
+            remove_ticket_stats(ticket)
+            ticket.assigned = g.user
+            FlicketUser.update_totals(g.user.id, assigned=1)
+            ticket.current_status = status
+            ticket.last_updated = datetime.datetime.now()
+            add_ticket_stats(ticket)
+
+            # add action record
+            add_action(ticket, 'claim')
+
+            # send email notifications
+            FlicketMail().assign_ticket(ticket=ticket)
 
         flash(gettext('You claimed ticket: %(value)s', value=ticket.id))
         return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket.id))
@@ -3,6 +3,8 @@
 #
 # Flicket - copyright Paul Bourne: evereux@gmail.com
 
+from collections import Counter
+import datetime
 import os
 
 from flask import flash, g, redirect, url_for, render_template
@@ -17,6 +19,9 @@ from application.flicket.models.flicket_models import (FlicketTicket,
                                                        FlicketCategory,
                                                        FlicketDepartment,
                                                        FlicketHistory)
+from application.flicket.models.flicket_user import FlicketUser
+from application.flicket.scripts.ticket_search import index_ticket, remove_ticket
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
 from . import flicket_bp
 
 
@@ -44,16 +49,21 @@ def delete_ticket(ticket_id):
             db.session.delete(i)
 
         # remove posts for ticket.
+        posts_by_user = Counter()
         for post in ticket.posts:
             # remove history
             history = FlicketHistory.query.filter_by(post=post).all()
             for h in history:
                 db.session.delete(h)
-            post.user.total_posts -= 1
+            posts_by_user[post.user_id] += 1
             db.session.delete(post)
 
-        user = ticket.user
-        user.total_posts -= 1
+        # the ticket counts as a post of its creator.
+        posts_by_user[ticket.started_id] += 1
+        for user_id, posts in posts_by_user.items():
+            FlicketUser.update_totals(user_id, posts=-posts)
+        remove_ticket(ticket.id)
+        remove_ticket_stats(ticket)
         db.session.delete(ticket)
 
         # commit changes
@@ -89,7 +99,13 @@ def delete_post(post_id):
             # remove from database
             db.session.delete(i)
 
+        ticket = post.ticket
+        remove_ticket_stats(ticket)
+        ticket.update_post_totals(replies=-1, hours=-(post.hours or 0))
+        ticket.last_updated = datetime.datetime.now()
         db.session.delete(post)
+        index_ticket(ticket)
+        add_ticket_stats(ticket)
         # commit changes
         db.session.commit()
         flash(gettext('Ticket deleted.'), category='success')
@@ -7,11 +7,13 @@ from flask import abort, redirect, url_for, flash, render_template, g
 from flask_babel import gettext
 from flask_login import login_required
 
-from application import app, db
+from application import app
 from application.flicket.forms.flicket_forms import ChangeDepartmentCategoryForm
 from application.flicket.models.flicket_models import FlicketTicket
 from application.flicket.models.flicket_models import FlicketDepartmentCategory
 from application.flicket.scripts.flicket_functions import add_action
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 from . import flicket_bp
 
 
@@ -44,18 +46,20 @@ def ticket_department_category(ticket_id=False):
                 category='warning')
             return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket.id))
 
-        # change category
-        ticket.category_id = department_category.category_id
+        with unit_of_work():
+            # change category
+            remove_ticket_stats(ticket)
+            ticket.category_id = department_category.category_id
 
-        # add action record
-        add_action(ticket, 'department_category', data={
-            'department_category': department_category.department_category,
-            'category_id': department_category.category_id,
-            'category': department_category.category,
-            'department_id': department_category.department_id,
-            'department': department_category.department})
+            # add action record
+            add_action(ticket, 'department_category', data={
+                'department_category': department_category.department_category,
+                'category_id': department_category.category_id,
+                'category': department_category.category,
+                'department_id': department_category.department_id,
+                'department': department_category.department})
 
-        db.session.commit()
+            add_ticket_stats(ticket)
 
         flash(gettext('You changed category of ticket: {}'.format(ticket_id)), category='success')
         return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket.id))
@@ -23,6 +23,9 @@ from application.flicket.models.flicket_models_ext import FlicketTicketExt
 from application.flicket.scripts.flicket_functions import add_action
 from application.flicket.scripts.flicket_functions import is_ticket_closed
 from application.flicket.scripts.flicket_upload import UploadAttachment
+from application.flicket.scripts.ticket_search import index_ticket
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 
 # edit ticket
@@ -137,31 +140,37 @@ def edit_post(post_id):
 
                 db.session.delete(query)
 
-        post.content = form.content.data
-        post.modified = g.user
-        post.date_modified = datetime.datetime.now()
-        post.hours = form.hours.data
-        post.ticket.last_updated = datetime.datetime.now()
+        with unit_of_work():
+            remove_ticket_stats(post.ticket)
 
-        if post.ticket.status_id != form.status.data:
-            status = FlicketStatus.query.get(form.status.data)
-            post.ticket.current_status = status
-            add_action(post.ticket, 'status', data={'status_id': status.id, 'status': status.status})
+            post.content = form.content.data
+            post.modified = g.user
+            post.date_modified = datetime.datetime.now()
+            post.ticket.update_post_totals(hours=(form.hours.data or 0) - (post.hours or 0))
+            post.hours = form.hours.data
+            post.ticket.last_updated = datetime.datetime.now()
 
-        if post.ticket.ticket_priority_id != form.priority.data:
-            priority = FlicketPriority.query.get(form.priority.data)
-            post.ticket.ticket_priority = priority
-            add_action(post.ticket, 'priority', data={'priority_id': priority.id, 'priority': priority.priority})
+            if post.ticket.status_id != form.status.data:
+                status = FlicketStatus.query.get(form.status.data)
+                post.ticket.current_status = status
+                add_action(post.ticket, 'status', data={'status_id': status.id, 'status': status.status})
 
-        files = request.files.getlist("file")
-        upload_attachments = UploadAttachment(files)
-        if upload_attachments.are_attachments():
-            upload_attachments.upload_files()
+            if post.ticket.ticket_priority_id != form.priority.data:
+                priority = FlicketPriority.query.get(form.priority.data)
+                post.ticket.ticket_priority = priority
+                add_action(post.ticket, 'priority', data={'priority_id': priority.id, 'priority': priority.priority})
 
-        # add files to database.
-        upload_attachments.populate_db(post)
+            files = request.files.getlist("file")
+            upload_attachments = UploadAttachment(files)
+            if upload_attachments.are_attachments():
+                upload_attachments.upload_files()
+
+            # add files to database.
+            upload_attachments.populate_db(post)
+
+            index_ticket(post.ticket)
+            add_ticket_stats(post.ticket)
 
-        db.session.commit()
         flash('Post successfully edited.', category='success')
 
         return redirect(url_for('flicket_bp.ticket_view', ticket_id=post.ticket_id))
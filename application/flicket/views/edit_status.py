@@ -10,10 +10,12 @@ from flask_babel import gettext
 from flask_login import login_required
 
 from . import flicket_bp
-from application import app, db
+from application import app
 from application.flicket.models.flicket_models import FlicketTicket, FlicketStatus
 from application.flicket.scripts.flicket_functions import add_action
 from application.flicket.scripts.email import FlicketMail
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 
 # close ticket
@@ -42,16 +44,18 @@ def change_status(ticket_id, status):
         flash(gettext('Ticket is already closed.'), category='warning')
         return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket.id))
 
-    f_mail = FlicketMail()
-    f_mail.close_ticket(ticket)
+    with unit_of_work():
+        remove_ticket_stats(ticket)
 
-    # add action record
-    add_action(ticket, 'close')
+        # add action record
+        add_action(ticket, 'close')
 
-    ticket.current_status = closed
-    ticket.assigned_id = None
-    ticket.last_updated = datetime.datetime.now()
-    db.session.commit()
+        ticket.current_status = closed
+        ticket.assigned_id = None
+        ticket.last_updated = datetime.datetime.now()
+        add_ticket_stats(ticket)
+
+        FlicketMail().close_ticket(ticket)
 
     flash(gettext('Ticket %(value)s closed.', value=str(ticket_id).zfill(5)), category='success')
 
@@ -7,7 +7,8 @@ from flask import render_template
 from flask_babel import gettext
 from flask_login import login_required
 
-from application import app, flicket_bp
+from . import flicket_bp
+from application import app
 from application.flicket.models.flicket_models import FlicketHistory, FlicketPost, FlicketTicket
 
 
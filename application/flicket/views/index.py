@@ -9,9 +9,11 @@ from sqlalchemy import and_
 from datetime import datetime
 
 from . import flicket_bp
-from application import app, db
+from application import app
 from application.flicket.scripts.pie_charts import create_pie_chart_dict
 from application.flicket.models.flicket_models import FlicketTicket, FlicketStatus, FlicketPriority
+from application.flicket.scripts.ticket_query import TicketQuery
+from application.flicket.scripts.ticket_stats import count_tickets
 
 
 # Create a mock ticket class to avoid SQLAlchemy datetime parsing issues
@@ -39,7 +41,7 @@ class MockTicket:
             self.date_added = 'No Date'
             
         self.num_replies = data.get('num_replies', 0)
-        self.total_hours = data.get('hours', 0)  # Map 'hours' to 'total_hours' for compatibility
+        self.total_hours = (data.get('hours') or 0) + (data.get('posts_hours') or 0)
         self.id_zfill = str(data['id']).zfill(5)
         
         # Add last_updated attribute for template compatibility
@@ -95,181 +97,32 @@ def index():
     """ View showing flicket main page. We use this to display some statistics."""
     days = 7
 
-    # Get tickets for each priority level using raw SQL to avoid datetime parsing issues
+    # Get the open tickets for each priority level, up to 100 of each, in one query.
+    # Rows are read rather than FlicketTicket objects to avoid datetime parsing issues.
     try:
-        # Use raw SQL to get all ticket data
         # For non-admin users, only show their own tickets
-        if g.user.is_admin or g.user.is_super_user:
-            urgent_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 4 AND t.status_id = 1 AND t.date_added IS NOT NULL
-                ORDER BY t.id DESC
-                LIMIT 100
-            """)
-        else:
-            # For regular users, only show their own tickets
-            urgent_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 4 AND t.status_id = 1 AND t.date_added IS NOT NULL AND t.started_id = :user_id
-                ORDER BY t.id DESC
-                LIMIT 100
-            """, {'user_id': g.user.id})
-        urgent_tickets = [MockTicket(dict(row)) for row in urgent_result]
-        
-        # For non-admin users, only show their own tickets
-        if g.user.is_admin or g.user.is_super_user:
-            high_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 3 AND t.status_id = 1 AND t.date_added IS NOT NULL
-                ORDER BY t.id DESC
-                LIMIT 100
-            """)
-        else:
-            # For regular users, only show their own tickets
-            high_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 3 AND t.status_id = 1 AND t.date_added IS NOT NULL AND t.started_id = :user_id
-                ORDER BY t.id DESC
-                LIMIT 100
-            """, {'user_id': g.user.id})
-        high_tickets = [MockTicket(dict(row)) for row in high_result]
-        
-        # For non-admin users, only show their own tickets
-        if g.user.is_admin or g.user.is_super_user:
-            medium_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 2 AND t.status_id = 1 AND t.date_added IS NOT NULL
-                ORDER BY t.id DESC
-                LIMIT 100
-            """)
-        else:
-            # For regular users, only show their own tickets
-            medium_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 2 AND t.status_id = 1 AND t.date_added IS NOT NULL AND t.started_id = :user_id
-                ORDER BY t.id DESC
-                LIMIT 100
-            """, {'user_id': g.user.id})
-        medium_tickets = [MockTicket(dict(row)) for row in medium_result]
-        
-        # For non-admin users, only show their own tickets
-        if g.user.is_admin or g.user.is_super_user:
-            low_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 1 AND t.status_id = 1 AND t.date_added IS NOT NULL
-                ORDER BY t.id DESC
-                LIMIT 100
-            """)
-        else:
-            # For regular users, only show their own tickets
-            low_result = db.session.execute("""
-                SELECT t.id, t.title, t.content, t.date_added, 
-                       u.name as user_name, d.department as dept_name, c.category as cat_name,
-                       p.priority as priority_name, s.status as status_name,
-                       au.name as assigned_name
-                FROM flicket_topic t
-                LEFT JOIN flicket_users u ON t.started_id = u.id
-                LEFT JOIN flicket_category c ON t.category_id = c.id
-                LEFT JOIN flicket_department d ON c.department_id = d.id
-                LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-                LEFT JOIN flicket_status s ON t.status_id = s.id
-                LEFT JOIN flicket_users au ON t.assigned_id = au.id
-                WHERE t.ticket_priority_id = 1 AND t.status_id = 1 AND t.date_added IS NOT NULL AND t.started_id = :user_id
-                ORDER BY t.id DESC
-                LIMIT 100
-            """, {'user_id': g.user.id})
-        low_tickets = [MockTicket(dict(row)) for row in low_result]
-        
+        started_id = None if g.user.is_admin or g.user.is_super_user else g.user.id
+        tickets_by_priority, _ = TicketQuery(status_id=1, started_id=started_id). \
+            filter(FlicketTicket.date_added.isnot(None)). \
+            top_rows(FlicketTicket.ticket_priority_id, 100, sort='ticketid_desc', row_class=MockTicket)
+
     except Exception as e:
         # If there's an error with the query, return empty results
         print(f"Error querying tickets: {e}")
-        urgent_tickets = []
-        high_tickets = []
-        medium_tickets = []
-        low_tickets = []
+        tickets_by_priority = {}
+
+    urgent_tickets = tickets_by_priority.get(4, [])
+    high_tickets = tickets_by_priority.get(3, [])
+    medium_tickets = tickets_by_priority.get(2, [])
+    low_tickets = tickets_by_priority.get(1, [])
 
     # PIE CHARTS
     ids, graph_json = create_pie_chart_dict()
 
-    # Calculate open ticket count for admin dashboard
+    # the open ticket count is only shown on the admin dashboard. It is read from the flicket_ticket_stats rollup.
     open_count = 0
     if g.user.is_admin or g.user.is_super_user:
-        try:
-            result = db.session.execute("SELECT COUNT(*) FROM flicket_topic WHERE status_id = 1")
-            open_count = result.fetchone()[0]
-        except Exception as e:
-            print(f"Error calculating open count: {e}")
-            open_count = 0
+        open_count = count_tickets(status_id=1)
 
     return render_template('flicket_index.html',
                            days=days,
@@ -20,15 +20,16 @@ from flask_babel import gettext
 from sqlalchemy import func
 from sqlalchemy import or_
 
-from application import app, lm, db, flicket_bp
+from . import flicket_bp
+from application import app, lm, db
 from application import __version__
 from application.flicket_admin.models.flicket_config import FlicketConfig
 from application.flicket.forms.form_login import LogInForm
 from application.flicket.forms.form_login import PasswordResetForm
 from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.email import FlicketMail
-from application.flicket.scripts.flicket_config import set_flicket_config
 from application.flicket.scripts.hash_password import hash_password
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 
 # functions for redirecting user back from whence they came.
@@ -48,18 +49,20 @@ def get_redirect_target():
 
 @lm.user_loader
 def load_user(user_id):
-    return FlicketUser.query.get(int(user_id))
+    return FlicketUser.load_cached(int(user_id))
 
 
-# before any view is generated the user must be checked and application configuration details pulled from the database.
+# before any view is generated the user must be checked. The application configuration details have already been
+# pulled from the database, see refresh_flicket_config in application/__init__.py.
 @app.before_request
 def before_request():
-    set_flicket_config()
     g.user = current_user
 
     # reset the user token if the user is authenticated and token is expired.
     if g.user.is_authenticated and hasattr(g.user, 'token') and not g.user.disabled:
-        if FlicketUser.check_token(g.user.token) is None:
+        if FlicketUser.check_token_id(g.user.token) is None:
+            # the cached user may hold a token another worker has replaced since, read the current one first.
+            db.session.refresh(g.user)
             g.user.get_token()
             db.session.commit()
 
@@ -67,7 +70,7 @@ def before_request():
     g.__version__ = __version__
 
     # page title
-    application_title = FlicketConfig.query.first().application_title
+    application_title = FlicketConfig.cached().application_title
 
     g.application_title = application_title
 
@@ -138,14 +141,16 @@ def password_reset():
         new_password = FlicketUser.generate_password()
         hashed_password = hash_password(new_password)
         user = FlicketUser.query.filter_by(email=form.email.data).first()
-        user.password = hashed_password
-        db.session.commit()
-
-        email = FlicketMail()
-        email.password_reset(user, new_password)
-
-        flash(gettext('Password reset. Please check your email for your new password'))
-        return redirect(url_for('flicket_bp.login'))
+        # the new password is only saved if its email is queued, and the other way round.
+        with unit_of_work():
+            queued = FlicketMail().password_reset(user, new_password)
+            if queued:
+                user.password = hashed_password
+
+        if queued:
+            flash(gettext('Password reset. Please check your email for your new password'))
+            return redirect(url_for('flicket_bp.login'))
+        flash(gettext('The password could not be reset, please try again later.'), category='danger')
 
     title = 'Password Reset'
     return render_template('flicket_password_reset.html', form=form, title=title)
@@ -10,10 +10,13 @@ from flask_babel import gettext
 from flask_login import login_required
 
 from . import flicket_bp
-from application import app, db
+from application import app
 from application.flicket.models.flicket_models import FlicketTicket, FlicketStatus
+from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.email import FlicketMail
 from application.flicket.scripts.flicket_functions import add_action
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 
 # view to release a ticket user has been assigned.
@@ -35,22 +38,21 @@ def release(ticket_id=False):
             flash(gettext('You can not release a ticket you are not working on.'), category='warning')
             return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket_id))
 
-        # set status to open
-        status = FlicketStatus.query.filter_by(status='Open').first()
-        ticket.current_status = status
-        ticket.last_updated = datetime.datetime.now()
-        user = ticket.assigned
-        ticket.assigned = None
-        user.total_assigned -= 1
-
-        db.session.commit()
-
-        # add action record
-        add_action(ticket, 'release')
-
-        # send email to state ticket has been released.
-        f_mail = FlicketMail()
-        f_mail.release_ticket(ticket)
+        with unit_of_work():
+            # set status to open
+            status = FlicketStatus.query.filter_by(status='Open').first()
+            remove_ticket_stats(ticket)
+            ticket.current_status = status
+            ticket.last_updated = datetime.datetime.now()
+            FlicketUser.update_totals(ticket.assigned_id, assigned=-1)
+            ticket.assigned = None
+            add_ticket_stats(ticket)
+
+            # add action record
+            add_action(ticket, 'release')
+
+            # send email to state ticket has been released.
+            FlicketMail().release_ticket(ticket)
 
         flash(gettext('You released ticket: %(value)s', value=ticket.id), category='success')
         return redirect(url_for('flicket_bp.ticket_view', ticket_id=ticket.id))
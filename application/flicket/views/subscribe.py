@@ -20,6 +20,7 @@ from application.flicket.models.flicket_models import FlicketSubscription
 from application.flicket.models.flicket_models import FlicketTicket
 from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.flicket_functions import add_action
+from application.flicket.scripts.unit_of_work import unit_of_work
 from . import flicket_bp
 
 
@@ -66,10 +67,10 @@ def unsubscribe_ticket(ticket_id=None, user_id=None):
         if ticket.can_unsubscribe(user):
             subscription = FlicketSubscription.query.filter_by(user=user, ticket=ticket).one()
             # unsubscribe user to ticket
-            ticket.last_updated = datetime.datetime.now()
-            add_action(ticket, 'unsubscribe', recipient=user)
-            db.session.delete(subscription)
-            db.session.commit()
+            with unit_of_work():
+                ticket.last_updated = datetime.datetime.now()
+                add_action(ticket, 'unsubscribe', recipient=user)
+                db.session.delete(subscription)
             flash(gettext('"{}" has been unsubscribed from this ticket.'.format(user.name)), category='success')
 
         else:
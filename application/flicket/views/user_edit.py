@@ -72,6 +72,7 @@ def user_details():
             flash(password_requirements, category='warning')
 
         db.session.commit()
+        FlicketUser.clear_user_cache(user.id)
 
         return redirect(url_for('flicket_bp.user_details'))
 
@@ -8,39 +8,63 @@ import datetime
 from flask import render_template, redirect, url_for, g, request, flash
 from flask_login import login_required
 from flask_babel import gettext
+from sqlalchemy.orm import joinedload, selectinload
 
 from . import flicket_bp
 from application import app, db
 from application.flicket.forms.flicket_forms import ReplyForm, SubscribeUser
+from application.flicket.models.flicket_models import FlicketCategory
 from application.flicket.models.flicket_models import FlicketTicket
 from application.flicket.models.flicket_models import FlicketStatus
 from application.flicket.models.flicket_models import FlicketPriority
 from application.flicket.models.flicket_models import FlicketPost
 from application.flicket.models.flicket_models import FlicketSubscription
 from application.flicket.models.flicket_user import FlicketUser
+from application.flicket.scripts.action_timeline import ticket_timeline
 from application.flicket.scripts.flicket_functions import add_action
 from application.flicket.scripts.flicket_functions import block_quoter
 from application.flicket.scripts.flicket_upload import UploadAttachment
+from application.flicket.scripts.conditional_get import conditional_get, ticket_version
 from application.flicket.scripts.email import FlicketMail
 from application.flicket.scripts.subscriptions import subscribe_user
+from application.flicket.scripts.ticket_search import index_ticket
+from application.flicket.scripts.ticket_stats import add_ticket_stats, remove_ticket_stats
+from application.flicket.scripts.unit_of_work import unit_of_work
+
+# everything flicket_view.html shows of the ticket, loaded with it rather than lazily one relationship at a time.
+ticket_view_options = (
+    joinedload(FlicketTicket.current_status),
+    joinedload(FlicketTicket.ticket_priority),
+    joinedload(FlicketTicket.user),
+    joinedload(FlicketTicket.assigned),
+    joinedload(FlicketTicket.category).joinedload(FlicketCategory.department),
+)
+
+# and of each reply: its author is joined, the uploads of the whole page are read in one more query.
+reply_view_options = (
+    joinedload(FlicketPost.user),
+    selectinload(FlicketPost.uploads),
+)
 
 
 # view ticket details
 @flicket_bp.route(app.config['FLICKET'] + 'ticket_view/<ticket_id>/', methods=['GET', 'POST'])
 @flicket_bp.route(app.config['FLICKET'] + 'ticket_view/<ticket_id>/<int:page>/', methods=['GET', 'POST'])
 @login_required
+@conditional_get(ticket_version)
 def ticket_view(ticket_id, page=1):
     # todo: make sure underscores aren't allowed in usernames as it breaks markdown?
 
     # is ticket number legitimate
-    ticket = FlicketTicket.query.filter_by(id=ticket_id).first()
+    ticket = FlicketTicket.query.options(*ticket_view_options).filter_by(id=ticket_id).first()
 
     if not ticket:
         flash(gettext('Cannot find ticket: "%(value)s"', value=ticket_id), category='warning')
         return redirect(url_for('flicket_bp.tickets'))
 
     # find all replies to ticket.
-    replies = FlicketPost.query.filter_by(ticket_id=ticket_id).order_by(FlicketPost.date_added.asc())
+    replies = FlicketPost.query.options(*reply_view_options).filter_by(ticket_id=ticket_id). \
+        order_by(FlicketPost.date_added.asc())
 
     # get reply id's
     post_id = request.args.get('post_id')
@@ -71,56 +95,63 @@ def ticket_view(ticket_id, page=1):
             if upload_attachments.are_attachments():
                 upload_attachments.upload_files()
 
-            new_reply = FlicketPost(
-                ticket=ticket,
-                user=g.user,
-                date_added=datetime.datetime.now(),
-                content=form.content.data,
-                hours=form.hours.data,
-            )
-
-            # Only update status if form has status data (admin users) and it's different
-            if form.status.data and form.status.data != '' and ticket.status_id != int(form.status.data):
-                status = FlicketStatus.query.get(int(form.status.data))
-                if status:
-                    ticket.current_status = status
-                    add_action(ticket, 'status', data={'status_id': status.id, 'status': status.status})
-
-            # Only update priority if form has priority data (admin users) and it's different
-            if form.priority.data and form.priority.data != '' and ticket.ticket_priority_id != int(form.priority.data):
-                priority = FlicketPriority.query.get(int(form.priority.data))
-                if priority:
-                    ticket.ticket_priority = priority
-                    add_action(ticket, 'priority', data={'priority_id': priority.id, 'priority': priority.priority})
-
-            db.session.add(new_reply)
-
-            # add files to database.
-            upload_attachments.populate_db(new_reply)
-
-            # change ticket status to open if closed.
-            if ticket.current_status and ticket.current_status.status.lower() == 'closed':
-                ticket_open = FlicketStatus.query.filter_by(status='Open').first()
-                ticket.current_status = ticket_open
-
-            # subscribe to the ticket
-            if not ticket.is_subscribed(g.user):
-                subscribe = FlicketSubscription(
+            # the reply, status and priority changes, counters and stats are saved in one transaction.
+            with unit_of_work():
+                new_reply = FlicketPost(
                     ticket=ticket,
-                    user=g.user
+                    user=g.user,
+                    date_added=datetime.datetime.now(),
+                    content=form.content.data,
+                    hours=form.hours.data,
                 )
-                db.session.add(subscribe)
 
-            # add count of 1 to users total posts.
-            g.user.total_posts += 1
+                remove_ticket_stats(ticket)
 
-            ticket.last_updated = datetime.datetime.now()
+                # Only update status if form has status data (admin users) and it's different
+                if form.status.data and form.status.data != '' and ticket.status_id != int(form.status.data):
+                    status = FlicketStatus.query.get(int(form.status.data))
+                    if status:
+                        ticket.current_status = status
+                        add_action(ticket, 'status', data={'status_id': status.id, 'status': status.status})
 
-            db.session.commit()
+                # Only update priority if form has priority data (admin users) and it's different
+                if form.priority.data and form.priority.data != '' and \
+                        ticket.ticket_priority_id != int(form.priority.data):
+                    priority = FlicketPriority.query.get(int(form.priority.data))
+                    if priority:
+                        ticket.ticket_priority = priority
+                        add_action(ticket, 'priority',
+                                   data={'priority_id': priority.id, 'priority': priority.priority})
 
-            # send email notification
-            mail = FlicketMail()
-            mail.reply_ticket(ticket=ticket, reply=new_reply, user=g.user)
+                db.session.add(new_reply)
+                ticket.update_post_totals(replies=1, hours=new_reply.hours)
+
+                # add files to database.
+                upload_attachments.populate_db(new_reply)
+
+                # change ticket status to open if closed.
+                if ticket.current_status and ticket.current_status.status.lower() == 'closed':
+                    ticket_open = FlicketStatus.query.filter_by(status='Open').first()
+                    ticket.current_status = ticket_open
+
+                # subscribe to the ticket
+                if not ticket.is_subscribed(g.user):
+                    subscribe = FlicketSubscription(
+                        ticket=ticket,
+                        user=g.user
+                    )
+                    db.session.add(subscribe)
+
+                # add count of 1 to users total posts.
+                FlicketUser.update_totals(g.user.id, posts=1)
+
+                ticket.last_updated = datetime.datetime.now()
+
+                index_ticket(ticket)
+                add_ticket_stats(ticket)
+
+                # send email notification
+                FlicketMail().reply_ticket(ticket=ticket, reply=new_reply, user=g.user)
 
             flash(gettext('You have replied to ticket %(value_1)s: %(value_2)s.', value_1=ticket.id_zfill,
                           value_2=ticket.title), category="success")
@@ -174,5 +205,6 @@ def ticket_view(ticket_id, page=1):
                            form=form,
                            subscribers_form=subscribers_form,
                            replies=replies,
+                           timeline=ticket_timeline(ticket),
                            change_category=change_category,
                            page=page)
@@ -3,8 +3,17 @@
 #
 # Flicket - copyright Paul Bourne: evereux@gmail.com
 
+from types import SimpleNamespace
+
+from flask import g
+from sqlalchemy import func
+
 from application import db
 from application.flicket.models import Base
+from application.flicket.scripts.metrics import metrics
+
+# database url -> snapshot of the configuration, see FlicketConfig.cached.
+_config_cache = {}
 
 
 class FlicketConfig(Base):
@@ -34,6 +43,7 @@ class FlicketConfig(Base):
     :param str csv_dump_limit: The maximum number of rows exported to csv.
     :param bool change_category: Enable/disable change category.
     :param bool change_category_only_admin_or_super_user: Only admins or super users can change category.
+    :param int version: Incremented whenever the settings are saved so that cached copies are reloaded.
 
     """
     __tablename__ = 'flicket_config'
@@ -79,6 +89,51 @@ class FlicketConfig(Base):
     change_category = db.Column(db.BOOLEAN, default=False)
     change_category_only_admin_or_super_user = db.Column(db.BOOLEAN, default=False)
 
+    version = db.Column(db.Integer, server_default='0')
+
+    def bump_version(self):
+        """
+        Marks the settings as changed so that every worker reloads its cached copy. Call before committing.
+        :return:
+        """
+        self.version = func.coalesce(FlicketConfig.version, 0) + 1
+
+    @staticmethod
+    def cached():
+        """
+        Returns a read only copy of the settings. The row is read once per worker and kept in memory. Each request
+        (or app context) then only reads the version column and reloads the row if it has changed.
+        :return: SimpleNamespace of the column values, or None if the settings have not been created.
+        """
+        if 'flicket_config' in g:
+            return g.flicket_config
+
+        key = str(db.engine.url)
+        config = _config_cache.get(key)
+        version = db.session.query(FlicketConfig.version).scalar()
+        hit = config is not None and config.version == version
+        metrics.inc('flicket_cache_requests_total', {'cache': 'config', 'result': 'hit' if hit else 'miss'})
+        if not hit:
+            row = FlicketConfig.query.first()
+            config = None
+            if row is not None:
+                config = SimpleNamespace(**{column.key: getattr(row, column.key)
+                                            for column in FlicketConfig.__table__.columns})
+            _config_cache[key] = config
+
+        g.flicket_config = config
+
+        return config
+
+    @staticmethod
+    def invalidate_cache():
+        """
+        Drops this worker's copy of the settings so that the next call to cached reads the row again.
+        :return:
+        """
+        _config_cache.pop(str(db.engine.url), None)
+        g.pop('flicket_config', None)
+
     @staticmethod
     def extension_allowed(filename):
         """
@@ -101,7 +156,7 @@ class FlicketConfig(Base):
         :return: list()
         """
 
-        config = FlicketConfig.query.one()
+        config = FlicketConfig.cached()
 
         extensions = config.allowed_extensions.split(',')
         extensions = [i.strip() for i in extensions]
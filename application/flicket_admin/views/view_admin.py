@@ -29,6 +29,10 @@ from application.flicket.models.flicket_user import FlicketGroup
 from application.flicket.models.flicket_models import FlicketTicket, FlicketPriority, FlicketStatus, FlicketUploads, FlicketPost, FlicketHistory
 from application.flicket.forms.search import SearchTicketForm
 from application.flicket.scripts.hash_password import hash_password
+from application.flicket.scripts.ticket_pagination import TicketPagination
+from application.flicket.scripts.ticket_query import TicketQuery
+from application.flicket.scripts.ticket_search import remove_ticket
+from application.flicket.scripts.ticket_stats import remove_ticket_stats
 from application.flicket_admin.forms.forms_admin import AddGroupForm, AddUserForm, EnterPasswordForm, EditUserForm, PriorityForm, StatusForm
 from application.flicket.forms.forms_main import ConfirmPassword
 from . import admin_bp
@@ -62,6 +66,8 @@ def admin_tickets_view(page):
     user_id = request.args.get('user_id')
     assigned_id = request.args.get('assigned_id')
     created_id = request.args.get('created_id')
+    # cursor (keyset) pagination is used instead of page numbers when a cursor argument is given.
+    cursor = request.args.get('cursor')
 
     if form.validate_on_submit():
         redirect_url = FlicketTicket.form_redirect(form, url='admin_bp.tickets')
@@ -85,112 +91,24 @@ def admin_tickets_view(page):
         sort = 'priority_desc'
         set_cookie = False
 
-    # Create a simple pagination object
-    class SimplePagination:
-        def __init__(self, items, page, per_page, total):
-            self.items = items
-            self.page = page
-            self.per_page = per_page
-            self.total = total
-            self.pages = (total + per_page - 1) // per_page
-            
-        def iter_pages(self, left_edge=2, left_current=2, right_current=5, right_edge=2):
-            last = 0
-            for num in range(1, self.pages + 1):
-                if num <= left_edge or (num > self.page - left_current - 1 and num < self.page + right_current) or num > self.pages - right_edge:
-                    if last + 1 != num:
-                        yield None
-                    yield num
-                    last = num
-                    
-        @property
-        def has_prev(self):
-            return self.page > 1
-            
-        @property
-        def has_next(self):
-            return self.page < self.pages
-            
-        @property
-        def prev_num(self):
-            return self.page - 1 if self.has_prev else None
-            
-        @property
-        def next_num(self):
-            return self.page + 1 if self.has_next else None
-
-    # Use raw SQL to avoid datetime parsing issues
+    # tickets are read as rows rather than FlicketTicket objects to avoid datetime parsing issues
     try:
-        # Build the base SQL query
-        sql_query = """
-            SELECT t.id, t.title, t.content, t.date_added, 
-                   u.name as user_name, d.department as dept_name, c.category as cat_name,
-                   p.priority as priority_name, s.status as status_name,
-                   au.name as assigned_name,
-                   (SELECT COUNT(*) FROM flicket_post WHERE ticket_id = t.id) as num_replies,
-                   t.hours
-            FROM flicket_topic t
-            LEFT JOIN flicket_users u ON t.started_id = u.id
-            LEFT JOIN flicket_category c ON t.category_id = c.id
-            LEFT JOIN flicket_department d ON c.department_id = d.id
-            LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
-            LEFT JOIN flicket_status s ON t.status_id = s.id
-            LEFT JOIN flicket_users au ON t.assigned_id = au.id
-            WHERE 1=1
-        """
-        
-        # Add filters
-        if status:
-            sql_query += f" AND s.status = '{status}'"
-        if department:
-            sql_query += f" AND d.department = '{department}'"
-        if category:
-            sql_query += f" AND c.category = '{category}'"
-        if user_id:
-            sql_query += f" AND t.started_id = {user_id}"
-        if assigned_id:
-            sql_query += f" AND t.assigned_id = {assigned_id}"
-        if created_id:
-            sql_query += f" AND t.started_id = {created_id}"
-        if content:
-            sql_query += f" AND (t.title LIKE '%{content}%' OR t.content LIKE '%{content}%')"
-            
-        # Add sorting
-        if sort == 'priority_desc':
-            sql_query += " ORDER BY p.id DESC, t.id DESC"
-        elif sort == 'priority_asc':
-            sql_query += " ORDER BY p.id ASC, t.id DESC"
-        elif sort == 'date_desc':
-            sql_query += " ORDER BY t.date_added DESC"
-        elif sort == 'date_asc':
-            sql_query += " ORDER BY t.date_added ASC"
-        elif sort == 'title_asc':
-            sql_query += " ORDER BY t.title ASC"
-        elif sort == 'title_desc':
-            sql_query += " ORDER BY t.title DESC"
+        ticket_list = TicketQuery(status=status, department=department, category=category, user_id=user_id,
+                                  assigned_id=assigned_id, created_id=created_id, content=content)
+
+        # only the requested page is fetched and turned into MockTicket objects.
+        if cursor is not None:
+            ticket_query = ticket_list.keyset(sort, app.config['posts_per_page'], cursor=cursor, row_class=MockTicket)
+            number_results = None
         else:
-            sql_query += " ORDER BY t.id DESC"
-            
-        # Execute the query
-        result = db.session.execute(sql_query)
-        all_tickets = [MockTicket(dict(row)) for row in result]
-        
-        # Calculate total count
-        number_results = len(all_tickets)
-        
-        # Manual pagination
-        per_page = app.config['posts_per_page']
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        ticket_query = all_tickets[start_idx:end_idx]
-        
-        ticket_query = SimplePagination(ticket_query, page, per_page, number_results)
-        
+            ticket_query = ticket_list.paginate(page, app.config['posts_per_page'], sort=sort, row_class=MockTicket)
+            number_results = ticket_query.total
+
     except Exception as e:
         print(f"Error querying admin tickets: {e}")
         # Fallback to empty results
         number_results = 0
-        ticket_query = SimplePagination([], page, app.config['posts_per_page'], 0)
+        ticket_query = TicketPagination([], page, app.config['posts_per_page'], 0)
 
     title = gettext('All Tickets')
 
@@ -210,6 +128,7 @@ def admin_tickets_view(page):
                                              created_id=created_id,
                                              assigned_id=assigned_id,
                                              sort=sort,
+                                             cursor_args={k: v for k, v in request.args.items() if k != 'cursor'},
                                              base_url='admin_bp.tickets',
                                              show_admin_menu=True))
 
@@ -242,12 +161,11 @@ def on_identity_loaded(sender, identity):
     if hasattr(current_user, 'id'):
         identity.provides.add(UserNeed(current_user.id))
 
-    # Assuming the User model has a list of groups, update the
-    # identity with the groups that the user provides
-    if hasattr(current_user, 'flicket_groups'):
-        the_user = FlicketUser.query.filter_by(id=current_user.id).first()
-        for g in the_user.flicket_groups:
-            identity.provides.add(RoleNeed('{}'.format(g.group_name)))
+    # update the identity with the groups that the user provides. The roles were read with the user by the
+    # login manager, see FlicketUser.load_cached.
+    if hasattr(current_user, 'roles'):
+        for group_name in current_user.roles:
+            identity.provides.add(RoleNeed('{}'.format(group_name)))
 
 
 @admin_bp.route(app.config['ADMINHOME'])
@@ -388,6 +306,8 @@ def edit_user():
                 group_id = FlicketGroup.query.filter_by(id=g).first()
                 group_id.users.append(user)
             db.session.commit()  # type: ignore[attr-defined]
+            FlicketUser.clear_user_cache(user.id)
+            FlicketUser.clear_token_cache(user.id)
             flash(gettext("User {} edited.".format(user.username)), category='success')
             return redirect(url_for('admin_bp.edit_user', id=_id))
 
@@ -431,6 +351,8 @@ def delete_user():
     if form.validate_on_submit():
         # delete the user.
         flash(gettext('Deleted user {}s'.format(user_details.username)), category='success')
+        FlicketUser.clear_user_cache(user_details.id)
+        FlicketUser.clear_token_cache(user_details.id)
         db.session.delete(user_details)  # type: ignore[attr-defined]
         db.session.commit()  # type: ignore[attr-defined]
         return redirect(url_for('admin_bp.users'))
@@ -483,6 +405,7 @@ def admin_edit_group():
     if form.validate_on_submit():
         group.group_name = form.group_name.data
         db.session.commit()  # type: ignore[attr-defined]
+        FlicketUser.clear_user_cache()
         flash(gettext('Group name changed to {}.'.format(group.group_name)), category='success')
         return redirect(url_for('admin_bp.groups'))
     form.group_name.data = group.group_name
@@ -510,6 +433,7 @@ def admin_delete_group():
         flash(gettext('Deleted group {}s'.format(group_details.group_name)), category="info")
         db.session.delete(group_details)  # type: ignore[attr-defined]
         db.session.commit()  # type: ignore[attr-defined]
+        FlicketUser.clear_user_cache()
         return redirect(url_for('admin_bp.groups'))
     # populate form with logged in user details
     form.id.data = g.user.id
@@ -633,8 +557,8 @@ def delete_ticket(ticket_id):
                    u.name as user_name, d.department as dept_name, c.category as cat_name,
                    p.priority as priority_name, s.status as status_name,
                    au.name as assigned_name,
-                   (SELECT COUNT(*) FROM flicket_post WHERE ticket_id = t.id) as num_replies,
-                   t.hours
+                   t.reply_count as num_replies,
+                   t.hours, t.posts_hours
             FROM flicket_topic t
             LEFT JOIN flicket_users u ON t.started_id = u.id
             LEFT JOIN flicket_category c ON t.category_id = c.id
@@ -671,6 +595,8 @@ def delete_ticket(ticket_id):
             db.session.execute("DELETE FROM flicket_post WHERE ticket_id = :ticket_id", {'ticket_id': ticket_id})
             
             # Delete the ticket
+            remove_ticket(ticket_id)
+            remove_ticket_stats(ticket)
             db.session.execute("DELETE FROM flicket_topic WHERE id = :ticket_id", {'ticket_id': ticket_id})
             
             db.session.commit()
@@ -101,9 +101,13 @@ def config():
         # Don't change the password if nothing was entered.
         if form.mail_password.data != '':
             config_details.mail_password = form.mail_password.data
-            
+
+        # other workers reload their cached settings when they see the new version.
+        config_details.bump_version()
+
         # Commit changes to database
         db.session.commit()
+        FlicketConfig.invalidate_cache()
         
         # Debug: Print saved values
         print(f"Saved mail_server: {config_details.mail_server}")
@@ -13,6 +13,7 @@ from flask_login import login_required
 from application import app
 from application.flicket_admin.forms.form_config import EmailTest
 from application.flicket.scripts.email import FlicketMail
+from application.flicket.scripts.unit_of_work import unit_of_work
 
 from . import admin_bp
 from .view_admin import admin_permission
@@ -28,8 +29,8 @@ def email_test():
     if form.validate_on_submit():
         # send email notification
         try:
-            mail = FlicketMail()
-            mail.test_email([form.email_address.data])
+            with unit_of_work():
+                FlicketMail().test_email([form.email_address.data])
             config_href = app.config.get("base_url", "") + url_for('admin_bp.config')
             msg = gettext(
                 'Flicket has tried to send an email to the address you entered. Please check your inbox. If no email has '
@@ -0,0 +1,44 @@
+#! usr/bin/python3
+# -*- coding: utf8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+import hmac
+
+from flask import abort, request, Response
+from flask_login import current_user
+
+from application import app
+from application.flicket.scripts.email_outbox import queue_depth
+from application.flicket.scripts.metrics import collect, render
+
+from . import admin_bp
+
+
+def metrics_allowed():
+    """
+    Admins may always read the metrics, a scraper needs the METRICS_TOKEN bearer token.
+    :return: Boolean
+    """
+    token = app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    if token and authorization.startswith('Bearer ') and \
+            hmac.compare_digest(authorization[len('Bearer '):].strip().encode(), token.encode()):
+        return True
+
+    return current_user.is_authenticated and current_user.is_admin
+
+
+# prometheus metrics of every worker, see application/flicket/scripts/metrics.py.
+@admin_bp.route(app.config['WEBHOME'] + 'metrics', methods=['GET'])
+def metrics():
+    if not metrics_allowed():
+        abort(403)
+
+    totals = collect(app.config.get('METRICS_DIR'))
+    # the outbox is shared by every process, its depth is read rather than added up.
+    depth = queue_depth()
+    for status in ('pending', 'failed'):
+        totals['gauges'][('flicket_email_queue_depth', (('status', status),))] = depth.get(status, 0)
+
+    return Response(render(totals), content_type='text/plain; version=0.0.4; charset=utf-8')
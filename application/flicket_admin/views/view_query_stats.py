@@ -0,0 +1,27 @@
+#! usr/bin/python3
+# -*- coding: utf8 -*-
+#
+# Flicket - copyright Paul Bourne: evereux@gmail.com
+
+from flask import render_template
+from flask_login import login_required
+
+from application import app
+from application.flicket.scripts.query_stats import endpoint_summaries, recent_requests
+
+from . import admin_bp
+from .view_admin import admin_permission
+
+
+# sql statements made by the recent requests of this worker.
+@admin_bp.route(app.config['ADMINHOME'] + 'query_stats/', methods=['GET'])
+@login_required
+@admin_permission.require(http_exception=403)
+def query_stats():
+    requests = list(recent_requests)[-50:]
+    requests.reverse()
+
+    return render_template('admin_query_stats.html',
+                           title='Query Stats',
+                           endpoints=endpoint_summaries(),
+                           requests=requests)
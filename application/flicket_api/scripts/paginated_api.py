@@ -6,12 +6,17 @@
 from flask import url_for
 
 from application import app
+from application.flicket.scripts.ticket_pagination import decode_cursor, encode_cursor, keyset_clause
 
 
 class PaginatedAPIMixin(object):
+    # sort name -> (column name, descending) for models that can be paged with a cursor. See FlicketTicket.
+    cursor_sorts = {}
 
-    @staticmethod
-    def to_collection_dict(query, page, per_page, endpoint, **kwargs):
+    @classmethod
+    def to_collection_dict(cls, query, page, per_page, endpoint, sort=None, **kwargs):
+        if sort:
+            kwargs['sort'] = sort
         resources = query.paginate(page=page, per_page=per_page)
         data = {
             'items': [item.to_dict() for item in resources.items],
@@ -30,4 +35,87 @@ class PaginatedAPIMixin(object):
             },
         }
 
+        # cursors to carry on from this page without OFFSET.
+        if sort in cls.cursor_sorts:
+            data['_links'].update(cls._cursor_links(resources.items, sort, per_page, endpoint,
+                                                    resources.has_next, resources.has_prev, kwargs))
+
+        return data
+
+    @classmethod
+    def to_cursor_collection_dict(cls, query, per_page, endpoint, sort, cursor=None, **kwargs):
+        """
+        Cursor (keyset) version of to_collection_dict.
+
+        Rows are found with a row value comparison on (sort column, id) instead of OFFSET so deep pages cost the
+        same as the first, tickets with a NULL sort key included (see keyset_clause). Raises ValueError if the cursor
+        can not be read or was made for another sort.
+
+        :param query: query of a model with cursor_sorts.
+        :param int per_page:
+        :param str endpoint:
+        :param str sort: one of cls.cursor_sorts.
+        :param str cursor: cursor from a previous response. None for the first page.
+        :return dict:
+        """
+        column_name, descending = cls.cursor_sorts[sort]
+        column = getattr(cls, column_name)
+        kwargs['sort'] = sort
+
+        backwards = False
+        if cursor:
+            cursor_sort, key, last_id, backwards = decode_cursor(cursor)
+            if cursor_sort != sort:
+                raise ValueError(f'Cursor was not made for sort "{sort}".')
+            scan_up = descending == backwards
+            if column_name == 'id':
+                query = query.filter(cls.id > last_id if scan_up else cls.id < last_id)
+            else:
+                query = query.filter(keyset_clause(column, cls.id, key, last_id, scan_up))
+
+        if descending != backwards:
+            order = [column.desc()] if column_name == 'id' else [column.desc(), cls.id.desc()]
+        else:
+            order = [column] if column_name == 'id' else [column, cls.id]
+
+        # fetch one extra row to find out if there is anything beyond this page.
+        items = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+        more = len(items) > per_page
+        items = items[:per_page]
+        if backwards:
+            items.reverse()
+
+        has_next = more or backwards
+        has_prev = (more and backwards) or (bool(cursor) and not backwards)
+
+        data = {
+            'items': [item.to_dict() for item in items],
+            '_meta': {
+                'per_page': per_page,
+                'sort': sort,
+            },
+            '_links': {
+                'self': app.config['base_url'] + url_for(endpoint, per_page=per_page, cursor=cursor or '', **kwargs),
+            },
+        }
+        data['_links'].update(cls._cursor_links(items, sort, per_page, endpoint, has_next, has_prev, kwargs))
+
         return data
+
+    @classmethod
+    def _cursor_links(cls, items, sort, per_page, endpoint, has_next, has_prev, link_args):
+        """
+        Returns the next_cursor and prev_cursor links either side of items.
+        """
+        column_name, _ = cls.cursor_sorts[sort]
+        next_cursor, prev_cursor = None, None
+
+        if items and has_next:
+            cursor = encode_cursor(sort, getattr(items[-1], column_name), items[-1].id)
+            next_cursor = app.config['base_url'] + url_for(endpoint, per_page=per_page, cursor=cursor, **link_args)
+
+        if items and has_prev:
+            cursor = encode_cursor(sort, getattr(items[0], column_name), items[0].id, backwards=True)
+            prev_cursor = app.config['base_url'] + url_for(endpoint, per_page=per_page, cursor=cursor, **link_args)
+
+        return {'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
@@ -9,6 +9,7 @@ from .sphinx_helper import api_url
 from . import bp_api
 from application import app
 from application.flicket.models.flicket_models import FlicketAction
+from application.flicket.scripts.conditional_get import conditional_get, ticket_version
 from application.flicket_api.views.auth import token_auth
 
 
@@ -20,6 +21,7 @@ def get_action(id):
 
 @bp_api.route(api_url + 'actions/<int:ticket_id>', methods=['GET'])
 @token_auth.login_required
+@conditional_get(ticket_version)
 def get_actions(ticket_id):
     actions = FlicketAction.query.filter_by(ticket_id=ticket_id)
     page = request.args.get('page', 1, type=int)
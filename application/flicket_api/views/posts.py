@@ -119,6 +119,7 @@ from .sphinx_helper import api_url
 from . import bp_api
 from application import app
 from application.flicket.models.flicket_models import FlicketPost
+from application.flicket.scripts.conditional_get import conditional_get, ticket_version
 from application.flicket_api.views.auth import token_auth
 
 
@@ -131,6 +132,7 @@ def get_post(id):
 @bp_api.route(api_url + 'posts/<int:ticket_id>/', methods=['GET'])
 @bp_api.route(api_url + 'posts/<int:ticket_id>/<int:page>/', methods=['GET'])
 @token_auth.login_required
+@conditional_get(ticket_version)
 def get_posts(page=1, ticket_id=None):
     posts = FlicketPost.query.filter_by(ticket_id=ticket_id)
     per_page = min(request.args.get('per_page', app.config['posts_per_page'], type=int), 100)
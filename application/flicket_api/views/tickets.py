@@ -82,6 +82,11 @@
             Accept: application/json
             Authorization: Bearer <token>
 
+        Optional arguments are ``per_page``, ``sort`` (priority, priority_desc, last_updated, last_updated_desc,
+        addedon, addedon_desc, title, title_desc, ticketid or ticketid_desc) and ``cursor``. Following the
+        ``next_cursor`` and ``prev_cursor`` links pages through the tickets without page numbers, which stays fast
+        however deep the page.
+
         **Response**
 
         .. sourcecode:: http
@@ -94,9 +99,11 @@
 
             {
                 "_links": {
-                    "next": "http://localhost:5000/flicket-api/tickets/2/?per_page=1",
+                    "next": "http://localhost:5000/flicket-api/tickets/2/?per_page=1&sort=ticketid",
+                    "next_cursor": "http://localhost:5000/flicket-api/tickets/?per_page=1&cursor=WyJ0aWNrZXRpZCIsMSwxLDBd&sort=ticketid",
                     "prev": null,
-                    "self": "http://localhost:5000/flicket-api/tickets/1/?per_page=1"
+                    "prev_cursor": null,
+                    "self": "http://localhost:5000/flicket-api/tickets/1/?per_page=1&sort=ticketid"
                 },
                 "_meta": {
                     "page": 1,
@@ -214,12 +221,16 @@ from .sphinx_helper import api_url
 from . import bp_api
 from application import app, db
 from application.flicket.models.flicket_models import FlicketPriority, FlicketTicket, FlicketCategory
+from application.flicket.scripts.conditional_get import conditional_get, ticket_version
+from application.flicket.scripts.ticket_search import index_ticket
+from application.flicket.scripts.ticket_stats import add_ticket_stats
 from application.flicket_api.views.auth import token_auth
 from application.flicket_api.views.errors import bad_request
 
 
 @bp_api.route(api_url + 'ticket/<int:id>', methods=['GET'])
 @token_auth.login_required
+@conditional_get(ticket_version, arg='id')
 def get_ticket(id):
     return jsonify(FlicketTicket.query.get_or_404(id).to_dict())
 
@@ -230,9 +241,25 @@ def get_ticket(id):
 def get_tickets(page=1):
     # todo: add filtering
 
+    sort = request.args.get('sort', 'ticketid')
+    if sort not in FlicketTicket.cursor_sorts:
+        return bad_request(f'sort must be one of {", ".join(FlicketTicket.cursor_sorts)}.')
+
     tickets = FlicketTicket.query
     per_page = min(request.args.get('per_page', app.config['posts_per_page'], type=int), 100)
-    data = FlicketTicket.to_collection_dict(tickets, page, per_page, 'bp_api.get_tickets')
+
+    # cursor pagination, used when following next_cursor / prev_cursor links.
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            data = FlicketTicket.to_cursor_collection_dict(tickets, per_page, 'bp_api.get_tickets', sort,
+                                                           cursor=cursor)
+        except ValueError as e:
+            return bad_request(str(e))
+        return jsonify(data)
+
+    tickets = FlicketTicket.sorted_tickets(tickets, sort)
+    data = FlicketTicket.to_collection_dict(tickets, page, per_page, 'bp_api.get_tickets', sort=sort)
     return jsonify(data)
 
 
@@ -260,6 +287,8 @@ def create_ticket():
     ticket.status_id = 1
 
     db.session.add(ticket)
+    index_ticket(ticket)
+    add_ticket_stats(ticket)
     db.session.commit()
 
     response = jsonify(ticket.to_dict())
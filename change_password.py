@@ -4,10 +4,12 @@
 Change admin password script for Flicket
 """
 
-from application import app, db
+from application import create_app, db
 from application.flicket.models.flicket_user import FlicketUser
 from application.flicket.scripts.hash_password import hash_password
 
+app = create_app(blueprints=[])
+
 def change_admin_password(new_password):
     """Change the admin user's password"""
     with app.app_context():
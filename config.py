@@ -54,6 +54,39 @@ class BaseConfiguration(object):
     MAIL_PASSWORD = 'ymra bdxk uduu dpna'
     MAIL_DEFAULT_SENDER = 'recordablesticketquest@gmail.com'
 
+    # sql instrumentation, see application/flicket/scripts/query_stats.py. The X-Query-* headers are always sent in
+    # debug mode. In strict mode a request over its endpoint's query budget raises QueryBudgetExceeded.
+    QUERY_STATS_HEADERS = False
+    QUERY_BUDGET_STRICT = False
+    # number of times a statement shape has to run in one request to be reported as repeated (N+1).
+    QUERY_REPEAT_THRESHOLD = 5
+
+    # statements taking longer than SLOW_QUERY_THRESHOLD seconds are written with their plan to SLOW_QUERY_LOG, see
+    # application/flicket/scripts/slow_query_log.py. Set the threshold to None to turn the log off.
+    SLOW_QUERY_THRESHOLD = 0.5
+    SLOW_QUERY_LOG = os.path.join(basedir, 'slow_queries.jsonl')
+    SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 5
+
+    # prometheus metrics at /metrics, see application/flicket/scripts/metrics.py. The page is shown to admins, and to
+    # requests with an "Authorization: Bearer <METRICS_TOKEN>" header if METRICS_TOKEN is set. When running several
+    # worker processes set METRICS_DIR to a directory they share, each worker writes its values there at most every
+    # METRICS_FLUSH_INTERVAL seconds and a scrape adds them up.
+    METRICS_TOKEN = None
+    METRICS_DIR = None
+    METRICS_FLUSH_INTERVAL = 1
+
+    # emails are queued in the flicket_email_outbox table and sent by EMAIL_WORKER_THREADS threads of each process
+    # that queues them, see application/flicket/scripts/email_outbox.py. Set it to 0 to send them with
+    # "flask email-worker" instead. A failed send is retried after EMAIL_RETRY_DELAY seconds, doubled each time, up
+    # to EMAIL_MAX_ATTEMPTS attempts.
+    EMAIL_WORKER_THREADS = 2
+    EMAIL_BATCH_SIZE = 20
+    EMAIL_POLL_INTERVAL = 10
+    EMAIL_CLAIM_SECONDS = 300
+    EMAIL_RETRY_DELAY = 60
+    EMAIL_MAX_ATTEMPTS = 6
+
 class TestConfiguration(BaseConfiguration):
     DEBUG = False
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'test.db')
@@ -9,9 +9,11 @@ import os
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from application import app
+from application import create_app
 from application.flicket_admin.forms.form_config import ConfigForm
 
+app = create_app()
+
 def test_form():
     """Test form creation and validation"""
     
@@ -0,0 +1,37 @@
+"""store reply count and post hours on flicket_topic
+
+Revision ID: 7c2d4e6f8a10
+Revises: 5901d96e22b0
+Create Date: 2026-10-18 09:12:44.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d4e6f8a10'
+down_revision = '5901d96e22b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('flicket_topic', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), server_default='0', nullable=True))
+        batch_op.add_column(sa.Column('posts_hours', sa.Numeric(precision=10, scale=2), server_default='0',
+                                      nullable=True))
+
+    # backfill the totals for existing tickets.
+    op.execute("""
+        UPDATE flicket_topic SET
+            reply_count = (SELECT COUNT(*) FROM flicket_post WHERE flicket_post.ticket_id = flicket_topic.id),
+            posts_hours = (SELECT COALESCE(SUM(hours), 0) FROM flicket_post
+                           WHERE flicket_post.ticket_id = flicket_topic.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_topic', schema=None) as batch_op:
+        batch_op.drop_column('posts_hours')
+        batch_op.drop_column('reply_count')
@@ -0,0 +1,63 @@
+"""composite indexes for the ticket list, dashboard, subscription and timeline queries
+
+Revision ID: 9e4b1a3c5d72
+Revises: 7c2d4e6f8a10
+Create Date: 2026-10-18 10:03:27.540915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b1a3c5d72'
+down_revision = '7c2d4e6f8a10'
+branch_labels = None
+depends_on = None
+
+# table -> (index name, columns)
+indexes = {
+    'flicket_topic': [
+        ('ix_flicket_topic_status_priority', ['status_id', 'ticket_priority_id', 'id']),
+        ('ix_flicket_topic_started_status', ['started_id', 'status_id']),
+        ('ix_flicket_topic_assigned_status', ['assigned_id', 'status_id']),
+        ('ix_flicket_topic_category', ['category_id']),
+        ('ix_flicket_topic_priority', ['ticket_priority_id', 'id']),
+        ('ix_flicket_topic_date_added', ['date_added', 'id']),
+        ('ix_flicket_topic_last_updated', ['last_updated', 'id']),
+    ],
+    'flicket_post': [
+        ('ix_flicket_post_ticket_date', ['ticket_id', 'date_added']),
+        ('ix_flicket_post_user', ['user_id']),
+    ],
+    'flicket_uploads': [
+        ('ix_flicket_uploads_topic', ['topic_id']),
+        ('ix_flicket_uploads_post', ['posts_id']),
+    ],
+    'flicket_history': [
+        ('ix_flicket_history_topic', ['topic_id']),
+        ('ix_flicket_history_post', ['post_id']),
+    ],
+    'flicket_ticket_subscription': [
+        ('ix_flicket_ticket_subscription_user_ticket', ['user_id', 'ticket_id']),
+        ('ix_flicket_ticket_subscription_ticket', ['ticket_id']),
+    ],
+    'flicket_ticket_action': [
+        ('ix_flicket_ticket_action_ticket_date', ['ticket_id', 'date']),
+        ('ix_flicket_ticket_action_post', ['post_id']),
+    ],
+}
+
+
+def upgrade():
+    for table, table_indexes in indexes.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, columns in table_indexes:
+                batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    for table, table_indexes in indexes.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, _ in reversed(table_indexes):
+                batch_op.drop_index(name)
@@ -0,0 +1,43 @@
+"""store user and recipient names on flicket_ticket_action
+
+Revision ID: a4c6e8f0b2d5
+Revises: f2a4c6e8b0d3
+Create Date: 2026-10-18 20:41:07.502318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c6e8f0b2d5'
+down_revision = 'f2a4c6e8b0d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('flicket_ticket_action', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_name', sa.String(length=60), nullable=True))
+        batch_op.add_column(sa.Column('user_email', sa.String(length=60), nullable=True))
+        batch_op.add_column(sa.Column('recipient_name', sa.String(length=60), nullable=True))
+        batch_op.add_column(sa.Column('recipient_email', sa.String(length=60), nullable=True))
+
+    # backfill the names of existing actions.
+    op.execute("""
+        UPDATE flicket_ticket_action SET
+            user_name = (SELECT name FROM flicket_users WHERE flicket_users.id = flicket_ticket_action.user_id),
+            user_email = (SELECT email FROM flicket_users WHERE flicket_users.id = flicket_ticket_action.user_id),
+            recipient_name = (SELECT name FROM flicket_users
+                              WHERE flicket_users.id = flicket_ticket_action.recipient_id),
+            recipient_email = (SELECT email FROM flicket_users
+                               WHERE flicket_users.id = flicket_ticket_action.recipient_id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_ticket_action', schema=None) as batch_op:
+        batch_op.drop_column('recipient_email')
+        batch_op.drop_column('recipient_name')
+        batch_op.drop_column('user_email')
+        batch_op.drop_column('user_name')
@@ -0,0 +1,58 @@
+"""full text search table for ticket titles, content and replies
+
+Revision ID: b3f6d8e0a2c4
+Revises: 9e4b1a3c5d72
+Create Date: 2026-10-18 13:41:05.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f6d8e0a2c4'
+down_revision = '9e4b1a3c5d72'
+branch_labels = None
+depends_on = None
+
+# see application/flicket/scripts/ticket_search.py
+create = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE flicket_search USING fts5(document)",
+        """INSERT INTO flicket_search (rowid, document)
+           SELECT t.id, COALESCE(t.title, '') || char(10) || COALESCE(t.content, '') || char(10) ||
+                  COALESCE((SELECT group_concat(p.content, char(10)) FROM flicket_post p WHERE p.ticket_id = t.id), '')
+           FROM flicket_topic t""",
+    ],
+    'postgresql': [
+        "CREATE TABLE flicket_search (ticket_id INTEGER PRIMARY KEY, document TSVECTOR)",
+        "CREATE INDEX ix_flicket_search_document ON flicket_search USING GIN (document)",
+        """INSERT INTO flicket_search (ticket_id, document)
+           SELECT t.id,
+                  setweight(to_tsvector('english', COALESCE(t.title, '')), 'A') ||
+                  setweight(to_tsvector('english', COALESCE(t.content, '') || ' ' ||
+                      COALESCE((SELECT string_agg(p.content, ' ') FROM flicket_post p WHERE p.ticket_id = t.id), '')),
+                      'B')
+           FROM flicket_topic t""",
+    ],
+    'mysql': [
+        "CREATE TABLE flicket_search (ticket_id INTEGER PRIMARY KEY, document MEDIUMTEXT, "
+        "FULLTEXT INDEX ix_flicket_search_document (document)) ENGINE=InnoDB",
+        "SET SESSION group_concat_max_len = 16777216",
+        """INSERT INTO flicket_search (ticket_id, document)
+           SELECT t.id, CONCAT_WS('\\n', t.title, t.content,
+                  (SELECT GROUP_CONCAT(p.content SEPARATOR '\\n') FROM flicket_post p WHERE p.ticket_id = t.id))
+           FROM flicket_topic t""",
+    ],
+}
+
+
+def upgrade():
+    # other databases keep searching with LIKE.
+    for statement in create.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name in create:
+        op.execute("DROP TABLE flicket_search")
@@ -0,0 +1,47 @@
+"""email outbox
+
+Revision ID: b6d8f0a2c4e7
+Revises: a4c6e8f0b2d5
+Create Date: 2026-10-18 22:06:51.730415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d8f0a2c4e7'
+down_revision = 'a4c6e8f0b2d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('flicket_email_outbox',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('recipient', sa.String(length=255), nullable=True),
+                    sa.Column('sender', sa.String(length=255), nullable=True),
+                    sa.Column('subject', sa.Text(), nullable=True),
+                    sa.Column('html_body', sa.Text(), nullable=True),
+                    sa.Column('dedup_key', sa.String(length=40), nullable=True),
+                    sa.Column('status', sa.String(length=10), server_default='pending', nullable=True),
+                    sa.Column('attempts', sa.Integer(), server_default='0', nullable=True),
+                    sa.Column('next_attempt', sa.DateTime(), nullable=True),
+                    sa.Column('claim', sa.String(length=32), nullable=True),
+                    sa.Column('last_error', sa.Text(), nullable=True),
+                    sa.Column('date_added', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    with op.batch_alter_table('flicket_email_outbox', schema=None) as batch_op:
+        batch_op.create_index('ix_flicket_email_outbox_due', ['status', 'next_attempt'], unique=False)
+        batch_op.create_index('ix_flicket_email_outbox_dedup', ['dedup_key'], unique=False)
+        batch_op.create_index('ix_flicket_email_outbox_claim', ['claim'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_email_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_flicket_email_outbox_claim')
+        batch_op.drop_index('ix_flicket_email_outbox_dedup')
+        batch_op.drop_index('ix_flicket_email_outbox_due')
+
+    op.drop_table('flicket_email_outbox')
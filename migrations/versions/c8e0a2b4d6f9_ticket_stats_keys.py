@@ -0,0 +1,47 @@
+"""ticket statistics keys are not null
+
+Revision ID: c8e0a2b4d6f9
+Revises: b6d8f0a2c4e7
+Create Date: 2026-10-18 23:41:12.508316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e0a2b4d6f9'
+down_revision = 'b6d8f0a2c4e7'
+branch_labels = None
+depends_on = None
+
+key_columns = ('department_id', 'category_id', 'status_id', 'priority_id')
+
+
+def upgrade():
+    # a missing key part is stored as 0, so the unique key index also refuses duplicates of rows that had a NULL.
+    # The rows are counted again rather than merged, see application/flicket/scripts/ticket_stats.py
+    op.execute('DELETE FROM flicket_ticket_stats')
+    with op.batch_alter_table('flicket_ticket_stats', schema=None) as batch_op:
+        for name in key_columns:
+            batch_op.alter_column(name, existing_type=sa.Integer(), nullable=False, server_default='0')
+
+    op.execute("""
+        INSERT INTO flicket_ticket_stats (department_id, category_id, status_id, priority_id, tickets, hours)
+        SELECT COALESCE(c.department_id, 0), COALESCE(t.category_id, 0), COALESCE(t.status_id, 0),
+               COALESCE(t.ticket_priority_id, 0), COUNT(t.id),
+               COALESCE(SUM(COALESCE(t.hours, 0) + COALESCE(t.posts_hours, 0)), 0)
+        FROM flicket_topic t
+        LEFT OUTER JOIN flicket_category c ON t.category_id = c.id
+        GROUP BY COALESCE(c.department_id, 0), COALESCE(t.category_id, 0), COALESCE(t.status_id, 0),
+                 COALESCE(t.ticket_priority_id, 0)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_ticket_stats', schema=None) as batch_op:
+        for name in key_columns:
+            batch_op.alter_column(name, existing_type=sa.Integer(), nullable=True, server_default=None)
+
+    for name in key_columns:
+        op.execute(f'UPDATE flicket_ticket_stats SET {name} = NULL WHERE {name} = 0')
@@ -0,0 +1,26 @@
+"""ticket version
+
+Revision ID: d0f2b4c6e8a1
+Revises: c8e0a2b4d6f9
+Create Date: 2026-10-19 00:12:44.190372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd0f2b4c6e8a1'
+down_revision = 'c8e0a2b4d6f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('flicket_topic', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_topic', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,48 @@
+"""ticket statistics rollup for the dashboard
+
+Revision ID: d5a7c9e1f3b6
+Revises: b3f6d8e0a2c4
+Create Date: 2026-10-18 15:20:37.614829
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a7c9e1f3b6'
+down_revision = 'b3f6d8e0a2c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('flicket_ticket_stats',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('department_id', sa.Integer(), nullable=True),
+                    sa.Column('category_id', sa.Integer(), nullable=True),
+                    sa.Column('status_id', sa.Integer(), nullable=True),
+                    sa.Column('priority_id', sa.Integer(), nullable=True),
+                    sa.Column('tickets', sa.Integer(), server_default='0', nullable=True),
+                    sa.Column('hours', sa.Numeric(precision=10, scale=2), server_default='0', nullable=True),
+                    sa.PrimaryKeyConstraint('id'))
+    with op.batch_alter_table('flicket_ticket_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_flicket_ticket_stats_key', ['department_id', 'category_id', 'status_id',
+                                                              'priority_id'], unique=True)
+
+    # backfill from the existing tickets, see application/flicket/scripts/ticket_stats.py
+    op.execute("""
+        INSERT INTO flicket_ticket_stats (department_id, category_id, status_id, priority_id, tickets, hours)
+        SELECT c.department_id, t.category_id, t.status_id, t.ticket_priority_id, COUNT(t.id),
+               COALESCE(SUM(COALESCE(t.hours, 0) + COALESCE(t.posts_hours, 0)), 0)
+        FROM flicket_topic t
+        LEFT OUTER JOIN flicket_category c ON t.category_id = c.id
+        GROUP BY c.department_id, t.category_id, t.status_id, t.ticket_priority_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_ticket_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_flicket_ticket_stats_key')
+
+    op.drop_table('flicket_ticket_stats')
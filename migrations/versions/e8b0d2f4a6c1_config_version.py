@@ -0,0 +1,26 @@
+"""version stamp on flicket_config for the in-process settings cache
+
+Revision ID: e8b0d2f4a6c1
+Revises: d5a7c9e1f3b6
+Create Date: 2026-10-18 16:02:51.377460
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b0d2f4a6c1'
+down_revision = 'd5a7c9e1f3b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('flicket_config', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_config', schema=None) as batch_op:
+        batch_op.drop_column('version')
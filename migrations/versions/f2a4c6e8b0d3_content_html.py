@@ -0,0 +1,33 @@
+"""rendered markdown of ticket and post content
+
+Revision ID: f2a4c6e8b0d3
+Revises: e8b0d2f4a6c1
+Create Date: 2026-10-18 19:12:40.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a4c6e8b0d3'
+down_revision = 'e8b0d2f4a6c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows are rendered on demand, or all at once by "flask render-content-html".
+    with op.batch_alter_table('flicket_topic', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('flicket_post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('flicket_post', schema=None) as batch_op:
+        batch_op.drop_column('content_html')
+
+    with op.batch_alter_table('flicket_topic', schema=None) as batch_op:
+        batch_op.drop_column('content_html')
@@ -0,0 +1,77 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the application start up.
+
+Starts a fresh python process for each case and times importing the application and calling create_app, as a worker
+or a cli command does on start:
+
+* all blueprints: the web pages and the api, what every process loaded before create_app existed.
+* api only: create_app(blueprints=['api', 'errors']).
+* cli: create_app(blueprints=[]), models and commands only.
+* import only: the application package without create_app.
+
+    python scripts/benchmark_startup.py --runs 5
+
+Run from the flicket directory. The database is not touched: its settings are only read when the first app context
+is pushed.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+cases = [
+    ('all blueprints', 'create_app()'),
+    ('api only', "create_app(blueprints=['api', 'errors'])"),
+    ('cli', 'create_app(blueprints=[])'),
+    ('import only', None),
+]
+
+child = """
+import sys, time
+start = time.perf_counter()
+from application import create_app
+{call}
+print(time.perf_counter() - start, len(sys.modules))
+"""
+
+
+def measure(call, runs):
+    """
+    :param call: create_app call, or None to only import the package.
+    :param int runs:
+    :return: (median seconds, modules loaded)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    modules = 0
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', child.format(call=call or '')], cwd=root, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+        times.append(float(output[-2]))
+        modules = int(output[-1])
+
+    return statistics.median(times), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = None
+    print('{:<16} {:>10} {:>9} {:>10}'.format('case', 'start ms', 'modules', 'vs all'))
+    for name, call in cases:
+        seconds, modules = measure(call, args.runs)
+        if baseline is None:
+            baseline = seconds
+        print('{:<16} {:>10.1f} {:>9} {:>9.0f}%'.format(name, seconds * 1000, modules,
+                                                         (seconds - baseline) / baseline * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the ticket list pagination.
+
+Seeds a throw away SQLite database with the flicket tables used by the ticket list views and times the old
+approach (fetch every matching row, build an object for each, slice one page out in python) against the
+current one (COUNT(*) plus LIMIT / OFFSET).
+
+    python scripts/benchmark_ticket_pagination.py --tickets 100000 --posts 3 --per-page 50
+
+Nothing in the application database is touched.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+schema = """
+CREATE TABLE flicket_users (id INTEGER PRIMARY KEY, name VARCHAR(60));
+CREATE TABLE flicket_department (id INTEGER PRIMARY KEY, department VARCHAR(30));
+CREATE TABLE flicket_category (id INTEGER PRIMARY KEY, category VARCHAR(30), department_id INTEGER);
+CREATE TABLE flicket_priorities (id INTEGER PRIMARY KEY, priority VARCHAR(12));
+CREATE TABLE flicket_status (id INTEGER PRIMARY KEY, status VARCHAR(20));
+CREATE TABLE flicket_topic (id INTEGER PRIMARY KEY, title VARCHAR(128), content VARCHAR(5000),
+                            started_id INTEGER, date_added DATETIME, status_id INTEGER, category_id INTEGER,
+                            assigned_id INTEGER, ticket_priority_id INTEGER, hours NUMERIC(10, 2));
+CREATE TABLE flicket_post (id INTEGER PRIMARY KEY, ticket_id INTEGER, content VARCHAR(5000));
+CREATE INDEX ix_flicket_post_ticket_id ON flicket_post (ticket_id);
+"""
+
+select_sql = """
+    SELECT t.id, t.title, t.content, t.date_added,
+           u.name as user_name, d.department as dept_name, c.category as cat_name,
+           p.priority as priority_name, s.status as status_name,
+           au.name as assigned_name,
+           (SELECT COUNT(*) FROM flicket_post WHERE ticket_id = t.id) as num_replies,
+           t.hours
+"""
+
+from_sql = """
+    FROM flicket_topic t
+    LEFT JOIN flicket_users u ON t.started_id = u.id
+    LEFT JOIN flicket_category c ON t.category_id = c.id
+    LEFT JOIN flicket_department d ON c.department_id = d.id
+    LEFT JOIN flicket_priorities p ON t.ticket_priority_id = p.id
+    LEFT JOIN flicket_status s ON t.status_id = s.id
+    LEFT JOIN flicket_users au ON t.assigned_id = au.id
+"""
+
+where_sql = " WHERE 1=1"
+order_sql = " ORDER BY p.id DESC, t.id DESC"
+
+
+def seed(connection, tickets, posts):
+    connection.executescript(schema)
+    connection.executemany('INSERT INTO flicket_users (id, name) VALUES (?, ?)',
+                           [(i, f'user {i}') for i in range(1, 51)])
+    connection.executemany('INSERT INTO flicket_department (id, department) VALUES (?, ?)',
+                           [(i, f'department {i}') for i in range(1, 7)])
+    connection.executemany('INSERT INTO flicket_category (id, category, department_id) VALUES (?, ?, ?)',
+                           [(i, f'category {i}', (i % 6) + 1) for i in range(1, 25)])
+    connection.executemany('INSERT INTO flicket_priorities (id, priority) VALUES (?, ?)',
+                           [(1, 'low'), (2, 'medium'), (3, 'high'), (4, 'urgent')])
+    connection.executemany('INSERT INTO flicket_status (id, status) VALUES (?, ?)',
+                           [(1, 'Open'), (2, 'Closed'), (3, 'In Work'), (4, 'Awaiting Information')])
+
+    start = datetime.datetime(2020, 1, 1)
+    connection.executemany(
+        'INSERT INTO flicket_topic (id, title, content, started_id, date_added, status_id, category_id, '
+        'assigned_id, ticket_priority_id, hours) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((i, f'ticket {i}', 'lorem ipsum ' * 20, random.randint(1, 50),
+          (start + datetime.timedelta(minutes=i)).isoformat(' '), random.randint(1, 4), random.randint(1, 24),
+          random.randint(1, 50), random.randint(1, 4), 0) for i in range(1, tickets + 1)))
+    connection.executemany('INSERT INTO flicket_post (ticket_id, content) VALUES (?, ?)',
+                           ((i, 'reply') for i in range(1, tickets + 1) for _ in range(posts)))
+    connection.commit()
+
+
+def to_ticket(row):
+    """ Does the same per row work as MockTicket: builds a dict and formats the dates. """
+    data = dict(row)
+    dt = datetime.datetime.fromisoformat(data['date_added'])
+    data['date_added'] = dt.strftime('%Y-%m-%d %I:%M %p') + ' EST'
+    data['last_updated'] = dt.strftime('%Y-%m-%d')
+    data['id_zfill'] = str(data['id']).zfill(5)
+    return data
+
+
+def old_page(connection, page, per_page):
+    rows = connection.execute(f'{select_sql} {from_sql} {where_sql} {order_sql}')
+    all_tickets = [to_ticket(row) for row in rows]
+    start_idx = (page - 1) * per_page
+    return all_tickets[start_idx:start_idx + per_page], len(all_tickets)
+
+
+def new_page(connection, page, per_page):
+    total = connection.execute(f'SELECT COUNT(*) {from_sql} {where_sql}').fetchone()[0]
+    rows = connection.execute(f'{select_sql} {from_sql} {where_sql} {order_sql} LIMIT :limit OFFSET :offset',
+                              {'limit': per_page, 'offset': (page - 1) * per_page})
+    return [to_ticket(row) for row in rows], total
+
+
+def timed(func, connection, page, per_page, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(connection, page, per_page)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ticket list pagination.')
+    parser.add_argument('--tickets', type=int, default=100000)
+    parser.add_argument('--posts', type=int, default=3, help='replies per ticket')
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection = sqlite3.connect(os.path.join(tmp, 'benchmark.db'))
+        connection.row_factory = sqlite3.Row
+        print(f'Seeding {args.tickets} tickets with {args.posts} replies each ...')
+        seed(connection, args.tickets, args.posts)
+
+        last_page = max((args.tickets + args.per_page - 1) // args.per_page, 1)
+        print(f'{"page":>8} {"old (s)":>10} {"new (s)":>10} {"speed up":>9}')
+        for page in (1, max(last_page // 2, 1), last_page):
+            old_time, (old_items, old_total) = timed(old_page, connection, page, args.per_page, args.repeat)
+            new_time, (new_items, new_total) = timed(new_page, connection, page, args.per_page, args.repeat)
+            assert old_total == new_total and old_items == new_items, 'old and new pages differ'
+            print(f'{page:>8} {old_time:>10.4f} {new_time:>10.4f} {old_time / new_time:>8.1f}x')
+
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
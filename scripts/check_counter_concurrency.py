@@ -0,0 +1,126 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that the user and ticket counters do not lose updates made at the same time.
+
+Starts --workers threads, each with its own database session, that add --increments posts to a user's total_posts
+and a ticket's reply_count, one transaction per increment, the way a reply does (FlicketUser.update_totals and
+FlicketTicket.update_post_totals). Exits with 1 if either counter has not gone up by workers * increments.
+
+With --naive the same is done with the read-modify-write the views used before (user.total_posts += 1) for
+comparison; lost increments are reported but do not fail the check.
+
+    python scripts/check_counter_concurrency.py --workers 8 --increments 25
+
+Run from the flicket directory against a copy of the database. The counters are put back afterwards.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyPep8
+from application import create_app, db
+# noinspection PyPep8
+from application.flicket.models.flicket_models import FlicketTicket
+# noinspection PyPep8
+from application.flicket.models.flicket_user import FlicketUser
+# noinspection PyPep8
+from application.flicket.scripts.unit_of_work import unit_of_work
+
+
+def atomic_increment(user_id, ticket_id):
+    with unit_of_work():
+        FlicketUser.update_totals(user_id, posts=1)
+        FlicketTicket.query.get(ticket_id).update_post_totals(replies=1)
+
+
+def naive_increment(user_id, ticket_id):
+    with unit_of_work():
+        user = FlicketUser.query.get(user_id)
+        ticket = FlicketTicket.query.get(ticket_id)
+        total_posts, reply_count = user.total_posts or 0, ticket.reply_count or 0
+        # another request's change lands between the read and the write.
+        time.sleep(0.001)
+        user.total_posts = total_posts + 1
+        ticket.reply_count = reply_count + 1
+
+
+def counts(user_id, ticket_id):
+    db.session.expire_all()
+    return FlicketUser.query.get(user_id).total_posts or 0, FlicketTicket.query.get(ticket_id).reply_count or 0
+
+
+def run(app, increment, user_id, ticket_id, workers, increments):
+    """
+    :return: (total_posts added, reply_count added, errors)
+    """
+    errors = []
+
+    def work():
+        with app.app_context():
+            for _ in range(increments):
+                try:
+                    increment(user_id, ticket_id)
+                except Exception as e:
+                    errors.append(e)
+
+    with app.app_context():
+        posts_before, replies_before = counts(user_id, ticket_id)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        posts_after, replies_after = counts(user_id, ticket_id)
+        # put the counters back.
+        with unit_of_work():
+            FlicketUser.update_totals(user_id, posts=posts_before - posts_after)
+            FlicketTicket.query.get(ticket_id).update_post_totals(replies=replies_before - replies_after)
+
+    return posts_after - posts_before, replies_after - replies_before, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--increments', type=int, default=25, help='increments made by each worker.')
+    parser.add_argument('--naive', action='store_true', help='also run the read-modify-write version.')
+    args = parser.parse_args()
+
+    app = create_app(blueprints=[])
+    with app.app_context():
+        user_id = db.session.query(FlicketUser.id).order_by(FlicketUser.id).limit(1).scalar()
+        ticket_id = db.session.query(FlicketTicket.id).order_by(FlicketTicket.id).limit(1).scalar()
+    if user_id is None or ticket_id is None:
+        print('The database needs a user and a ticket.')
+        sys.exit(2)
+
+    expected = args.workers * args.increments
+    cases = [('sql update', atomic_increment)]
+    if args.naive:
+        cases.append(('read-modify-write', naive_increment))
+
+    failed = False
+    for name, increment in cases:
+        posts, replies, errors = run(app, increment, user_id, ticket_id, args.workers, args.increments)
+        ok = posts == expected and replies == expected and not errors
+        checked = increment is atomic_increment
+        failed = failed or (checked and not ok)
+        print('{} {}: total_posts +{}, reply_count +{} of {}{}'.format(
+            'ok  ' if ok else 'FAIL' if checked else 'lost', name, posts, replies, expected,
+            ', {} errors, first: {!r}'.format(len(errors), errors[0]) if errors else ''))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
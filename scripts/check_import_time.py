@@ -0,0 +1,100 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks the cost of starting the application.
+
+For each case a fresh python process imports the application and calls create_app under "python -X importtime".
+The check fails, exiting with 1, if
+
+* the import time (the smallest of --runs processes) is over --max-ms, or
+* a module that should only be loaded on demand was imported: plotly, alembic (only needed by "flask db"), the
+  markdown package (loaded by the template filter when a page is rendered), or the views of a blueprint the case
+  did not ask for.
+
+    python scripts/check_import_time.py --max-ms 1000
+
+Run from the flicket directory. The database is not touched.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+lazy_modules = ['plotly', 'alembic', 'flask_migrate', 'markdown', 'flaskext.markdown']
+
+# name, create_app call, modules that must not be imported besides lazy_modules.
+cases = [
+    ('all blueprints', 'create_app()', []),
+    ('api only', "create_app(blueprints=['api', 'errors'])",
+     ['application.flicket.views.index', 'application.flicket_admin.views.view_admin', 'flask_pagedown']),
+    ('cli', 'create_app(blueprints=[])',
+     ['application.flicket.views.index', 'application.flicket_admin.views.view_admin', 'flask_pagedown',
+      'application.flicket_api.views.tickets']),
+]
+
+child = """
+import sys
+from application import create_app
+{call}
+print(' '.join(name for name in {modules!r} if name in sys.modules))
+"""
+
+
+def import_time(stderr):
+    """
+    :param str stderr: -X importtime output.
+    :return: seconds spent importing, the sum of the top level imports' cumulative times.
+    """
+    total = 0
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3:
+            continue
+        cumulative, name = parts[1].strip(), parts[2]
+        # nested imports are indented by two more spaces per level.
+        if cumulative.isdigit() and not name.startswith('  '):
+            total += int(cumulative)
+
+    return total / 1000000
+
+
+def measure(call, modules, runs):
+    """
+    :return: (smallest import time in seconds, list of the modules imported)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    times = []
+    imported = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', child.format(call=call, modules=modules)],
+                                cwd=root, env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        times.append(import_time(result.stderr))
+        imported = result.stdout.split()
+
+    return min(times), imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-ms', type=float, default=1000, help='import time allowed for each case.')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    failed = False
+    for name, call, modules in cases:
+        seconds, imported = measure(call, lazy_modules + modules, args.runs)
+        ok = seconds * 1000 <= args.max_ms and not imported
+        failed = failed or not ok
+        print('{} {}: {:.0f} ms (max {:.0f}){}'.format('ok  ' if ok else 'FAIL', name, seconds * 1000, args.max_ms,
+                                                       ', imported ' + ', '.join(imported) if imported else ''))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#! usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks the hot pages against their query budgets (see application/flicket/scripts/query_stats.py).
+
+Logs in with the given user and requests each page with QUERY_BUDGET_STRICT set, printing the number of statements
+made and the repeated statement shapes. Exits with 1 if a page goes over its budget, or if the ticket page makes more
+statements for the ticket with the most replies than for the one with the fewest (the replies are lazy loaded).
+
+    python scripts/check_query_budgets.py --username admin --password <password>
+
+Run from the flicket directory against a copy of the database: pages are only read but logging in updates the
+user's token.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyPep8
+from application import create_app, db
+# noinspection PyPep8
+from application.flicket.models.flicket_models import FlicketTicket
+# noinspection PyPep8
+from application.flicket.scripts.query_stats import QueryBudgetExceeded, query_budgets, recent_requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--ticket-id', type=int, help='ticket to view, by default the one with the most replies.')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, QUERY_BUDGET_STRICT=True)
+    client = app.test_client()
+    response = client.post('/login', data={'username': args.username, 'password': args.password})
+    if response.status_code not in (302, 303):
+        print('Could not log in as {}.'.format(args.username))
+        sys.exit(2)
+
+    with app.app_context():
+        busiest = args.ticket_id or db.session.query(FlicketTicket.id). \
+            order_by(FlicketTicket.reply_count.desc(), FlicketTicket.id).limit(1).scalar()
+        quietest = db.session.query(FlicketTicket.id).filter(FlicketTicket.reply_count > 0). \
+            order_by(FlicketTicket.reply_count.asc(), FlicketTicket.id).limit(1).scalar()
+
+    busiest_page = '/ticket_view/{}/'.format(busiest)
+    quietest_page = '/ticket_view/{}/'.format(quietest)
+    pages = ['/', '/tickets/', '/my_tickets/', '/subscribed/', busiest_page, quietest_page,
+             app.config['ADMINHOME'] + 'tickets/']
+
+    failed = False
+    counts = {}
+    for page in pages:
+        try:
+            client.get(page, follow_redirects=True)
+        except QueryBudgetExceeded as e:
+            failed = True
+            print('FAIL {}: {}'.format(page, e))
+            continue
+        summary = recent_requests[-1]
+        counts[page] = summary['count']
+        print('ok   {}: {} statements, budget {}{}'.format(
+            page, summary['count'], query_budgets.get(summary['endpoint'], '-'),
+            ', {} repeated'.format(len(summary['repeated'])) if summary['repeated'] else ''))
+
+    if counts.get(busiest_page, 0) > counts.get(quietest_page, 0) and busiest != quietest:
+        failed = True
+        print('FAIL {} made {} statements, {} with fewer replies {}.'.format(
+            busiest_page, counts[busiest_page], quietest_page, counts[quietest_page]))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,10 +10,12 @@ import os
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from application import app, db
+from application import create_app, db
 from application.flicket_admin.models.flicket_config import FlicketConfig
 from flask_mail import Mail, Message
 
+app = create_app(blueprints=[])
+
 def test_email_config():
     """Test the current email configuration"""
     
@@ -10,9 +10,11 @@ import os
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from application import app, db
+from application import create_app, db
 from application.flicket_admin.models.flicket_config import FlicketConfig
 
+app = create_app(blueprints=[])
+
 def update_email_config():
     """Update the email configuration in the database"""
     